@@ -1,9 +1,23 @@
 """Complex AI analysis (risk, extraction, obligations, deviation) with tool use."""
+import asyncio
 import json
 import re
 import time
+
+import structlog
+
 from app.config import settings
+from app.ai.budget import BudgetExhausted, RequestBudget, cost_usd, current_budget, time_left
+from app.ai.config import ModelRoute, standard_route
+from app.ai.scheduler import create_message, estimate_tokens, scheduler
+from app.ai.prompt_cache import cache_tokens, cached_system, cached_text, cached_tools, move_message_breakpoint
 from app.ai.schemas import AnalysisUsage
+from app.metrics import agent_tool_rounds, mcp_tool_duration
+
+# Bump when the prompt changes so cached results are not reused.
+PROMPT_VERSION = "1"
+
+logger = structlog.get_logger()
 
 
 def _find_tool_handler(tools: list[dict], name: str):
@@ -14,16 +28,57 @@ def _find_tool_handler(tools: list[dict], name: str):
     return None
 
 
-def _run_tool(tools: list[dict], name: str, tool_input: dict) -> str:
-    """Execute a tool by name with the given input. Returns string content for tool_result."""
+async def _run_tool(tools: list[dict], name: str, tool_input: dict) -> str:
+    """
+    Execute a tool by name with the given input. Returns string content for tool_result.
+    Handlers are async DB queries and run under a per-tool timeout.
+    """
     handler = _find_tool_handler(tools, name)
     if not handler:
         return json.dumps({"error": f"Unknown tool: {name}"})
+    start = time.perf_counter()
+    status = "ok"
+    timeout = time_left(settings.ai_tool_timeout)
     try:
-        result = handler(**tool_input) if tool_input else handler()
-        return json.dumps(result) if not isinstance(result, str) else result
+        if timeout <= 0:
+            status = "timeout"
+            return json.dumps({"error": f"Tool {name} skipped: the request deadline has been reached"})
+        result = await asyncio.wait_for(handler(**tool_input), timeout=timeout)
+        return json.dumps(result, default=str) if not isinstance(result, str) else result
+    except asyncio.TimeoutError:
+        status = "timeout"
+        return json.dumps({"error": f"Tool {name} timed out after {timeout:.0f}s"})
     except Exception as e:
+        status = "error"
         return json.dumps({"error": str(e)})
+    finally:
+        elapsed = time.perf_counter() - start
+        mcp_tool_duration.labels(tool=name, outcome=status).observe(elapsed)
+        logger.info(
+            "mcp_tool_completed",
+            tool=name,
+            status=status,
+            elapsed_ms=int(elapsed * 1000),
+        )
+
+
+async def _run_tool_calls(tools: list[dict], tool_use_blocks: list) -> list[dict]:
+    """Run every tool_use block of one turn concurrently; results keep the blocks' order."""
+    calls = []
+    for block in tool_use_blocks:
+        tool_input = getattr(block, "input", None) or {}
+        if isinstance(tool_input, str):
+            try:
+                tool_input = json.loads(tool_input)
+            except json.JSONDecodeError:
+                tool_input = {}
+        calls.append((getattr(block, "name", None) or "", getattr(block, "id", ""), tool_input))
+
+    contents = await asyncio.gather(*(_run_tool(tools, name, tool_input) for name, _, tool_input in calls))
+    return [
+        {"type": "tool_result", "tool_use_id": tool_id, "content": content}
+        for (_, tool_id, _), content in zip(calls, contents)
+    ]
 
 
 async def analyze_complex(
@@ -31,39 +86,72 @@ async def analyze_complex(
     contract_text: str,
     contract_id: str,
     tools: list[dict],
+    route: ModelRoute | None = None,
 ) -> tuple[dict, AnalysisUsage]:
     """Run complex analysis with tool-use loop. When Claude returns tool_use blocks,
     execute the matching MCP tool handler and send results back until Claude responds with text.
     """
-    import anthropic
+    route = route or standard_route(analysis_type)
     start = time.perf_counter()
-    client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key)
     system = (
         f"You are a contract analyst. Perform {analysis_type} analysis on the following contract. "
         "You may use the provided tools to query organizational structure, signing authority, "
         "wiki templates, or counterparty details. Return a structured JSON result appropriate for the analysis type."
     )
-    tool_defs = [t["definition"] for t in tools]
-    messages: list[dict] = [{"role": "user", "content": contract_text[:80000]}]
+    # Breakpoints on tools, system and the contract message cache the whole prefix that
+    # every round resends; a rolling breakpoint on the latest tool results caches the
+    # conversation so far for the next round.
+    tool_defs = cached_tools([t["definition"] for t in tools])
+    messages: list[dict] = [{"role": "user", "content": [cached_text(contract_text[:80000])]}]
 
     total_input_tokens = 0
     total_output_tokens = 0
+    total_cache_creation = 0
+    total_cache_read = 0
     max_rounds = 10
     round_count = 0
+    model = route.model
+
+    def finish(result_dict: dict) -> tuple[dict, AnalysisUsage]:
+        usage = AnalysisUsage(
+            input_tokens=total_input_tokens,
+            output_tokens=total_output_tokens,
+            cache_creation_input_tokens=total_cache_creation,
+            cache_read_input_tokens=total_cache_read,
+            cost_usd=cost_usd(model, total_input_tokens, total_output_tokens, total_cache_creation, total_cache_read),
+            processing_time_ms=int((time.perf_counter() - start) * 1000),
+            model_used=model,
+            route=route.name,
+        )
+        agent_tool_rounds.labels(analysis_type=analysis_type).observe(round_count)
+        return result_dict, usage
 
+    budget = current_budget()
     while round_count < max_rounds:
         round_count += 1
-        message = await client.messages.create(
-            model=settings.ai_agent_model,
-            max_tokens=4096,
-            system=system,
-            messages=messages,
-            tools=tool_defs if tool_defs else None,
-        )
+        request = {
+            "model": model,
+            "max_tokens": route.max_tokens,
+            "system": cached_system(system),
+            "messages": move_message_breakpoint(messages, fixed=1),
+        }
+        if tool_defs:
+            request["tools"] = tool_defs
+            # Last round, or the budget cannot cover a tool round plus the answer after
+            # it: ask for the answer now rather than be cut off with nothing.
+            if round_count == max_rounds or (budget is not None and not _fits_two_rounds(budget, request)):
+                request["tool_choice"] = {"type": "none"}
+        try:
+            message = await create_message(**request)
+        except BudgetExhausted as e:
+            return finish({"summary": "", "confidence": 0.0, "partial": True, "error": str(e)})
 
         if message.usage:
             total_input_tokens += message.usage.input_tokens
             total_output_tokens += message.usage.output_tokens
+            creation, read = cache_tokens(message.usage)
+            total_cache_creation += creation
+            total_cache_read += read
 
         tool_use_blocks = []
         text_block = None
@@ -74,7 +162,6 @@ async def analyze_complex(
                 text_block = block
 
         if text_block is not None and not tool_use_blocks:
-            elapsed_ms = int((time.perf_counter() - start) * 1000)
             result_dict = {"summary": "", "confidence": 0.8}
             # Strip markdown code fences — Claude may wrap JSON in ```json blocks
             cleaned = text_block.text.strip()
@@ -85,52 +172,22 @@ async def analyze_complex(
                 result_dict = json.loads(cleaned)
             except json.JSONDecodeError:
                 result_dict = {"raw": text_block.text}
-            usage = AnalysisUsage(
-                input_tokens=total_input_tokens,
-                output_tokens=total_output_tokens,
-                cost_usd=0.0,
-                processing_time_ms=elapsed_ms,
-                model_used=settings.ai_agent_model,
-            )
-            return result_dict, usage
+            return finish(result_dict)
 
         if not tool_use_blocks:
-            elapsed_ms = int((time.perf_counter() - start) * 1000)
-            usage = AnalysisUsage(
-                input_tokens=total_input_tokens,
-                output_tokens=total_output_tokens,
-                cost_usd=0.0,
-                processing_time_ms=elapsed_ms,
-                model_used=settings.ai_agent_model,
-            )
-            return {"summary": "", "confidence": 0.8}, usage
-
-        tool_results = []
-        for block in tool_use_blocks:
-            tool_name = getattr(block, "name", None) or ""
-            tool_id = getattr(block, "id", "")
-            tool_input = getattr(block, "input", None) or {}
-            if isinstance(tool_input, str):
-                try:
-                    tool_input = json.loads(tool_input)
-                except json.JSONDecodeError:
-                    tool_input = {}
-            content = _run_tool(tools, tool_name, tool_input)
-            tool_results.append({
-                "type": "tool_result",
-                "tool_use_id": tool_id,
-                "content": content,
-            })
+            return finish({"summary": "", "confidence": 0.8})
+
+        tool_results = await _run_tool_calls(tools, tool_use_blocks)
 
         messages.append({"role": "assistant", "content": message.content})
         messages.append({"role": "user", "content": tool_results})
 
-    elapsed_ms = int((time.perf_counter() - start) * 1000)
-    usage = AnalysisUsage(
-        input_tokens=total_input_tokens,
-        output_tokens=total_output_tokens,
-        cost_usd=0.0,
-        processing_time_ms=elapsed_ms,
-        model_used=settings.ai_agent_model,
-    )
-    return {"summary": "", "confidence": 0.8, "error": "Max tool-use rounds reached"}, usage
+    return finish({"summary": "", "confidence": 0.8, "error": "Max tool-use rounds reached"})
+
+
+def _fits_two_rounds(budget: RequestBudget, request: dict) -> bool:
+    """Whether the budget covers this round and one more of the same size (worst case)."""
+    model = request["model"]
+    max_tokens = request["max_tokens"]
+    input_tokens = estimate_tokens(request) - max_tokens
+    return budget.fits(model, 2 * input_tokens, 2 * max_tokens, 2 * scheduler.expected_seconds(model))
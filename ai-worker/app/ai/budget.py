@@ -0,0 +1,168 @@
+"""
+Per-request deadline and spend budget, and the Claude price table.
+
+Each request runs under a RequestBudget (see app.middleware.budget): a deadline,
+a cost cap in USD and a token cap. Text extraction, every Claude call (in the
+scheduler) and every MCP tool call check what is left before they start, and are
+bounded by the remaining time while they run. Work that cannot fit raises
+BudgetExhausted; the analysis paths stop cooperatively and return what they have.
+"""
+
+import contextvars
+import time
+
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+# USD per million tokens (input, output), matched by longest model-name prefix.
+# Cache writes cost 1.25x the input price, cache reads 0.1x.
+PRICES: dict[str, tuple[float, float]] = {
+    "claude-opus-4-6": (5.0, 25.0),
+    "claude-opus-4-5": (5.0, 25.0),
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-haiku-4-5": (1.0, 5.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-haiku": (0.25, 1.25),
+}
+_DEFAULT_PRICE = PRICES["claude-sonnet-4"]
+_unpriced: set[str] = set()
+
+
+def model_prices(model: str) -> tuple[float, float]:
+    matches = [prefix for prefix in PRICES if model.startswith(prefix)]
+    if not matches:
+        if model not in _unpriced:
+            _unpriced.add(model)
+            logger.warning("model_price_unknown", model=model, assumed=_DEFAULT_PRICE)
+        return _DEFAULT_PRICE
+    return PRICES[max(matches, key=len)]
+
+
+def cost_usd(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_creation_tokens: int = 0,
+    cache_read_tokens: int = 0,
+) -> float:
+    input_price, output_price = model_prices(model)
+    return round((
+        input_tokens * input_price
+        + output_tokens * output_price
+        + cache_creation_tokens * input_price * 1.25
+        + cache_read_tokens * input_price * 0.1
+    ) / 1_000_000, 6)
+
+
+def usage_cost(model: str, usage) -> float:
+    """Cost of one API response's usage object."""
+    if usage is None:
+        return 0.0
+    return cost_usd(
+        model,
+        usage.input_tokens or 0,
+        usage.output_tokens or 0,
+        getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        getattr(usage, "cache_read_input_tokens", 0) or 0,
+    )
+
+
+class BudgetExhausted(Exception):
+    """Raised when the request's deadline, cost or token budget cannot fit the next step."""
+
+    def __init__(self, message: str, kind: str):
+        super().__init__(message)
+        self.kind = kind  # deadline | cost | tokens
+
+    @property
+    def status_code(self) -> int:
+        return 504 if self.kind == "deadline" else 422
+
+
+class RequestBudget:
+    def __init__(self, timeout: float, max_cost_usd: float, max_tokens: int):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.max_cost_usd = max_cost_usd
+        self.max_tokens = max_tokens
+        self.cost_usd = 0.0
+        self.tokens = 0
+        self.exhausted: str | None = None  # first reason work was cut short
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def _exhaust(self, message: str, kind: str) -> BudgetExhausted:
+        if self.exhausted is None:
+            self.exhausted = message
+            logger.warning("request_budget_exhausted", reason=message, kind=kind, **self.snapshot())
+        return BudgetExhausted(message, kind)
+
+    def check(self, what: str) -> None:
+        """Raise BudgetExhausted if the deadline has passed."""
+        if self.remaining() <= 0:
+            raise self._exhaust(f"Deadline reached before {what}", "deadline")
+
+    def require(self, what: str, model: str, input_tokens: int, output_tokens: int, seconds: float = 0.0) -> None:
+        """Raise BudgetExhausted unless a step of this size (worst case) fits what is left."""
+        if self.remaining() <= max(seconds, 0.0):
+            raise self._exhaust(f"Not enough time left for {what}", "deadline")
+        if self.tokens + input_tokens + output_tokens > self.max_tokens:
+            raise self._exhaust(f"Token budget of {self.max_tokens} would be exceeded by {what}", "tokens")
+        if self.cost_usd + cost_usd(model, input_tokens, output_tokens) > self.max_cost_usd:
+            raise self._exhaust(f"Cost budget of ${self.max_cost_usd:.2f} would be exceeded by {what}", "cost")
+
+    def fits(self, model: str, input_tokens: int, output_tokens: int, seconds: float = 0.0) -> bool:
+        return (
+            self.remaining() > seconds
+            and self.tokens + input_tokens + output_tokens <= self.max_tokens
+            and self.cost_usd + cost_usd(model, input_tokens, output_tokens) <= self.max_cost_usd
+        )
+
+    def timed_out(self, what: str) -> BudgetExhausted:
+        return self._exhaust(f"Deadline reached during {what}", "deadline")
+
+    def charge(self, model: str, usage) -> None:
+        if usage is None:
+            return
+        creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        self.tokens += (usage.input_tokens or 0) + (usage.output_tokens or 0) + creation + read
+        self.cost_usd += usage_cost(model, usage)
+
+    def snapshot(self) -> dict:
+        return {
+            "remaining_s": round(self.remaining(), 1),
+            "cost_usd": round(self.cost_usd, 6),
+            "tokens": self.tokens,
+        }
+
+
+_budget: contextvars.ContextVar[RequestBudget | None] = contextvars.ContextVar("request_budget", default=None)
+
+
+def current_budget() -> RequestBudget | None:
+    """The running request's budget; None outside a request (e.g. scripts), meaning unlimited."""
+    return _budget.get()
+
+
+def start_budget(timeout: float, max_cost_usd: float | None = None, max_tokens: int | None = None) -> RequestBudget:
+    budget = RequestBudget(
+        timeout,
+        settings.ai_max_budget_usd if max_cost_usd is None else max_cost_usd,
+        settings.ai_max_tokens_per_request if max_tokens is None else max_tokens,
+    )
+    _budget.set(budget)
+    return budget
+
+
+def time_left(default: float) -> float:
+    """min(default, time to the deadline): the timeout for a step that must end by the deadline."""
+    budget = _budget.get()
+    return default if budget is None else max(0.0, min(default, budget.remaining()))
@@ -0,0 +1,298 @@
+"""
+Map-reduce analysis for contracts longer than a single prompt.
+
+The text is split on clause headings (falling back to page breaks, paragraphs
+and lines) into overlapping chunks; every chunk is analysed concurrently under
+a cap and the per-chunk results are merged per analysis type, with findings
+repeated in the overlap (or across chunks) removed.
+"""
+
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import structlog
+
+from app.ai.budget import BudgetExhausted
+from app.ai.schemas import AnalysisUsage
+from app.clauses import CLAUSE_HEADING
+from app.config import settings
+from app.jobs import report_progress
+
+logger = structlog.get_logger()
+
+# Boundary preference, best first.
+_CLAUSE, _PAGE, _PARAGRAPH, _LINE = range(4)
+
+
+@dataclass
+class Chunk:
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+def _boundaries(text: str, page_offsets: list[int]) -> list[tuple[int, int]]:
+    """(position, priority) of every place a chunk may end / the next one may start."""
+    found: dict[int, int] = {}
+
+    def add(position: int, priority: int) -> None:
+        if 0 < position < len(text) and priority < found.get(position, _LINE + 1):
+            found[position] = priority
+
+    for m in CLAUSE_HEADING.finditer(text):
+        add(m.start(), _CLAUSE)
+    for offset in page_offsets:
+        add(offset, _PAGE)
+    for m in re.finditer(r"\n[ \t]*\n", text):
+        add(m.end(), _PARAGRAPH)
+    for m in re.finditer(r"\n", text):
+        add(m.end(), _LINE)
+    return sorted(found.items())
+
+
+def split_into_chunks(
+    text: str,
+    page_offsets: list[int] | None = None,
+    max_chars: int = 40_000,
+    overlap_chars: int = 2_000,
+) -> list[Chunk]:
+    """
+    Split text into chunks of at most max_chars. Each chunk ends at the best boundary
+    in its second half (clause heading > page break > paragraph > line), and the next
+    chunk starts about overlap_chars earlier, at a line or word start, so text spanning
+    the cut is seen whole by one of the two chunks.
+    """
+    if len(text) <= max_chars:
+        return [Chunk(0, 0, len(text), text)]
+    boundaries = _boundaries(text, page_offsets or [])
+    line_starts = [p for p, _ in boundaries]  # every boundary is at the start of a line
+
+    chunks: list[Chunk] = []
+    start = 0
+    while start < len(text):
+        limit = start + max_chars
+        if limit >= len(text):
+            end = len(text)
+        else:
+            window = [(p, pr) for p, pr in boundaries if start + max_chars // 2 < p <= limit]
+            if window:
+                best = min(pr for _, pr in window)
+                end = max(p for p, pr in window if pr == best)
+            else:
+                end = limit
+        chunks.append(Chunk(len(chunks), start, end, text[start:end]))
+        if end >= len(text):
+            break
+        # Back up by the overlap to a line start, or failing that a word start.
+        next_start = max(end - overlap_chars, start + 1)
+        later = [p for p in line_starts if next_start <= p <= end - overlap_chars // 2]
+        if later:
+            start = later[0]
+        else:
+            space = text.find(" ", next_start, end)
+            start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+# ── Merging ────────────────────────────────────────────────────────────────
+
+_SEVERITY = ["none", "low", "medium", "moderate", "high", "critical"]
+# Fields that identify a finding; two items match when these read (almost) the same.
+_KEY_FIELDS = (
+    "type", "category", "clause_reference", "clause", "title", "name", "legal_name",
+    "obligation", "description", "text", "summary", "finding", "issue",
+)
+
+
+def _normalise(value) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return re.sub(r"\W+", " ", value.lower()).strip()
+
+
+def _item_key(item) -> str:
+    if isinstance(item, dict):
+        parts = [_normalise(item[f]) for f in _KEY_FIELDS if item.get(f)]
+        if parts:
+            return " ".join(parts)
+    return _normalise(item)
+
+
+def _similar(a: str, b: str, threshold: float = 0.8) -> bool:
+    if a == b:
+        return True
+    ta, tb = set(a.split()), set(b.split())
+    if not ta or not tb:
+        return False
+    return len(ta & tb) / len(ta | tb) >= threshold
+
+
+def _merge_lists(lists: list[list]) -> list:
+    """Concatenate in chunk order, dropping items that repeat an earlier one."""
+    merged: list = []
+    keys: list[str] = []
+    for items in lists:
+        for item in items:
+            key = _item_key(item)
+            duplicate = next((i for i, k in enumerate(keys) if _similar(k, key)), None)
+            if duplicate is None:
+                merged.append(item)
+                keys.append(key)
+            elif isinstance(item, dict) and isinstance(merged[duplicate], dict):
+                merged[duplicate] = _merge_duplicate(merged[duplicate], item)
+    return merged
+
+
+def _merge_duplicate(first: dict, second: dict) -> dict:
+    """Keep the more confident copy of a repeated finding, filling fields it lacks from the other."""
+    if (second.get("confidence") or 0) > (first.get("confidence") or 0):
+        first, second = second, first
+    merged = dict(first)
+    for key, value in second.items():
+        if key not in merged or merged[key] in (None, "", [], {}):
+            merged[key] = value
+        elif isinstance(merged[key], dict) and isinstance(value, dict):
+            merged[key] = {**value, **{k: v for k, v in merged[key].items() if v not in (None, "")}}
+    return merged
+
+
+def _merge_values(key: str, values: list):
+    present = [v for v in values if v not in (None, "", [], {})]
+    if not present:
+        return next((v for v in values if v is not None), None)
+    values = present
+    if all(isinstance(v, list) for v in values):
+        return _merge_lists(values)
+    if all(isinstance(v, dict) for v in values):
+        return merge_dicts(values)
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        # Confidence is averaged; any other score (risk, counts) takes the most severe chunk.
+        return round(sum(values) / len(values), 3) if "confidence" in key else max(values)
+    if all(isinstance(v, str) for v in values):
+        if all(v.lower() in _SEVERITY for v in values):
+            return max(values, key=lambda v: _SEVERITY.index(v.lower()))
+        distinct = list(dict.fromkeys(values))
+        if len(distinct) == 1 or max(len(v) for v in distinct) < 80:
+            return distinct[0]
+        return "\n\n".join(distinct)
+    return values[0]
+
+
+def merge_dicts(results: list[dict]) -> dict:
+    """Merge JSON objects key by key (lists deduplicated, scores combined, text joined)."""
+    keys = list(dict.fromkeys(k for r in results for k in r))
+    return {key: _merge_values(key, [r.get(key) for r in results]) for key in keys}
+
+
+def merge_usage(usages: list[AnalysisUsage], elapsed_ms: int) -> AnalysisUsage:
+    return AnalysisUsage(
+        input_tokens=sum(u.input_tokens for u in usages),
+        output_tokens=sum(u.output_tokens for u in usages),
+        cache_creation_input_tokens=sum(u.cache_creation_input_tokens for u in usages),
+        cache_read_input_tokens=sum(u.cache_read_input_tokens for u in usages),
+        cost_usd=sum(u.cost_usd for u in usages),
+        processing_time_ms=elapsed_ms,
+        model_used=usages[0].model_used if usages else "",
+        route=usages[0].route if usages else "",
+    )
+
+
+def _failed(result: dict) -> bool:
+    return "error" in result or "raw" in result
+
+
+AnalyzeFn = Callable[[str], Awaitable[tuple[dict, AnalysisUsage]]]
+
+
+async def analyze_chunked(
+    analysis_type: str,
+    contract_text: str,
+    page_offsets: list[int] | None,
+    analyze: AnalyzeFn,
+    reduce_summaries: AnalyzeFn | None = None,
+) -> tuple[dict, AnalysisUsage]:
+    """
+    Run `analyze` on every chunk (at most analysis_chunk_concurrency at a time) and merge.
+    Summaries are reduced with one more call over the per-chunk summaries, in order.
+    A chunk that fails (budget, busy model, API error, timeout) does not cancel the
+    others: failures are reported under chunk_errors and the rest are merged. If every
+    chunk failed, the first error is raised, or returned as is when it was the budget.
+    """
+    start = time.perf_counter()
+    chunks = split_into_chunks(
+        contract_text,
+        page_offsets,
+        max_chars=settings.analysis_chunk_chars,
+        overlap_chars=settings.analysis_chunk_overlap_chars,
+    )
+    semaphore = asyncio.Semaphore(settings.analysis_chunk_concurrency)
+    done = 0
+    raised: list[Exception] = []
+    report_progress(chunks_total=len(chunks), chunks_done=0)
+
+    async def run(chunk: Chunk) -> tuple[dict, AnalysisUsage]:
+        nonlocal done
+        header = (
+            f"[Part {chunk.index + 1} of {len(chunks)} of a longer contract "
+            f"(characters {chunk.start}-{chunk.end}). Analyse only this part.]\n\n"
+        )
+        async with semaphore:
+            try:
+                outcome = await analyze(header + chunk.text)
+            except BudgetExhausted as e:
+                outcome = {"error": str(e)}, AnalysisUsage()
+            except Exception as e:
+                logger.warning("chunk_analysis_failed", chunk=chunk.index + 1, error=str(e))
+                raised.append(e)
+                outcome = {"error": str(e) or type(e).__name__}, AnalysisUsage()
+        done += 1
+        report_progress(chunks_done=done)
+        return outcome
+
+    outcomes = await asyncio.gather(*(run(c) for c in chunks))
+    results = [r for r, _ in outcomes]
+    usages = [u for _, u in outcomes]
+    succeeded = [r for r in results if not _failed(r)]
+    if not succeeded:
+        if raised:
+            raise raised[0]
+        return results[0], merge_usage(usages, int((time.perf_counter() - start) * 1000))
+
+    if analysis_type == "summary" and reduce_summaries is not None:
+        parts = "\n\n".join(
+            f"Part {i + 1} of {len(chunks)}:\n{r.get('summary', '')}" for i, r in enumerate(results) if not _failed(r)
+        )
+        try:
+            merged, reduce_usage = await reduce_summaries(
+                "The following are summaries of consecutive parts of one long contract. "
+                "Combine them into a single summary of the whole contract.\n\n" + parts
+            )
+            usages.append(reduce_usage)
+        except Exception as e:
+            # No budget (or no model) for the combining call: the part summaries, joined, still cover the text.
+            logger.warning("chunked_summary_reduce_skipped", reason=str(e))
+            merged = merge_dicts(succeeded)
+    else:
+        merged = merge_dicts(succeeded)
+
+    errors = [
+        {"chunk": i + 1, "error": r.get("error") or "Unparseable response"}
+        for i, r in enumerate(results) if _failed(r)
+    ]
+    if errors:
+        merged["chunk_errors"] = errors
+    usage = merge_usage(usages, int((time.perf_counter() - start) * 1000))
+    logger.info(
+        "chunked_analysis_completed",
+        analysis_type=analysis_type,
+        chunks=len(chunks),
+        failed_chunks=len(errors),
+        text_chars=len(contract_text),
+        elapsed_ms=usage.processing_time_ms,
+    )
+    return merged, usage
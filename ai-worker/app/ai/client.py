@@ -0,0 +1,91 @@
+"""Process-wide pooled Anthropic client, opened and closed by the app lifespan."""
+import anthropic
+import httpx
+import structlog
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+_client: anthropic.AsyncAnthropic | None = None
+
+
+class PoolGauge:
+    """Reports connection usage of the shared pool so max_connections can be sized."""
+
+    def __init__(self) -> None:
+        self.total_requests = 0
+
+    def count_request(self) -> None:
+        self.total_requests += 1
+
+    def snapshot(self) -> dict:
+        # The httpcore pool sits behind httpx's default transport.
+        pool = getattr(getattr(getattr(_client, "_client", None), "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        active = sum(1 for c in connections if not c.is_idle())
+        return {
+            "connections": len(connections),
+            "active": active,
+            "idle": len(connections) - active,
+            "total_requests": self.total_requests,
+            "max_connections": settings.anthropic_max_connections,
+            "max_keepalive_connections": settings.anthropic_max_keepalive_connections,
+            "utilization": round(active / max(1, settings.anthropic_max_connections), 3),
+        }
+
+
+pool_gauge = PoolGauge()
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.anthropic_max_connections,
+        max_keepalive_connections=settings.anthropic_max_keepalive_connections,
+        keepalive_expiry=settings.anthropic_keepalive_expiry,
+    )
+
+
+async def _on_request(request: httpx.Request) -> None:
+    pool_gauge.count_request()
+
+
+def _build_client() -> anthropic.AsyncAnthropic:
+    return anthropic.AsyncAnthropic(
+        api_key=settings.anthropic_api_key,
+        # Retries happen in app.ai.scheduler, where each attempt queues for rate-limit budget again.
+        max_retries=0,
+        http_client=anthropic.DefaultAsyncHttpxClient(
+            limits=_limits(),
+            http2=settings.anthropic_http2,
+            event_hooks={"request": [_on_request]},
+        ),
+    )
+
+
+async def init_client() -> None:
+    """Open the shared client. Called once per process from the app lifespan."""
+    get_client()
+    logger.info(
+        "anthropic_client_opened",
+        max_connections=settings.anthropic_max_connections,
+        max_keepalive_connections=settings.anthropic_max_keepalive_connections,
+        http2=settings.anthropic_http2,
+    )
+
+
+async def close_client() -> None:
+    """Close the shared client and release its connection pool."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def get_client() -> anthropic.AsyncAnthropic:
+    """Return the shared client, opening it lazily outside the lifespan (e.g. scripts)."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
@@ -1,9 +1,58 @@
-"""AI task type and analysis config."""
+"""AI task type, model routing and analysis config."""
+from dataclasses import dataclass
+
 from app.config import settings
 
+# Output budget per analysis task type; doubled for documents too long for the fast route.
+_MAX_TOKENS = {"simple": 1024, "discovery": 4096, "complex": 4096}
+
+# Context keys that point the agent at org data it will need tools for.
+_TOOL_CONTEXT_KEYS = ("region_id", "entity_id", "counterparty_id")
+
 
 def get_task_type(analysis_type: str) -> str:
     """Return 'simple' for summary, 'complex' for extraction/risk/deviation/obligations."""
     if analysis_type == "summary":
         return "simple"
     return "complex"
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """The model and output budget one analysis runs with, and where to escalate it."""
+    name: str  # fast | standard | agent
+    model: str
+    max_tokens: int
+    escalate_to: "ModelRoute | None" = None
+
+
+def _kind(analysis_type: str) -> str:
+    return "discovery" if analysis_type == "discovery" else get_task_type(analysis_type)
+
+
+def standard_route(analysis_type: str, text_chars: int = 0) -> ModelRoute:
+    """The route used before routing existed: ai_model, or ai_agent_model for the tool-using types."""
+    kind = _kind(analysis_type)
+    max_tokens = _MAX_TOKENS[kind] * (2 if text_chars > settings.ai_fast_max_chars else 1)
+    if kind == "complex":
+        return ModelRoute("agent", settings.ai_agent_model, max_tokens)
+    return ModelRoute("standard", settings.ai_model, max_tokens)
+
+
+def route_for(analysis_type: str, text_chars: int, context: dict | None = None) -> ModelRoute:
+    """
+    Pick the model for one analysis. Short documents of the ai_fast_analysis_types go to
+    ai_fast_model, escalating to the standard route; long documents, other types and agent
+    runs whose context asks about org data (region, entity, counterparty) go straight to
+    the standard route.
+    """
+    standard = standard_route(analysis_type, text_chars)
+    fast_types = {t.strip() for t in settings.ai_fast_analysis_types.split(",") if t.strip()}
+    if (
+        not settings.ai_fast_model
+        or analysis_type not in fast_types
+        or text_chars > settings.ai_fast_max_chars
+        or (standard.name == "agent" and any((context or {}).get(k) for k in _TOOL_CONTEXT_KEYS))
+    ):
+        return standard
+    return ModelRoute("fast", settings.ai_fast_model, standard.max_tokens, escalate_to=standard)
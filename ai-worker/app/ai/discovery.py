@@ -0,0 +1,148 @@
+"""Contract discovery: counterparties, entities, jurisdictions and governing law via Claude."""
+import json
+import time
+
+import structlog
+
+from app.ai.budget import usage_cost
+from app.ai.config import ModelRoute, standard_route
+from app.ai.local_discovery import DISCOVERY_TYPES, discover_locally, merge_discoveries
+from app.ai.reference_data import ReferenceData, reference_cache
+from app.ai.scheduler import create_message
+from app.ai.schemas import AnalysisUsage
+from app.config import settings
+
+logger = structlog.get_logger()
+
+# Bump when the discovery prompt changes so cached results are not reused.
+PROMPT_VERSION = "2"
+
+_FIELDS = {
+    "counterparty": "legal_name, registration_number, registered_address, jurisdiction",
+    "entity": "name, registration_number, code",
+    "jurisdiction": "name, country_code",
+    "governing_law": "name, country_code",
+}
+
+
+async def _reference_data() -> ReferenceData | None:
+    """Known parties and places for the local pass; without them it still runs on patterns."""
+    try:
+        return await reference_cache.get()
+    except Exception as e:
+        logger.warning("discovery_reference_data_unavailable", error=str(e))
+        return None
+
+
+def _strip_markdown_json(text: str) -> str:
+    """Strip markdown code fences from Claude's JSON responses.
+
+    Claude frequently wraps JSON in ```json ... ``` blocks even when asked not to.
+    This function extracts the raw JSON string from such wrappers.
+    """
+    import re
+    stripped = text.strip()
+    # Match ```json ... ``` or ``` ... ``` (with optional language tag)
+    m = re.match(r"^```(?:json)?\s*\n?(.*?)```\s*$", stripped, re.DOTALL)
+    if m:
+        return m.group(1).strip()
+    return stripped
+
+
+async def analyze_discovery(
+    contract_text: str,
+    context: dict,
+    mcp_tools: list,
+    route: ModelRoute | None = None,
+) -> tuple[dict, AnalysisUsage]:
+    """
+    Extract structured entity data from contract text. A local pass (app.ai.local_discovery)
+    runs first; Claude is only asked for the types it could not resolve, and not at all
+    when it resolved every type.
+    """
+    route = route or standard_route("discovery")
+    start = time.perf_counter()
+    contract_text = contract_text[:50000]
+
+    local = None
+    if settings.discovery_local:
+        local = discover_locally(contract_text, await _reference_data(), settings.discovery_local_min_confidence)
+        logger.info(
+            "discovery_local_pass",
+            found=len(local.discoveries),
+            resolved=sorted(local.resolved),
+            elapsed_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+    wanted = [t for t in DISCOVERY_TYPES if local is None or t not in local.resolved]
+    if not wanted:
+        usage = AnalysisUsage(
+            processing_time_ms=int((time.perf_counter() - start) * 1000), model_used="local", route="local",
+        )
+        return {"discoveries": local.discoveries}, usage
+
+    fields = "\n".join(f"For {t}: {_FIELDS[t]}" for t in wanted)
+    prompt = f"""Analyze this contract and extract the following structured information.
+For each item found, provide the data and a confidence score (0.0 to 1.0).
+
+Return ONLY raw valid JSON (no markdown, no code fences, no explanation).
+The JSON must have a 'discoveries' array. Each item has:
+- type: one of {", ".join(f"'{t}'" for t in wanted)}
+- confidence: float 0.0-1.0
+- data: object with relevant fields
+
+{fields}
+
+Contract text:
+{contract_text}
+
+Context from the system:
+{json.dumps(context, default=str)}"""
+
+    msg = await create_message(
+        model=route.model,
+        max_tokens=route.max_tokens,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    elapsed_ms = int((time.perf_counter() - start) * 1000)
+
+    raw_text = ""
+    if msg.content and len(msg.content) > 0:
+        raw_text = msg.content[0].text if hasattr(msg.content[0], "text") else str(msg.content[0])
+
+    # Strip markdown code fences — Claude frequently wraps JSON despite instructions
+    cleaned_text = _strip_markdown_json(raw_text)
+
+    try:
+        result_dict = json.loads(cleaned_text)
+    except json.JSONDecodeError:
+        logger.warning("analyze_discovery_json_parse_failed",
+                       raw=raw_text[:500],
+                       cleaned=cleaned_text[:500])
+        result_dict = {"discoveries": []}
+
+    # Validate we got a discoveries array
+    if "discoveries" not in result_dict:
+        logger.warning("analyze_discovery_missing_key",
+                       keys=list(result_dict.keys()),
+                       raw_preview=raw_text[:300])
+        result_dict = {"discoveries": result_dict.get("results", result_dict.get("data", []))}
+        if not isinstance(result_dict["discoveries"], list):
+            result_dict = {"discoveries": []}
+
+    if local is not None:
+        result_dict = {"discoveries": merge_discoveries(local, result_dict["discoveries"])}
+
+    logger.info("analyze_discovery_completed",
+                discovery_count=len(result_dict.get("discoveries", [])),
+                elapsed_ms=elapsed_ms)
+
+    usage = AnalysisUsage(
+        input_tokens=msg.usage.input_tokens if msg.usage else 0,
+        output_tokens=msg.usage.output_tokens if msg.usage else 0,
+        cost_usd=usage_cost(route.model, msg.usage),
+        processing_time_ms=elapsed_ms,
+        model_used=route.model,
+        route=route.name,
+    )
+    return result_dict, usage
+
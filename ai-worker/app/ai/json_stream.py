@@ -0,0 +1,66 @@
+"""
+Incremental extraction of array items from a JSON object that is still being
+streamed, e.g. {"clauses": [{...}, {...}, ...], "summary": {...}}. Each item
+is returned as soon as its closing brace arrives, so callers can act on it
+before the rest of the response exists.
+"""
+
+import json
+from typing import Iterator
+
+
+class JSONArrayItemStream:
+    """
+    Feed text chunks; iterate (key, item) for every complete object inside the
+    top-level arrays named in `keys`. Text before the opening brace (such as a
+    markdown code fence) is ignored.
+    """
+
+    def __init__(self, keys: tuple[str, ...]):
+        self.keys = keys
+        self.buffer = ""
+        self._pos = 0
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._array_key: str | None = None
+        self._item_start: int | None = None
+
+    def feed(self, text: str) -> Iterator[tuple[str, dict]]:
+        self.buffer += text
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = buf[self._string_start + 1:i]
+            elif c == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = i
+            elif c in "{[":
+                if c == "[" and self._stack == ["{"]:
+                    self._array_key = self._last_string
+                self._stack.append(c)
+                if c == "{" and self._stack == ["{", "[", "{"] and self._array_key in self.keys:
+                    self._item_start = i
+            elif c in "}]" and self._stack:
+                self._stack.pop()
+                if c == "}" and self._stack == ["{", "["] and self._item_start is not None:
+                    raw = buf[self._item_start:i + 1]
+                    self._item_start = None
+                    try:
+                        item = json.loads(raw)
+                    except json.JSONDecodeError:
+                        continue
+                    self._pos = i + 1
+                    yield self._array_key, item
+        self._pos = len(buf)
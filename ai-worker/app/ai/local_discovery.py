@@ -0,0 +1,358 @@
+"""
+Deterministic discovery pass run before Claude (see app.ai.discovery).
+
+Compiled patterns find the parties named in the preamble, registration numbers and
+the governing law and jurisdiction clauses. A gazetteer (the countries, jurisdictions
+and governing laws tables plus built-in aliases) resolves place names, and the
+entities and counterparties tables resolve parties to known records. Findings have
+the shape Claude returns ({"type", "confidence", "data"}); a type is resolved, and
+not asked of Claude, when it has findings and all of them are at or above the
+confidence threshold (so one unknown party keeps counterparty open).
+"""
+
+import functools
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from app.ai.reference_data import ReferenceData
+
+DISCOVERY_TYPES = ("counterparty", "entity", "jurisdiction", "governing_law")
+
+# Place names beyond the countries table: sub-national legal systems, free zones,
+# long forms and the adjectives used in "English law" or "the Swiss courts". The
+# canonical names follow the governing_laws seed data.
+_ALIASES: dict[str, tuple[str, str]] = {
+    "england and wales": ("England and Wales", "GB"),
+    "england": ("England and Wales", "GB"),
+    "english": ("England and Wales", "GB"),
+    "scotland": ("Scotland", "GB"),
+    "scots": ("Scotland", "GB"),
+    "northern ireland": ("Northern Ireland", "GB"),
+    "united kingdom": ("United Kingdom", "GB"),
+    "united states of america": ("United States", "US"),
+    "united states": ("United States", "US"),
+    "new york": ("New York", "US"),
+    "state of new york": ("New York", "US"),
+    "delaware": ("Delaware", "US"),
+    "state of delaware": ("Delaware", "US"),
+    "california": ("California", "US"),
+    "state of california": ("California", "US"),
+    "texas": ("Texas", "US"),
+    "republic of south africa": ("South Africa", "ZA"),
+    "south africa": ("South Africa", "ZA"),
+    "south african": ("South Africa", "ZA"),
+    "united arab emirates": ("UAE Federal", "AE"),
+    "uae": ("UAE Federal", "AE"),
+    "dubai international financial centre": ("DIFC", "AE"),
+    "difc": ("DIFC", "AE"),
+    "abu dhabi global market": ("ADGM", "AE"),
+    "adgm": ("ADGM", "AE"),
+    "dubai": ("Dubai", "AE"),
+    "abu dhabi": ("Abu Dhabi", "AE"),
+    "singapore": ("Singapore", "SG"),
+    "hong kong special administrative region": ("Hong Kong", "HK"),
+    "hong kong": ("Hong Kong", "HK"),
+    "france": ("France", "FR"),
+    "french": ("France", "FR"),
+    "federal republic of germany": ("Germany", "DE"),
+    "germany": ("Germany", "DE"),
+    "german": ("Germany", "DE"),
+    "switzerland": ("Switzerland", "CH"),
+    "swiss": ("Switzerland", "CH"),
+    "kingdom of saudi arabia": ("Saudi Arabia", "SA"),
+    "saudi arabia": ("Saudi Arabia", "SA"),
+    "kingdom of bahrain": ("Bahrain", "BH"),
+    "bahrain": ("Bahrain", "BH"),
+    "republic of india": ("India", "IN"),
+    "india": ("India", "IN"),
+    "indian": ("India", "IN"),
+    "new south wales": ("Australia (NSW)", "AU"),
+    "federal republic of nigeria": ("Nigeria", "NG"),
+    "nigeria": ("Nigeria", "NG"),
+    "nigerian": ("Nigeria", "NG"),
+    "republic of kenya": ("Kenya", "KE"),
+    "kenya": ("Kenya", "KE"),
+    "kenyan": ("Kenya", "KE"),
+    "arab republic of egypt": ("Egypt", "EG"),
+    "egypt": ("Egypt", "EG"),
+    "egyptian": ("Egypt", "EG"),
+    "ireland": ("Ireland", "IE"),
+    "irish": ("Ireland", "IE"),
+    "netherlands": ("Netherlands", "NL"),
+    "dutch": ("Netherlands", "NL"),
+}
+
+_GOVERNING_LAW = re.compile(
+    r"governed\s+by|construed\s+(?:and\s+\w+\s+)?in\s+accordance\s+with|governing\s+law", re.IGNORECASE
+)
+_JURISDICTION = re.compile(
+    r"jurisdiction\s+of|submits?\s+to|courts?\s+of|(?:non-)?exclusive\s+jurisdiction", re.IGNORECASE
+)
+_CLAUSE_END = re.compile(r"[.;]\s|\n\s*\n")
+_WINDOW = 160
+
+_SUFFIX = (
+    r"(?i:\(Pty\)\s*Ltd|\(Proprietary\)\s+Limited|Proprietary\s+Limited|Pty\s+Ltd|Pte\.?\s+Ltd|SOC\s+Ltd"
+    r"|Limited|Ltd|LLC|L\.L\.C|Inc|Incorporated|PLC|plc|LLP|GmbH|AG|S\.A|B\.V|N\.V|Corporation|Corp"
+    r"|SARL|S\.p\.A|FZ-LLC|FZE|FZCO|NPC)\.?"
+)
+_PARTY = re.compile(r"((?:[A-Z0-9&][\w&'.-]*\s+){1,6}?" + _SUFFIX + r")(?![\w-])")
+_SUFFIX_AT_END = re.compile(r"\s+" + _SUFFIX + r"$")
+# "a Delaware corporation", "an English company": a description of the party before it, not a name.
+_ARTICLE_BEFORE = re.compile(r"(?:^|\W)(?:a|an)\s+$", re.IGNORECASE)
+_REGISTRATION = re.compile(
+    r"(?i:registration|company|reg\.?|incorporation)\s+(?i:number|no\.?|#)\s*[:.]?\s*"
+    r"(\d[\d/-]{3,20}\d|[A-Z]{1,3}\d[\d/-]{3,20}\d)"
+)
+# Capitalised words a preamble puts in front of the first party's name.
+_LEADING_NOISE = {"between", "and", "by", "this", "the", "agreement", "made", "entered", "into", "party", "parties"}
+_PREAMBLE_CHARS = 4000
+_OWNER_DISTANCE = 400
+
+# Confidence of each kind of evidence.
+_KNOWN_BY_REGISTRATION = 0.98
+_KNOWN_BY_NAME = 0.95
+_CLAUSE = 0.95
+_CONFLICTING_CLAUSES = 0.6
+_UNKNOWN_PARTY = 0.7
+
+
+def normalise_name(name: str) -> str:
+    """Case-, punctuation- and company-suffix-insensitive form of a legal name."""
+    words = re.sub(r"[^\w&]+", " ", name.lower()).split()
+    text = " ".join(words)
+    text = re.sub(r"\bproprietary limited\b", "pty ltd", text)
+    text = re.sub(r"\blimited\b", "ltd", text)
+    text = re.sub(r"\bincorporated\b", "inc", text)
+    return re.sub(r"\bcorporation\b", "corp", text)
+
+
+def _normalise_registration(number: str | None) -> str:
+    return re.sub(r"\s+", "", number or "").upper()
+
+
+def _compact(data: dict) -> dict:
+    return {k: v for k, v in data.items() if v not in (None, "")}
+
+
+class _Index:
+    """Gazetteer and known-party lookups built from one reference data snapshot."""
+
+    def __init__(self, data: ReferenceData | None):
+        places = dict(_ALIASES)
+        self.laws: dict[str, str] = {}
+        self.laws_by_country: dict[str, list[str]] = {}
+        self.jurisdictions: dict[str, str] = {}
+        self.jurisdictions_by_country: dict[str, list[str]] = {}
+        self.entities_by_name: dict[str, dict] = {}
+        self.entities_by_registration: dict[str, dict] = {}
+        self.counterparties_by_name: dict[str, dict] = {}
+        self.counterparties_by_registration: dict[str, dict] = {}
+        if data is not None:
+            for rows, names, by_country in (
+                (data.governing_laws, self.laws, self.laws_by_country),
+                (data.jurisdictions, self.jurisdictions, self.jurisdictions_by_country),
+            ):
+                for row in rows:
+                    names[row["name"].lower()] = row["name"]
+                    if row.get("country_code"):
+                        by_country.setdefault(row["country_code"], []).append(row["name"])
+                        places.setdefault(row["name"].lower(), (row["name"], row["country_code"]))
+            for country in data.countries:
+                places.setdefault(country["name"].lower(), (country["name"], country["code"]))
+            for entity in data.entities:
+                for name in (entity.get("legal_name"), entity.get("name")):
+                    if name and len(normalise_name(name)) >= 4:
+                        self.entities_by_name.setdefault(normalise_name(name), entity)
+                if entity.get("registration_number"):
+                    self.entities_by_registration[_normalise_registration(entity["registration_number"])] = entity
+            for counterparty in data.counterparties:
+                if counterparty.get("legal_name"):
+                    self.counterparties_by_name.setdefault(normalise_name(counterparty["legal_name"]), counterparty)
+                if counterparty.get("registration_number"):
+                    key = _normalise_registration(counterparty["registration_number"])
+                    self.counterparties_by_registration[key] = counterparty
+        self.places = places
+        alternatives = "|".join(re.escape(p) for p in sorted(places, key=len, reverse=True))
+        self.place_pattern = re.compile(rf"(?<![\w-])(?:{alternatives})(?![\w-])", re.IGNORECASE)
+
+    def place_after(self, text: str, position: int) -> tuple[str, str] | None:
+        """The first known place in the clause that starts at position, as (canonical name, country code)."""
+        window = text[position:position + _WINDOW]
+        end = _CLAUSE_END.search(window)
+        if end:
+            window = window[:end.start()]
+        match = self.place_pattern.search(window)
+        return self.places[match.group(0).lower()] if match else None
+
+    def law_name(self, place: str, country_code: str) -> str:
+        """The governing_laws name for a place, when the table has it or has one law for the country."""
+        if place.lower() in self.laws:
+            return self.laws[place.lower()]
+        candidates = self.laws_by_country.get(country_code, [])
+        return candidates[0] if len(candidates) == 1 else place
+
+    def jurisdiction_name(self, place: str, country_code: str) -> str:
+        if place.lower() in self.jurisdictions:
+            return self.jurisdictions[place.lower()]
+        candidates = self.jurisdictions_by_country.get(country_code, [])
+        return candidates[0] if len(candidates) == 1 else place
+
+
+@functools.lru_cache(maxsize=2)
+def _index(data: ReferenceData | None) -> _Index:
+    # Snapshots are immutable and replaced on refresh, so identity is a safe key.
+    return _Index(data)
+
+
+@dataclass
+class LocalDiscovery:
+    discoveries: list[dict] = field(default_factory=list)
+    resolved: set[str] = field(default_factory=set)  # types whose findings are all confident
+
+
+def _clause_places(text: str, trigger: re.Pattern, index: _Index) -> tuple[tuple[str, str], float] | None:
+    """The place a kind of clause names, and how sure we are (lower when clauses disagree)."""
+    found = Counter(
+        place for m in trigger.finditer(text) if (place := index.place_after(text, m.end())) is not None
+    )
+    if not found:
+        return None
+    place, _ = found.most_common(1)[0]
+    return place, _CLAUSE if len(found) == 1 else _CONFLICTING_CLAUSES
+
+
+def _entity_discovery(entity: dict, confidence: float) -> dict:
+    data = {
+        "name": entity.get("name"),
+        "registration_number": entity.get("registration_number"),
+        "code": entity.get("code"),
+    }
+    return {"type": "entity", "confidence": confidence, "data": _compact(data)}
+
+
+def _counterparty_discovery(counterparty: dict, confidence: float) -> dict:
+    data = {
+        "legal_name": counterparty.get("legal_name"),
+        "registration_number": counterparty.get("registration_number"),
+        "registered_address": counterparty.get("address") or counterparty.get("registered_address"),
+        "jurisdiction": counterparty.get("jurisdiction"),
+    }
+    return {"type": "counterparty", "confidence": confidence, "data": _compact(data)}
+
+
+def _party_name(raw: str) -> str:
+    words = raw.split()
+    while len(words) > 1 and words[0].lower().strip(",:") in _LEADING_NOISE:
+        words = words[1:]
+    return " ".join(words)
+
+
+def _is_descriptor(preamble: str, match: re.Match, name: str, index: _Index) -> bool:
+    """Whether a suffix match describes a party ("a Delaware corporation") rather than naming one."""
+    if _ARTICLE_BEFORE.search(preamble[max(0, match.start() - 4):match.start()]):
+        return True
+    stem = _SUFFIX_AT_END.sub("", name)
+    return index.place_pattern.fullmatch(stem) is not None
+
+
+def _parties(text: str, index: _Index) -> list[dict]:
+    found: list[dict] = []
+    preamble = text[:_PREAMBLE_CHARS]
+
+    # Registration numbers anywhere that belong to a known record settle the party outright.
+    registrations = [(m.start(), _normalise_registration(m.group(1))) for m in _REGISTRATION.finditer(text)]
+    for _, number in registrations:
+        if number in index.entities_by_registration:
+            found.append(_entity_discovery(index.entities_by_registration[number], _KNOWN_BY_REGISTRATION))
+        elif number in index.counterparties_by_registration:
+            counterparty = index.counterparties_by_registration[number]
+            found.append(_counterparty_discovery(counterparty, _KNOWN_BY_REGISTRATION))
+
+    # Company names in the preamble, each with the registration number that follows it.
+    mentions = [
+        (m.end(), name) for m in _PARTY.finditer(preamble)
+        if not _is_descriptor(preamble, m, name := _party_name(m.group(1)), index)
+    ]
+    for end, name in mentions:
+        number = next(
+            (n for pos, n in registrations if end <= pos <= end + _OWNER_DISTANCE
+             and not any(end < other_end <= pos for other_end, _ in mentions)),
+            None,
+        )
+        key = normalise_name(name)
+        if key in index.entities_by_name:
+            found.append(_entity_discovery(index.entities_by_name[key], _KNOWN_BY_NAME))
+        elif key in index.counterparties_by_name:
+            found.append(_counterparty_discovery(index.counterparties_by_name[key], _KNOWN_BY_NAME))
+        else:
+            found.append(_counterparty_discovery({"legal_name": name, "registration_number": number}, _UNKNOWN_PARTY))
+
+    # Known entities (few) are also looked for by name anywhere in the text.
+    normalised = f" {normalise_name(text)} "
+    for key, entity in index.entities_by_name.items():
+        if f" {key} " in normalised:
+            found.append(_entity_discovery(entity, _KNOWN_BY_NAME))
+    return found
+
+
+def _identity(discovery: dict) -> tuple[str, str]:
+    data = discovery["data"]
+    name = data.get("legal_name") or data.get("name") or ""
+    return discovery["type"], normalise_name(str(name))
+
+
+def _deduplicate(discoveries: list[dict]) -> list[dict]:
+    best: dict[tuple[str, str], dict] = {}
+    for discovery in discoveries:
+        key = _identity(discovery)
+        if key not in best or (discovery.get("confidence") or 0) > (best[key].get("confidence") or 0):
+            best[key] = discovery
+    return list(best.values())
+
+
+def discover_locally(text: str, data: ReferenceData | None, min_confidence: float) -> LocalDiscovery:
+    """Run the local pass over text; data may be None when the reference tables are unavailable."""
+    index = _index(data)
+    found = _parties(text, index)
+
+    law = _clause_places(text, _GOVERNING_LAW, index)
+    if law is not None:
+        (place, country_code), confidence = law
+        found.append({
+            "type": "governing_law",
+            "confidence": confidence,
+            "data": {"name": index.law_name(place, country_code), "country_code": country_code},
+        })
+    jurisdiction = _clause_places(text, _JURISDICTION, index)
+    if jurisdiction is not None:
+        (place, country_code), confidence = jurisdiction
+        found.append({
+            "type": "jurisdiction",
+            "confidence": confidence,
+            "data": {"name": index.jurisdiction_name(place, country_code), "country_code": country_code},
+        })
+
+    discoveries = _deduplicate(found)
+    unsure = {d["type"] for d in discoveries if d["confidence"] < min_confidence}
+    resolved = {d["type"] for d in discoveries} - unsure
+    return LocalDiscovery(discoveries, resolved)
+
+
+def merge_discoveries(local: LocalDiscovery, claude: list[dict]) -> list[dict]:
+    """
+    Local findings for resolved types; for the rest Claude's findings plus the local
+    known records (a local low-confidence finding is kept only when Claude found
+    nothing of its type).
+    """
+    claude_types = {d.get("type") for d in claude if isinstance(d, dict)}
+    merged = [
+        d for d in local.discoveries
+        if d["type"] in local.resolved or d["type"] not in claude_types or d["confidence"] >= _KNOWN_BY_NAME
+    ]
+    merged += [
+        d for d in claude
+        if isinstance(d, dict) and d.get("type") not in local.resolved and isinstance(d.get("data"), dict)
+    ]
+    return _deduplicate(merged)
@@ -1,12 +1,35 @@
+from typing import Awaitable, Callable
+
 import structlog
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.ai.reference_data import reference_cache
+from app.deps import SessionLocal
 
 logger = structlog.get_logger()
 
 
-def get_tools(db: Session, contract_id: str) -> list[dict]:
-    """Returns the same 4 tool definitions as the original, but using SQLAlchemy."""
+def _with_session(
+    query: Callable[..., Awaitable[dict]],
+    session_factory: Callable[[], AsyncSession],
+) -> Callable[..., Awaitable[dict]]:
+    """
+    Wrap a query so every call runs on its own short-lived session. Handlers for one
+    turn run concurrently, and an AsyncSession must never be shared between tasks.
+    """
+    async def handler(**kwargs) -> dict:
+        async with session_factory() as db:
+            return await query(db, **kwargs)
+    return handler
+
+
+def get_tools(contract_id: str, session_factory: Callable[[], AsyncSession] = SessionLocal) -> list[dict]:
+    """
+    Returns the same 4 tool definitions as the original. Org structure, authority matrix
+    and WikiContracts lookups are served from the in-memory reference_cache; counterparty
+    lookups still query the database.
+    """
     return [
         {
             "definition": {
@@ -21,7 +44,7 @@ def get_tools(db: Session, contract_id: str) -> list[dict]:
                     "required": [],
                 },
             },
-            "handler": lambda **kwargs: _query_org_structure(db, **kwargs),
+            "handler": _query_org_structure,
         },
         {
             "definition": {
@@ -36,7 +59,7 @@ def get_tools(db: Session, contract_id: str) -> list[dict]:
                     "required": [],
                 },
             },
-            "handler": lambda **kwargs: _query_authority_matrix(db, **kwargs),
+            "handler": _query_authority_matrix,
         },
         {
             "definition": {
@@ -52,7 +75,7 @@ def get_tools(db: Session, contract_id: str) -> list[dict]:
                     "required": [],
                 },
             },
-            "handler": lambda **kwargs: _query_wiki_contracts(db, **kwargs),
+            "handler": _query_wiki_contracts,
         },
         {
             "definition": {
@@ -66,90 +89,59 @@ def get_tools(db: Session, contract_id: str) -> list[dict]:
                     "required": ["counterparty_id"],
                 },
             },
-            "handler": lambda **kwargs: _query_counterparty(db, **kwargs),
+            "handler": _with_session(_query_counterparty, session_factory),
         },
     ]
 
 
-def _query_org_structure(db: Session, region_id: str | None = None, entity_id: str | None = None) -> dict:
+async def _query_org_structure(region_id: str | None = None, entity_id: str | None = None) -> dict:
     try:
+        data = await reference_cache.get()
         if entity_id:
-            rows = db.execute(
-                text("SELECT e.*, r.name as region_name, r.code as region_code "
-                     "FROM entities e JOIN regions r ON e.region_id = r.id "
-                     "WHERE e.id = :entity_id LIMIT 1"),
-                {"entity_id": entity_id}
-            ).mappings().all()
-            return {"entities": [dict(r) for r in rows]}
+            entity = data.entities_by_id.get(entity_id)
+            return {"entities": [entity] if entity else []}
         if region_id:
-            rows = db.execute(
-                text("SELECT e.*, r.name as region_name FROM entities e "
-                     "JOIN regions r ON e.region_id = r.id WHERE e.region_id = :region_id"),
-                {"region_id": region_id}
-            ).mappings().all()
-            return {"entities": [dict(r) for r in rows]}
-        regions = db.execute(text("SELECT * FROM regions LIMIT 50")).mappings().all()
-        entities = db.execute(text("SELECT * FROM entities LIMIT 50")).mappings().all()
-        return {"regions": [dict(r) for r in regions], "entities": [dict(r) for r in entities]}
+            return {"entities": data.entities_by_region.get(region_id, [])}
+        return {"regions": data.regions[:50], "entities": data.entities[:50]}
     except Exception as e:
         logger.error("mcp_tool_error", tool="query_org_structure", error=str(e))
         return {"error": str(e)}
 
 
-def _query_authority_matrix(db: Session, entity_id: str | None = None, project_id: str | None = None) -> dict:
+async def _query_authority_matrix(entity_id: str | None = None, project_id: str | None = None) -> dict:
     try:
-        query = "SELECT * FROM signing_authority WHERE 1=1"
-        params: dict = {}
-        if entity_id:
-            query += " AND entity_id = :entity_id"
-            params["entity_id"] = entity_id
-        if project_id:
-            query += " AND (project_id = :project_id OR project_id IS NULL)"
-            params["project_id"] = project_id
-        query += " LIMIT 50"
-        rows = db.execute(text(query), params).mappings().all()
-        return {"signing_authority": [dict(r) for r in rows]}
+        data = await reference_cache.get()
+        return {"signing_authority": data.signing_rules(entity_id, project_id)[:50]}
     except Exception as e:
         logger.error("mcp_tool_error", tool="query_authority_matrix", error=str(e))
         return {"error": str(e)}
 
 
-def _query_wiki_contracts(
-    db: Session,
+async def _query_wiki_contracts(
     category: str | None = None,
     region_id: str | None = None,
     status: str = "published"
 ) -> dict:
     try:
-        query = ("SELECT id, name, category, region_id, version, status, description "
-                 "FROM wiki_contracts WHERE status = :status")
-        params: dict = {"status": status}
-        if category:
-            query += " AND category = :category"
-            params["category"] = category
-        if region_id:
-            query += " AND region_id = :region_id"
-            params["region_id"] = region_id
-        query += " LIMIT 25"
-        rows = db.execute(text(query), params).mappings().all()
-        return {"templates": [dict(r) for r in rows]}
+        data = await reference_cache.get()
+        return {"templates": data.wiki_templates(status, category, region_id)[:25]}
     except Exception as e:
         logger.error("mcp_tool_error", tool="query_wiki_contracts", error=str(e))
         return {"error": str(e)}
 
 
-def _query_counterparty(db: Session, counterparty_id: str) -> dict:
+async def _query_counterparty(db: AsyncSession, counterparty_id: str) -> dict:
     try:
-        counterparty = db.execute(
+        counterparty = (await db.execute(
             text("SELECT * FROM counterparties WHERE id = :id LIMIT 1"),
             {"id": counterparty_id}
-        ).mappings().first()
+        )).mappings().first()
         if not counterparty:
             return {"error": "Counterparty not found"}
-        contacts = db.execute(
+        contacts = (await db.execute(
             text("SELECT * FROM counterparty_contacts WHERE counterparty_id = :id"),
             {"id": counterparty_id}
-        ).mappings().all()
+        )).mappings().all()
         result = dict(counterparty)
         result["counterparty_contacts"] = [dict(c) for c in contacts]
         return {"counterparty": result}
@@ -1,19 +1,31 @@
 """Simple summary analysis via Claude."""
 import time
-from app.config import settings
+from typing import Awaitable, Callable
+
+from app.ai.budget import usage_cost
+from app.ai.config import ModelRoute, standard_route
+from app.ai.scheduler import create_message, stream_text
 from app.ai.schemas import AnalysisUsage, SummaryResult
 
+# Bump when the prompt changes so cached results are not reused.
+PROMPT_VERSION = "1"
+
 
-async def analyze_summary(contract_text: str) -> tuple[SummaryResult, AnalysisUsage]:
-    """Run a simple summary analysis. Returns (result, usage)."""
-    import anthropic
+async def analyze_summary(
+    contract_text: str,
+    on_text: Callable[[str], Awaitable[None]] | None = None,
+    route: ModelRoute | None = None,
+) -> tuple[SummaryResult, AnalysisUsage]:
+    """Run a simple summary analysis. Returns (result, usage). With on_text, the
+    response is streamed and on_text is awaited with each text delta."""
+    route = route or standard_route("summary")
     start = time.perf_counter()
-    client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key)
-    msg = await client.messages.create(
-        model=settings.ai_model,
-        max_tokens=1024,
-        messages=[{"role": "user", "content": f"Summarize this contract in a few paragraphs:\n\n{contract_text[:50000]}"}],
-    )
+    request = {
+        "model": route.model,
+        "max_tokens": route.max_tokens,
+        "messages": [{"role": "user", "content": f"Summarize this contract in a few paragraphs:\n\n{contract_text[:50000]}"}],
+    }
+    msg = await (stream_text(on_text, **request) if on_text else create_message(**request))
     elapsed_ms = int((time.perf_counter() - start) * 1000)
     summary_text = ""
     if msg.content and len(msg.content) > 0:
@@ -22,8 +34,9 @@ async def analyze_summary(contract_text: str) -> tuple[SummaryResult, AnalysisUs
     usage = AnalysisUsage(
         input_tokens=msg.usage.input_tokens if msg.usage else 0,
         output_tokens=msg.usage.output_tokens if msg.usage else 0,
-        cost_usd=0.0,
+        cost_usd=usage_cost(route.model, msg.usage),
         processing_time_ms=elapsed_ms,
-        model_used=settings.ai_model,
+        model_used=route.model,
+        route=route.name,
     )
     return result, usage
@@ -0,0 +1,65 @@
+"""
+Helpers for Anthropic prompt caching. A `cache_control` breakpoint caches the
+whole prompt prefix up to and including the marked block (order: tools, system,
+messages), so follow-up rounds and repeat calls re-read it instead of paying
+for it again. At most four breakpoints are allowed per request.
+"""
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def cached_text(text: str) -> dict:
+    """A text content block marked as a cache breakpoint."""
+    return {"type": "text", "text": text, "cache_control": EPHEMERAL}
+
+
+def cached_system(*parts: str) -> list[dict]:
+    """System prompt blocks with a breakpoint on the last one."""
+    blocks = [{"type": "text", "text": p} for p in parts]
+    if blocks:
+        blocks[-1]["cache_control"] = EPHEMERAL
+    return blocks
+
+
+def cached_tools(tool_defs: list[dict]) -> list[dict]:
+    """Tool definitions with a breakpoint on the last one (caches every definition)."""
+    tools = [dict(t) for t in tool_defs]
+    if tools:
+        tools[-1]["cache_control"] = EPHEMERAL
+    return tools
+
+
+def move_message_breakpoint(messages: list[dict], fixed: int) -> list[dict]:
+    """
+    Return a copy of messages with one rolling breakpoint on the last block of the
+    last message, leaving the first `fixed` messages (which carry their own
+    breakpoints) untouched. Earlier rolling breakpoints are dropped so the request
+    stays within the four-breakpoint limit.
+    """
+    out = messages[:fixed]
+    for message in messages[fixed:]:
+        content = message["content"]
+        if isinstance(content, list):
+            content = [
+                {k: v for k, v in block.items() if k != "cache_control"} if isinstance(block, dict) else block
+                for block in content
+            ]
+        out.append({**message, "content": content})
+    if len(out) > fixed:
+        last = out[-1]
+        content = last["content"]
+        if isinstance(content, str):
+            last["content"] = [cached_text(content)]
+        elif content and isinstance(content[-1], dict):
+            content[-1] = {**content[-1], "cache_control": EPHEMERAL}
+    return out
+
+
+def cache_tokens(usage) -> tuple[int, int]:
+    """(cache_creation_input_tokens, cache_read_input_tokens) from an API usage object."""
+    if usage is None:
+        return 0, 0
+    return (
+        getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        getattr(usage, "cache_read_input_tokens", 0) or 0,
+    )
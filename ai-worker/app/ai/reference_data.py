@@ -0,0 +1,223 @@
+"""
+In-memory cache of the reference data read by the MCP tools (regions, entities,
+signing authority, WikiContracts templates) and by the local discovery pass
+(countries, jurisdictions, governing laws, counterparties). These tables change rarely, so each
+worker process loads them once into indexes and answers tool calls with
+dictionary lookups.
+
+The snapshot is reloaded when it is older than REFERENCE_CACHE_TTL_SECONDS or
+after an invalidation. Invalidation touches a stamp file, so one call from
+Laravel reaches every worker process that shares the file system.
+"""
+
+import asyncio
+import os
+import time
+from collections import defaultdict
+
+import structlog
+from sqlalchemy import text
+
+from app.config import settings
+
+logger = structlog.get_logger()
+
+
+def _index(rows: list[dict], key: str) -> dict[str, list[dict]]:
+    index: dict[str, list[dict]] = defaultdict(list)
+    for row in rows:
+        if row.get(key) is not None:
+            index[str(row[key])].append(row)
+    return dict(index)
+
+
+class ReferenceData:
+    """One immutable snapshot of the reference tables and their indexes."""
+
+    def __init__(
+        self,
+        regions: list[dict],
+        entities: list[dict],
+        signing_authority: list[dict],
+        signing_authority_projects: list[dict],
+        wiki_contracts: list[dict],
+        countries: list[dict] = (),
+        jurisdictions: list[dict] = (),
+        governing_laws: list[dict] = (),
+        counterparties: list[dict] = (),
+    ):
+        self.regions = regions
+        self.regions_by_id = {str(r["id"]): r for r in regions}
+
+        # Entities carry their region's name and code, as the old JOIN returned them.
+        self.entities = []
+        for e in entities:
+            region = self.regions_by_id.get(str(e.get("region_id")), {})
+            self.entities.append({**e, "region_name": region.get("name"), "region_code": region.get("code")})
+        self.entities_by_id = {str(e["id"]): e for e in self.entities}
+        self.entities_by_region = _index(self.entities, "region_id")
+
+        # Projects are linked through the signing_authority_project pivot table.
+        project_ids: dict[str, list[str]] = defaultdict(list)
+        for link in signing_authority_projects:
+            project_ids[str(link["signing_authority_id"])].append(str(link["project_id"]))
+        self.signing_authority = [
+            {**rule, "project_ids": project_ids.get(str(rule["id"]), [])} for rule in signing_authority
+        ]
+        self.signing_by_entity = _index(self.signing_authority, "entity_id")
+        self.signing_by_project: dict[str, list[dict]] = defaultdict(list)
+        for rule in self.signing_authority:
+            for project_id in rule["project_ids"]:
+                self.signing_by_project[project_id].append(rule)
+
+        self.wiki_contracts = wiki_contracts
+        self.wiki_by_status = _index(wiki_contracts, "status")
+        self.wiki_by_category = _index(wiki_contracts, "category")
+        self.wiki_by_region = _index(wiki_contracts, "region_id")
+
+        self.countries = list(countries)
+        self.jurisdictions = list(jurisdictions)
+        self.governing_laws = list(governing_laws)
+        self.counterparties = list(counterparties)
+
+    def signing_rules(self, entity_id: str | None, project_id: str | None) -> list[dict]:
+        """Rules for an entity and/or project; rules linked to no project apply to every project."""
+        rules = self.signing_by_entity.get(entity_id, []) if entity_id else self.signing_authority
+        if project_id:
+            scoped = {id(r) for r in self.signing_by_project.get(project_id, [])}
+            rules = [r for r in rules if id(r) in scoped or not r["project_ids"]]
+        return rules
+
+    def wiki_templates(self, status: str, category: str | None, region_id: str | None) -> list[dict]:
+        candidates = [
+            self.wiki_by_status.get(status, []),
+            self.wiki_by_category.get(category, []) if category else None,
+            self.wiki_by_region.get(region_id, []) if region_id else None,
+        ]
+        smallest = min((c for c in candidates if c is not None), key=len)
+        return [
+            t for t in smallest
+            if t.get("status") == status
+            and (not category or t.get("category") == category)
+            and (not region_id or str(t.get("region_id")) == region_id)
+        ]
+
+
+async def load_reference_data() -> ReferenceData:
+    from app.deps import SessionLocal
+
+    async def rows(db, sql: str) -> list[dict]:
+        return [dict(r) for r in (await db.execute(text(sql))).mappings().all()]
+
+    async with SessionLocal() as db:
+        return ReferenceData(
+            regions=await rows(db, "SELECT * FROM regions"),
+            entities=await rows(db, "SELECT * FROM entities"),
+            signing_authority=await rows(db, "SELECT * FROM signing_authority"),
+            signing_authority_projects=await rows(
+                db, "SELECT signing_authority_id, project_id FROM signing_authority_project"
+            ),
+            wiki_contracts=await rows(
+                db,
+                "SELECT id, name, category, region_id, version, status, description FROM wiki_contracts",
+            ),
+            countries=await rows(db, "SELECT code, name FROM countries WHERE is_active = 1"),
+            jurisdictions=await rows(db, "SELECT id, name, country_code FROM jurisdictions WHERE is_active = 1"),
+            governing_laws=await rows(db, "SELECT id, name, country_code FROM governing_laws WHERE is_active = 1"),
+            counterparties=await rows(
+                db, "SELECT id, legal_name, registration_number, address, jurisdiction FROM counterparties"
+            ),
+        )
+
+
+class ReferenceCache:
+    def __init__(self, ttl_seconds: int, stamp_path: str):
+        self.ttl_seconds = ttl_seconds
+        self.stamp_path = stamp_path
+        self._data: ReferenceData | None = None
+        self._loaded_at = 0.0
+        self._loaded_stamp = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.last_refresh_ms = 0.0
+
+    def _stamp(self) -> float:
+        try:
+            return os.stat(self.stamp_path).st_mtime
+        except OSError:
+            return 0.0
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._data is not None
+            and time.monotonic() - self._loaded_at < self.ttl_seconds
+            and self._stamp() <= self._loaded_stamp
+        )
+
+    async def get(self) -> ReferenceData:
+        """The current snapshot, reloading it first when stale or invalidated."""
+        if self._is_fresh():
+            self.hits += 1
+            return self._data
+        self.misses += 1
+        async with self._lock:
+            if not self._is_fresh():
+                await self.refresh()
+        return self._data
+
+    async def refresh(self) -> None:
+        stamp = self._stamp()
+        start = time.perf_counter()
+        try:
+            data = await load_reference_data()
+        except Exception as e:
+            self.refresh_failures += 1
+            if self._data is None:
+                raise
+            # Serve the previous snapshot rather than failing tool calls; retry after the TTL.
+            logger.warning("reference_cache_refresh_failed", error=str(e))
+            self._loaded_at = time.monotonic()
+            return
+        self._data = data
+        self._loaded_at = time.monotonic()
+        self._loaded_stamp = stamp
+        self.refreshes += 1
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(
+            "reference_cache_refreshed",
+            elapsed_ms=self.last_refresh_ms,
+            regions=len(data.regions),
+            entities=len(data.entities),
+            signing_authority=len(data.signing_authority),
+            wiki_contracts=len(data.wiki_contracts),
+            counterparties=len(data.counterparties),
+        )
+
+    def invalidate(self) -> None:
+        """Mark every process's snapshot stale; each reloads on its next tool call."""
+        os.makedirs(os.path.dirname(self.stamp_path) or ".", exist_ok=True)
+        with open(self.stamp_path, "a"):
+            pass
+        now = time.time()
+        # Strictly newer than any snapshot loaded so far, even on coarse-mtime file systems.
+        os.utime(self.stamp_path, (now, max(now, self._loaded_stamp + 1)))
+        self._loaded_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "last_refresh_ms": self.last_refresh_ms,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._data is not None else None,
+        }
+
+
+reference_cache = ReferenceCache(
+    ttl_seconds=settings.reference_cache_ttl_seconds,
+    stamp_path=settings.reference_cache_stamp_path,
+)
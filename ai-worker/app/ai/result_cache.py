@@ -0,0 +1,196 @@
+"""
+Persistent cache of analysis results, keyed by (text hash, analysis type, model,
+prompt/tool-schema version, context). Re-running an analysis on an unchanged
+contract returns the stored result instead of calling Claude again.
+
+A per-process memory LRU sits in front of a durable tier that survives pod
+restarts: the ai_result_cache MySQL table, or a directory on a mounted volume.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime, timedelta
+
+import structlog
+from sqlalchemy import text
+
+from app.ai.schemas import AnalysisUsage
+from app.cache import DiskStore, MemoryLRU
+from app.config import settings
+
+logger = structlog.get_logger()
+
+
+def cache_key(
+    contract_text: str,
+    analysis_type: str,
+    model: str,
+    prompt_version: str,
+    context: dict | None = None,
+    tool_definitions: list[dict] | None = None,
+) -> str:
+    text_hash = hashlib.sha256(contract_text.encode("utf-8")).hexdigest()
+    tools_hash = hashlib.sha256(
+        json.dumps(tool_definitions or [], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    material = json.dumps(
+        [text_hash, analysis_type, model, prompt_version, tools_hash, context or {}],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _upsert_sql(dialect: str) -> str:
+    sql = (
+        "INSERT INTO ai_result_cache (cache_key, payload, hit_count, expires_at, last_used_at, created_at) "
+        "VALUES (:key, :payload, 0, :expires_at, :now, :now)"
+    )
+    if dialect == "mysql":
+        return (
+            f"{sql} ON DUPLICATE KEY UPDATE payload = VALUES(payload), expires_at = VALUES(expires_at), "
+            "last_used_at = VALUES(last_used_at)"
+        )
+    return (
+        f"{sql} ON CONFLICT (cache_key) DO UPDATE SET payload = excluded.payload, "
+        "expires_at = excluded.expires_at, last_used_at = excluded.last_used_at"
+    )
+
+
+def _evict_lru_sql(dialect: str) -> str:
+    if dialect == "mysql":
+        return "DELETE FROM ai_result_cache ORDER BY last_used_at ASC LIMIT :excess"
+    # SQLite (the local stand-in) is not built with DELETE ... LIMIT.
+    return (
+        "DELETE FROM ai_result_cache WHERE cache_key IN "
+        "(SELECT cache_key FROM ai_result_cache ORDER BY last_used_at ASC LIMIT :excess)"
+    )
+
+
+class MySQLResultStore:
+    """
+    Durable tier in the ai_result_cache table, bounded by row count (least recently used
+    first). The SQL follows the engine's dialect, so a SQLite stand-in works too.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._writes = 0
+
+    async def get(self, key: str) -> bytes | None:
+        from app.deps import SessionLocal
+        async with SessionLocal() as db:
+            payload = (await db.execute(
+                text("SELECT payload FROM ai_result_cache WHERE cache_key = :key AND expires_at > :now"),
+                {"key": key, "now": datetime.utcnow()},
+            )).scalar()
+            if payload is None:
+                return None
+            await db.execute(
+                text("UPDATE ai_result_cache SET last_used_at = :now, hit_count = hit_count + 1 "
+                     "WHERE cache_key = :key"),
+                {"key": key, "now": datetime.utcnow()},
+            )
+            await db.commit()
+            return payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+
+    async def put(self, key: str, data: bytes) -> None:
+        from app.deps import SessionLocal
+        now = datetime.utcnow()
+        async with SessionLocal() as db:
+            await db.execute(
+                text(_upsert_sql(db.get_bind().dialect.name)),
+                {
+                    "key": key,
+                    "payload": data.decode("utf-8"),
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                    "now": now,
+                },
+            )
+            self._writes += 1
+            if self._writes % 50 == 0:
+                await self._trim(db, now)
+            await db.commit()
+
+    async def _trim(self, db, now: datetime) -> None:
+        await db.execute(text("DELETE FROM ai_result_cache WHERE expires_at <= :now"), {"now": now})
+        count = (await db.execute(text("SELECT COUNT(*) FROM ai_result_cache"))).scalar() or 0
+        if count > self.max_entries:
+            await db.execute(
+                text(_evict_lru_sql(db.get_bind().dialect.name)),
+                {"excess": count - self.max_entries},
+            )
+
+
+class DiskResultStore:
+    """Durable tier in a directory (mount a volume to share it and survive restarts)."""
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int):
+        self.store = DiskStore(path, max_bytes, ttl_seconds)
+
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self.store.get, key)
+
+    async def put(self, key: str, data: bytes) -> None:
+        await asyncio.to_thread(self.store.put, key, data)
+
+
+class ResultCache:
+    def __init__(self, backend: str, ttl_seconds: int, memory_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryLRU(memory_bytes)
+        if backend == "mysql":
+            self.durable = MySQLResultStore(ttl_seconds, settings.result_cache_max_entries)
+        elif backend == "disk":
+            self.durable = DiskResultStore(settings.result_cache_path, settings.result_cache_disk_bytes, ttl_seconds)
+        else:
+            self.durable = None
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> tuple[dict, AnalysisUsage] | None:
+        entry = self.memory.get(key)
+        if entry is None and self.durable is not None:
+            try:
+                blob = await self.durable.get(key)
+            except Exception as e:
+                logger.warning("result_cache_read_failed", error=str(e))
+                blob = None
+            if blob is not None:
+                entry = json.loads(blob)
+                self.memory.put(key, entry, len(blob))
+        if entry is None or time.time() - entry["stored_at"] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        usage = AnalysisUsage(model_used=entry["model_used"], cache_hit=True)
+        return entry["result"], usage
+
+    async def put(self, key: str, result: dict, usage: AnalysisUsage) -> None:
+        entry = {"result": result, "model_used": usage.model_used, "stored_at": time.time()}
+        blob = json.dumps(entry, default=str).encode("utf-8")
+        self.memory.put(key, entry, len(blob))
+        if self.durable is not None:
+            try:
+                await self.durable.put(key, blob)
+            except Exception as e:
+                # The cache is an optimisation; never fail an analysis because it could not be stored.
+                logger.warning("result_cache_write_failed", error=str(e))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "memory": self.memory.stats()}
+
+
+result_cache = ResultCache(
+    backend=settings.result_cache_backend,
+    ttl_seconds=settings.result_cache_ttl_seconds,
+    memory_bytes=settings.result_cache_memory_bytes,
+)
+
+
+def is_cacheable(result: dict) -> bool:
+    """Failed, unparsed, partially failed chunked or budget-cut results are not worth replaying."""
+    return "error" not in result and "raw" not in result and "chunk_errors" not in result and "partial" not in result
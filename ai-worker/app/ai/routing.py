@@ -0,0 +1,139 @@
+"""
+Run an analysis on its routed model (app.ai.config.route_for) and escalate to the
+standard route when the fast model's result does not validate or reports a
+confidence below ai_escalation_min_confidence.
+"""
+
+import time
+from typing import Awaitable, Callable
+
+import structlog
+
+from app.ai.budget import BudgetExhausted
+from app.ai.config import ModelRoute
+from app.ai.local_discovery import DISCOVERY_TYPES
+from app.ai.schemas import AnalysisUsage
+from app.config import settings
+from app.metrics import model_route_duration, model_route_escalations
+
+logger = structlog.get_logger()
+
+RunFn = Callable[[ModelRoute], Awaitable[tuple[dict, AnalysisUsage]]]
+
+
+class RouteStats:
+    """Per-process request, escalation and latency counts by route and analysis type."""
+
+    def __init__(self):
+        self._routes: dict[str, dict] = {}
+
+    def _entry(self, route: str, analysis_type: str) -> dict:
+        return self._routes.setdefault(
+            f"{route}:{analysis_type}", {"requests": 0, "escalated": 0, "total_ms": 0}
+        )
+
+    def observe(self, route: str, analysis_type: str, elapsed_ms: int) -> None:
+        entry = self._entry(route, analysis_type)
+        entry["requests"] += 1
+        entry["total_ms"] += elapsed_ms
+
+    def escalated(self, route: str, analysis_type: str) -> None:
+        self._entry(route, analysis_type)["escalated"] += 1
+
+    def stats(self) -> dict:
+        return {
+            key: {
+                "requests": e["requests"],
+                "escalation_rate": round(e["escalated"] / e["requests"], 3) if e["requests"] else 0.0,
+                "avg_latency_ms": e["total_ms"] // e["requests"] if e["requests"] else 0,
+            }
+            for key, e in self._routes.items()
+        }
+
+
+route_stats = RouteStats()
+
+
+def _confidence(analysis_type: str, result: dict) -> float | None:
+    value = result.get("confidence")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if analysis_type == "discovery":
+        scores = [
+            d["confidence"] for d in result.get("discoveries") or []
+            if isinstance(d, dict) and isinstance(d.get("confidence"), (int, float))
+        ]
+        return sum(scores) / len(scores) if scores else None
+    return None
+
+
+def escalation_reason(analysis_type: str, result: dict) -> str | None:
+    """Why a fast-route result should be re-run on the standard route, or None to keep it."""
+    if result.get("partial"):
+        return None  # cut short by the request budget; a bigger model will not fit either
+    if "error" in result or "raw" in result:
+        return "invalid"
+    if analysis_type == "summary" and not str(result.get("summary") or "").strip():
+        return "invalid"
+    if analysis_type == "discovery":
+        # A contract always names at least one party, so an empty list is a miss.
+        discoveries = result.get("discoveries")
+        if not discoveries or not all(
+            isinstance(d, dict) and d.get("type") in DISCOVERY_TYPES and isinstance(d.get("data"), dict)
+            for d in discoveries
+        ):
+            return "invalid"
+    confidence = _confidence(analysis_type, result)
+    if confidence is not None and confidence < settings.ai_escalation_min_confidence:
+        return "low_confidence"
+    return None
+
+
+async def _attempt(route: ModelRoute, analysis_type: str, run: RunFn) -> tuple[dict, AnalysisUsage]:
+    start = time.perf_counter()
+    try:
+        return await run(route)
+    finally:
+        elapsed = time.perf_counter() - start
+        model_route_duration.labels(route=route.name, analysis_type=analysis_type).observe(elapsed)
+        route_stats.observe(route.name, analysis_type, int(elapsed * 1000))
+
+
+async def run_routed(route: ModelRoute, analysis_type: str, run: RunFn) -> tuple[dict, AnalysisUsage]:
+    """
+    run(route), then run(route.escalate_to) if the result calls for it. The escalated
+    usage includes both attempts. If the request budget cannot cover the escalation,
+    the fast result is kept.
+    """
+    result, usage = await _attempt(route, analysis_type, run)
+    if route.escalate_to is None:
+        return result, usage
+    reason = escalation_reason(analysis_type, result)
+    if reason is None:
+        return result, usage
+
+    target = route.escalate_to
+    logger.info(
+        "analysis_route_escalated",
+        analysis_type=analysis_type,
+        reason=reason,
+        from_model=route.model,
+        to_model=target.model,
+    )
+    model_route_escalations.labels(analysis_type=analysis_type, reason=reason).inc()
+    route_stats.escalated(route.name, analysis_type)
+    try:
+        escalated, escalated_usage = await _attempt(target, analysis_type, run)
+    except BudgetExhausted as e:
+        logger.warning("analysis_route_escalation_skipped", analysis_type=analysis_type, reason=str(e))
+        return result, usage
+    return escalated, AnalysisUsage(
+        input_tokens=usage.input_tokens + escalated_usage.input_tokens,
+        output_tokens=usage.output_tokens + escalated_usage.output_tokens,
+        cache_creation_input_tokens=usage.cache_creation_input_tokens + escalated_usage.cache_creation_input_tokens,
+        cache_read_input_tokens=usage.cache_read_input_tokens + escalated_usage.cache_read_input_tokens,
+        cost_usd=usage.cost_usd + escalated_usage.cost_usd,
+        processing_time_ms=usage.processing_time_ms + escalated_usage.processing_time_ms,
+        model_used=escalated_usage.model_used,
+        route=f"{route.name}>{target.name}",
+    )
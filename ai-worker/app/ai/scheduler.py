@@ -0,0 +1,410 @@
+"""
+Central scheduler every Claude call goes through (create_message / stream_message).
+
+- Per-process concurrency cap plus requests-per-minute and tokens-per-minute token
+  buckets. A call reserves its estimated input plus max_tokens; what the response's
+  usage shows was not used is refunded.
+- Waiting calls are served by priority (interactive before batch, FIFO within a
+  class). The priority comes from the X-AI-Priority request header via llm_priority.
+- 429, 529 and transient errors are retried with jittered exponential backoff that
+  honours retry-after; a 429 also pauses the whole queue for the retry-after.
+- When the wait queue is full, a call has waited longer than llm_max_wait_seconds or
+  Claude keeps rate limiting, LLMBusy is raised; the app serves it as 429 + Retry-After.
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import anthropic
+import structlog
+
+from app.ai.budget import current_budget, time_left
+from app.ai.client import get_client
+from app.ai.prompt_cache import cache_tokens
+from app.config import settings
+from app.metrics import llm_queue_wait, llm_request_duration, llm_requests_in_flight, llm_tokens, timed
+
+logger = structlog.get_logger()
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+llm_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+class LLMBusy(Exception):
+    """Raised when a Claude call is shed instead of queued; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Bucket:
+    """Token bucket refilled continuously at `per_minute`; a limit of 0 disables it."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount: int, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+        # A request larger than the whole budget goes once the bucket is full.
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: int) -> None:
+        if self.capacity:
+            self.level -= amount
+
+    def give(self, amount: int) -> None:
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+    priority_name: str = field(compare=False)
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        concurrency: int,
+        queue_size: int,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_wait: float,
+    ):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute)
+        self._heap: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        self._stats = {name: {"granted": 0, "shed": 0, "wait_total": 0.0, "wait_max": 0.0} for name in PRIORITIES}
+        self._latency: dict[str, float] = {}
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _waiting(self) -> list[_Waiter]:
+        return [w for w in self._heap if not w.future.done()]
+
+    def stats(self) -> dict:
+        waiting = self._waiting()
+        now = time.monotonic()
+        out = {
+            "in_flight": self._in_flight,
+            "concurrency": self.concurrency,
+            "queue_depth": len(waiting),
+            "queue_size": self.queue_size,
+            "oldest_wait_ms": round((now - min(w.enqueued for w in waiting)) * 1000) if waiting else 0,
+            "paused_ms": max(0, round((self._paused_until - now) * 1000)),
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+        for name, s in self._stats.items():
+            out[name] = {
+                "queued": sum(1 for w in waiting if w.priority_name == name),
+                "granted": s["granted"],
+                "shed": s["shed"],
+                "avg_wait_ms": round(s["wait_total"] / s["granted"] * 1000, 1) if s["granted"] else 0.0,
+                "max_wait_ms": round(s["wait_max"] * 1000, 1),
+            }
+        return out
+
+    def retry_after(self) -> int:
+        """Rough seconds until a new call could be served, for the Retry-After header."""
+        now = time.monotonic()
+        backlog = len(self._waiting()) / max(1, self.concurrency)
+        return max(1, math.ceil(max(self._paused_until - now, backlog)))
+
+    async def acquire(self, tokens: int, priority: str) -> None:
+        name = priority if priority in PRIORITIES else "interactive"
+        if len(self._waiting()) >= self.queue_size:
+            self._stats[name]["shed"] += 1
+            raise LLMBusy("Claude request queue is full", self.retry_after())
+        waiter = _Waiter(
+            PRIORITIES[name], next(self._seq), tokens,
+            asyncio.get_running_loop().create_future(), time.monotonic(), name,
+        )
+        heapq.heappush(self._heap, waiter)
+        self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, time_left(self.max_wait))
+        except asyncio.TimeoutError:
+            budget = current_budget()
+            if budget is not None and budget.remaining() <= 0:
+                raise budget.timed_out("the wait for a Claude request slot")
+            self._stats[name]["shed"] += 1
+            raise LLMBusy("Timed out waiting for a Claude request slot", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(tokens, None)  # granted just as the caller went away
+            raise
+
+    def release(self, reserved: int, used: int | None) -> None:
+        self._in_flight -= 1
+        if used is not None and used < reserved:
+            self._tokens.give(reserved - used)
+        self._dispatch()
+
+    def observe_latency(self, model: str, seconds: float) -> None:
+        """Moving average of call latency per model, used to judge whether a call fits a deadline."""
+        previous = self._latency.get(model)
+        self._latency[model] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def expected_seconds(self, model: str) -> float:
+        return self._latency.get(model, 0.0)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every queued call back, e.g. for a 429's retry-after."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        while self._heap:
+            waiter = self._heap[0]
+            if waiter.future.done():
+                heapq.heappop(self._heap)
+                continue
+            if self._in_flight >= self.concurrency:
+                return
+            delay = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(waiter.tokens, now),
+            )
+            if delay > 0:
+                self._wake_in(delay)
+                return
+            heapq.heappop(self._heap)
+            self._requests.take(1)
+            self._tokens.take(waiter.tokens)
+            self._in_flight += 1
+            stats = self._stats[waiter.priority_name]
+            waited = now - waiter.enqueued
+            stats["granted"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            llm_queue_wait.labels(priority=waiter.priority_name).observe(waited)
+            waiter.future.set_result(None)
+
+    def _wake_in(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+
+scheduler = LLMScheduler(
+    concurrency=settings.llm_concurrency,
+    queue_size=settings.llm_queue_size,
+    requests_per_minute=settings.llm_requests_per_minute,
+    tokens_per_minute=settings.llm_tokens_per_minute,
+    max_wait=settings.llm_max_wait_seconds,
+)
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Budget reserved for a call: prompt size at ~4 characters per token, plus max_tokens."""
+    prompt = {k: kwargs.get(k) for k in ("system", "messages", "tools")}
+    return len(json.dumps(prompt, default=str)) // 4 + int(kwargs.get("max_tokens", 0))
+
+
+def _record_usage(model: str, usage) -> int | None:
+    """
+    Record a response's tokens (metrics, request budget) and return the number that
+    counts against the tokens-per-minute budget.
+    """
+    if usage is None:
+        return None
+    budget = current_budget()
+    if budget is not None:
+        budget.charge(model, usage)
+    creation, read = cache_tokens(usage)
+    for kind, count in (
+        ("input", usage.input_tokens), ("output", usage.output_tokens),
+        ("cache_creation", creation), ("cache_read", read),
+    ):
+        if count:
+            llm_tokens.labels(model=model, type=kind).inc(count)
+    # Cache reads do not count towards the input-tokens rate limit.
+    return (usage.input_tokens or 0) + (usage.output_tokens or 0) + creation
+
+
+def _retry_after_header(error: Exception) -> float | None:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return max(0.0, float(headers[name]) * scale)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying `error`; raises (LLMBusy for rate limits) when it should not be retried."""
+    status = getattr(error, "status_code", None)
+    if isinstance(error, anthropic.APIConnectionError):
+        retryable = True
+    elif isinstance(error, anthropic.APIStatusError):
+        retryable = status in (408, 409, 429) or status >= 500
+    else:
+        retryable = False
+    retry_after = _retry_after_header(error)
+    if status == 429:
+        scheduler.rate_limited += 1
+        scheduler.pause(retry_after if retry_after is not None else settings.llm_backoff_base_seconds)
+    if not retryable or attempt >= settings.llm_max_retries:
+        if status in (429, 529):
+            raise LLMBusy("Claude is rate limited or overloaded", max(1, math.ceil(retry_after or 1))) from error
+        raise error
+    scheduler.retries += 1
+    if retry_after is not None:
+        delay = retry_after * random.uniform(1.0, 1.2)
+    else:
+        backoff = min(settings.llm_backoff_max_seconds, settings.llm_backoff_base_seconds * 2 ** attempt)
+        delay = backoff / 2 + random.uniform(0, backoff / 2)
+    logger.warning("llm_call_retry", status=status, attempt=attempt + 1, delay_s=round(delay, 2), error=str(error)[:200])
+    return delay
+
+
+async def create_message(**kwargs: Any):
+    """client.messages.create(**kwargs), scheduled, retried and held to the request budget."""
+    reserved = estimate_tokens(kwargs)
+    model = str(kwargs.get("model"))
+    for attempt in itertools.count():
+        _require_budget(model, kwargs, reserved)
+        await scheduler.acquire(reserved, llm_priority.get())
+        used = None
+        llm_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            timeout = _call_timeout("a Claude call")
+            with timed(llm_request_duration, model=model, kind="create", outcome="ok"):
+                try:
+                    message = await asyncio.wait_for(get_client().messages.create(**kwargs), timeout=timeout)
+                except asyncio.TimeoutError:
+                    raise current_budget().timed_out("a Claude call")
+            scheduler.observe_latency(model, time.perf_counter() - start)
+            used = _record_usage(model, message.usage)
+            return message
+        except Exception as e:
+            delay = _retry_delay(e, attempt)
+        finally:
+            llm_requests_in_flight.dec()
+            scheduler.release(reserved, used)
+        _sleep_fits_budget(delay)
+        await asyncio.sleep(delay)
+
+
+@asynccontextmanager
+async def stream_message(**kwargs: Any) -> AsyncIterator[Any]:
+    """
+    client.messages.stream(**kwargs), scheduled and held to the request budget. Opening
+    the stream is retried; an error after text has started arriving is not. At the
+    deadline the stream is closed and BudgetExhausted raised in the consuming block.
+    """
+    reserved = estimate_tokens(kwargs)
+    model = str(kwargs.get("model"))
+    for attempt in itertools.count():
+        _require_budget(model, kwargs, reserved)
+        await scheduler.acquire(reserved, llm_priority.get())
+        start = time.perf_counter()
+        try:
+            timeout = _call_timeout("opening a Claude stream")
+            manager = get_client().messages.stream(**kwargs)
+            stream = await asyncio.wait_for(manager.__aenter__(), timeout=timeout)
+            break
+        except BaseException as e:
+            scheduler.release(reserved, None)
+            llm_request_duration.labels(model=model, kind="stream", outcome="error").observe(time.perf_counter() - start)
+            if isinstance(e, asyncio.TimeoutError):
+                raise current_budget().timed_out("opening a Claude stream")
+            if not isinstance(e, Exception):
+                raise
+            delay = _retry_delay(e, attempt)
+        _sleep_fits_budget(delay)
+        await asyncio.sleep(delay)
+
+    llm_requests_in_flight.inc()
+    outcome = "ok"
+    budget = current_budget()
+    deadline = asyncio.timeout(budget.remaining() if budget is not None else None)
+    try:
+        async with deadline:
+            yield stream
+    except BaseException as e:
+        outcome = "error"
+        await manager.__aexit__(type(e), e, e.__traceback__)
+        if isinstance(e, TimeoutError) and deadline.expired():
+            raise budget.timed_out("a streamed Claude call") from e
+        raise
+    else:
+        await manager.__aexit__(None, None, None)
+        scheduler.observe_latency(model, time.perf_counter() - start)
+    finally:
+        llm_requests_in_flight.dec()
+        llm_request_duration.labels(model=model, kind="stream", outcome=outcome).observe(time.perf_counter() - start)
+        try:
+            used = _record_usage(model, stream.current_message_snapshot.usage)
+        except Exception:
+            used = None
+        scheduler.release(reserved, used)
+
+
+def _call_timeout(what: str) -> float | None:
+    """
+    Timeout for a Claude call: the time left to the request's deadline, or None without
+    one. Raises when the deadline passed while the call waited in the queue.
+    """
+    remaining = time_left(math.inf)
+    if remaining <= 0:
+        raise current_budget().timed_out(what)
+    return None if math.isinf(remaining) else remaining
+
+
+def _require_budget(model: str, kwargs: dict, reserved: int) -> None:
+    """Refuse a call the request's remaining time, tokens or money cannot cover (worst case)."""
+    budget = current_budget()
+    if budget is not None:
+        max_tokens = int(kwargs.get("max_tokens", 0))
+        budget.require("another Claude call", model, reserved - max_tokens, max_tokens, scheduler.expected_seconds(model))
+
+
+def _sleep_fits_budget(delay: float) -> None:
+    budget = current_budget()
+    if budget is not None and delay >= budget.remaining():
+        raise budget.timed_out("retry backoff")
+
+
+async def stream_text(on_text: Callable[[str], Awaitable[None]], **kwargs: Any):
+    """Scheduled streaming call awaiting on_text(delta) for each text delta; returns the final message."""
+    async with stream_message(**kwargs) as stream:
+        async for text in stream.text_stream:
+            await on_text(text)
+        return await stream.get_final_message()
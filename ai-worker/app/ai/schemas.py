@@ -6,9 +6,13 @@ from typing import Any, Optional
 class AnalysisUsage(BaseModel):
     input_tokens: int = 0
     output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
     cost_usd: float = 0.0
     processing_time_ms: int = 0
     model_used: str = ""
+    route: str = ""  # model route (app.ai.config); "fast>standard" when escalated
+    cache_hit: bool = False
 
 
 class SummaryResult(BaseModel):
@@ -1,17 +1,15 @@
 """Generate workflow template stages using AI."""
 import json
-import anthropic
+import time
+from typing import Awaitable, Callable
+
 from app.config import settings
+from app.ai.budget import usage_cost
+from app.ai.scheduler import create_message, stream_text
+from app.ai.schemas import AnalysisUsage
 
 
-async def generate_workflow(
-    description: str,
-    region_id: str | None = None,
-    entity_id: str | None = None,
-    project_id: str | None = None,
-):
-    """Generate workflow stages from a description. Returns dict with 'stages' list."""
-    client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key)
+def _request(description: str, region_id: str | None, entity_id: str | None, project_id: str | None) -> dict:
     prompt = f"Generate a contract approval workflow with stages (name, order, approver_role, sla_hours, required). Description: {description}"
     if region_id:
         prompt += f" Region ID: {region_id}"
@@ -20,13 +18,47 @@ async def generate_workflow(
     if project_id:
         prompt += f" Project ID: {project_id}"
     prompt += "\nReturn only a JSON object with a 'stages' array. Each stage: name, order (int), approver_role, sla_hours (int), required (bool)."
-    msg = await client.messages.create(
-        model=settings.ai_model,
-        max_tokens=2048,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    return {
+        "model": settings.ai_model,
+        "max_tokens": 2048,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+
+def _parse(msg) -> dict:
     out = msg.content[0].text if msg.content and hasattr(msg.content[0], "text") else "{}"
     try:
         return json.loads(out)
     except json.JSONDecodeError:
         return {"stages": [{"name": "Review", "order": 1, "approver_role": "legal", "sla_hours": 24, "required": True}]}
+
+
+async def generate_workflow(
+    description: str,
+    region_id: str | None = None,
+    entity_id: str | None = None,
+    project_id: str | None = None,
+):
+    """Generate workflow stages from a description. Returns dict with 'stages' list."""
+    msg = await create_message(**_request(description, region_id, entity_id, project_id))
+    return _parse(msg)
+
+
+async def stream_workflow(
+    on_text: Callable[[str], Awaitable[None]],
+    description: str,
+    region_id: str | None = None,
+    entity_id: str | None = None,
+    project_id: str | None = None,
+) -> tuple[dict, AnalysisUsage]:
+    """Like generate_workflow, but streamed: on_text is awaited with each text delta. Returns (result, usage)."""
+    start = time.perf_counter()
+    msg = await stream_text(on_text, **_request(description, region_id, entity_id, project_id))
+    usage = AnalysisUsage(
+        input_tokens=msg.usage.input_tokens if msg.usage else 0,
+        output_tokens=msg.usage.output_tokens if msg.usage else 0,
+        cost_usd=usage_cost(settings.ai_model, msg.usage),
+        processing_time_ms=int((time.perf_counter() - start) * 1000),
+        model_used=settings.ai_model,
+    )
+    return _parse(msg), usage
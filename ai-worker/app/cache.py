@@ -0,0 +1,161 @@
+"""
+Small two-tier cache building blocks: a size-bounded in-memory LRU and a
+size-bounded on-disk store. Used for extracted contract text.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class MemoryLRU:
+    """In-memory LRU bounded by the total byte size of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+    def stats(self) -> dict:
+        return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+class DiskStore:
+    """
+    Directory of blobs bounded by total size. A file's mtime is its write time
+    (what the TTL is measured from) and its atime its last use: reads set the
+    atime explicitly, so eviction drops the least recently used blobs first even
+    on noatime mounts. Writes are atomic (temp file + rename), so several worker
+    processes can share one directory.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int | None = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._approx_bytes: int | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def get(self, key: str) -> bytes | None:
+        path = self._file(key)
+        try:
+            written = os.stat(path).st_mtime
+            if self.ttl_seconds is not None and time.time() - written > self.ttl_seconds:
+                self.delete(key)
+                self.misses += 1
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, (time.time(), written))
+            self.hits += 1
+            return data
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._file(key))
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_size()
+            else:
+                self._approx_bytes += len(data)
+            if self._approx_bytes > self.max_bytes:
+                self._approx_bytes = self._evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.startswith(".tmp-"):
+                        st = entry.stat()
+                        entries.append((st.st_atime, st.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> int:
+        """Delete least recently used blobs until the store is back under 90% of its bound."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        logger.info("disk_store_evicted", path=self.path, removed=removed, bytes=total)
+        return total
+
+    def stats(self) -> dict:
+        return {"bytes": self._approx_bytes, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,162 @@
+"""
+Clause segmentation and local contract-to-template alignment.
+
+Contracts on template paper mostly repeat the template verbatim. Both texts are
+split into clauses, each clause is fingerprinted (hash of its normalised text
+plus a set of word shingles), and contract clauses are matched to template
+clauses through an inverted shingle index. Exact and near-exact matches are
+settled locally; only the rest needs a model to judge.
+"""
+
+import hashlib
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+
+from app.cache import MemoryLRU
+from app.config import settings
+
+# Start of a line that opens a clause: "12.", "4.2", "4.2.1", "Clause 7", "ARTICLE IV", "Schedule 2".
+# A bare number ("15 days ...") is not a heading: wrapped PDF lines often start with one.
+CLAUSE_HEADING = re.compile(
+    r"^[ \t]*(?:\d+\.(?:\d+\.?)*[ \t]+\S"
+    r"|(?:clause|article|section|schedule|annex|appendix|part)\b[ \t]*[\dIVXLC]+)",
+    re.IGNORECASE | re.MULTILINE,
+)
+_NUMBERING = re.compile(
+    r"^\s*(?:(?:clause|article|section|schedule|annex|appendix|part)\s*[\dIVXLC]+[.:]?|\d+(?:\.\d+)*\.?)\s*",
+    re.IGNORECASE,
+)
+SHINGLE_SIZE = 3
+
+
+@dataclass
+class Clause:
+    index: int
+    heading: str
+    text: str
+    digest: str = ""
+    shingles: frozenset = field(default_factory=frozenset)
+
+
+def normalise(text: str) -> str:
+    """Lower-cased words only, without the leading clause number, so renumbering and
+    whitespace or punctuation changes do not count as differences."""
+    return " ".join(re.findall(r"\w+", _NUMBERING.sub("", text, count=1).lower()))
+
+
+def _fingerprint(clause: Clause) -> Clause:
+    words = normalise(clause.text).split()
+    clause.digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+    if len(words) < SHINGLE_SIZE:
+        clause.shingles = frozenset([" ".join(words)]) if words else frozenset()
+    else:
+        clause.shingles = frozenset(
+            " ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)
+        )
+    return clause
+
+
+def segment_clauses(text: str) -> list[Clause]:
+    """Split text at clause headings (or, when there are none, at blank lines)."""
+    starts = [m.start() for m in CLAUSE_HEADING.finditer(text)]
+    if len(starts) < 2:
+        starts = [0] + [m.end() for m in re.finditer(r"\n[ \t]*\n", text)]
+    elif starts[0] > 0:
+        starts.insert(0, 0)  # preamble before the first heading
+    clauses: list[Clause] = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        body = text[start:end].strip()
+        if not body:
+            continue
+        heading = body.split("\n", 1)[0].strip()[:255]
+        clauses.append(_fingerprint(Clause(len(clauses), heading, body)))
+    return clauses
+
+
+class ClauseIndex:
+    """Template clauses with lookup by normalised hash and by shingle."""
+
+    def __init__(self, clauses: list[Clause]):
+        self.clauses = clauses
+        self.by_digest: dict[str, list[int]] = defaultdict(list)
+        self.by_shingle: dict[str, list[int]] = defaultdict(list)
+        for clause in clauses:
+            self.by_digest[clause.digest].append(clause.index)
+            for shingle in clause.shingles:
+                self.by_shingle[shingle].append(clause.index)
+
+    def best_match(self, clause: Clause, exclude: set[int]) -> tuple[int | None, float]:
+        """Most similar template clause by shingle Jaccard similarity, ignoring `exclude`."""
+        for index in self.by_digest.get(clause.digest, []):
+            if index not in exclude:
+                return index, 1.0
+        shared: Counter = Counter()
+        for shingle in clause.shingles:
+            for index in self.by_shingle.get(shingle, ()):
+                if index not in exclude:
+                    shared[index] += 1
+        best, best_score = None, 0.0
+        for index, count in shared.items():
+            union = len(clause.shingles) + len(self.clauses[index].shingles) - count
+            score = count / union if union else 0.0
+            if score > best_score:
+                best, best_score = index, score
+        return best, best_score
+
+
+_template_indexes = MemoryLRU(settings.redline_template_cache_bytes)
+
+
+def template_index(template_text: str) -> ClauseIndex:
+    """Parsed clause index of a template, cached by the template's SHA-256."""
+    key = hashlib.sha256(template_text.encode("utf-8")).hexdigest()
+    index = _template_indexes.get(key)
+    if index is None:
+        index = ClauseIndex(segment_clauses(template_text))
+        # Clause texts plus shingle sets come to roughly three times the raw text.
+        _template_indexes.put(key, index, len(template_text) * 3)
+    return index
+
+
+def template_cache_stats() -> dict:
+    return _template_indexes.stats()
+
+
+@dataclass
+class Alignment:
+    # (contract clause, template clause, similarity) for every contract clause, in contract
+    # order; the template clause is None when nothing in the template is similar enough.
+    pairs: list[tuple[Clause, Clause | None, float]]
+    # Template clauses no contract clause was matched to (candidate deletions).
+    unmatched_template: list[Clause]
+
+
+def align(contract_text: str, template_text: str) -> Alignment:
+    """
+    Match contract clauses to template clauses: identical (normalised) clauses first,
+    then, in contract order, each remaining clause takes its most similar unused
+    template clause if the similarity reaches redline_candidate_similarity.
+    """
+    contract = segment_clauses(contract_text)
+    index = template_index(template_text)
+    used: set[int] = set()
+    matches: dict[int, tuple[int, float]] = {}
+    for clause in contract:
+        exact = next((i for i in index.by_digest.get(clause.digest, []) if i not in used), None)
+        if exact is not None:
+            used.add(exact)
+            matches[clause.index] = (exact, 1.0)
+    for clause in contract:
+        if clause.index in matches:
+            continue
+        match, score = index.best_match(clause, used)
+        if match is not None and score >= settings.redline_candidate_similarity:
+            used.add(match)
+            matches[clause.index] = (match, score)
+
+    pairs = []
+    for clause in contract:
+        match, score = matches.get(clause.index, (None, 0.0))
+        pairs.append((clause, index.clauses[match] if match is not None else None, score))
+    return Alignment(pairs, [c for c in index.clauses if c.index not in used])
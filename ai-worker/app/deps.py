@@ -1,14 +1,89 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+"""
+Async database engine and session dependency.
+
+DB_URL may name a sync driver (mysql+pymysql://, sqlite://); it is mapped to
+the matching asyncio driver (aiomysql, aiosqlite), so existing deployments keep
+their configuration. A local SQLite file works as a stand-in for MySQL in tests.
+"""
+
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
 from .config import settings
 
-engine = create_engine(settings.db_url, pool_pre_ping=True, pool_recycle=3600)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+_ASYNC_DRIVERS = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_db_url(url: str):
+    parsed = make_url(url)
+    return parsed.set(drivername=_ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername))
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait to check out a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
 
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
 
-def get_db():
-    db = SessionLocal()
-    try:
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep the accumulated wait figures.
+        new = super().recreate()
+        new.checkouts, new.checkout_timeouts = self.checkouts, self.checkout_timeouts
+        new.wait_total, new.wait_max = self.wait_total, self.wait_max
+        return new
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            "checkouts": self.checkouts,
+            "checkout_timeouts": self.checkout_timeouts,
+            "checkout_wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 2) if self.checkouts else 0.0,
+            "checkout_wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+engine = create_async_engine(
+    async_db_url(settings.db_url),
+    poolclass=TimedQueuePool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def pool_stats() -> dict:
+    return engine.pool.stats()
+
+
+async def close_engine() -> None:
+    await engine.dispose()
@@ -0,0 +1,294 @@
+"""
+Contract text extraction — PyMuPDF / python-docx parsing in a bounded process pool
+so large documents never hold the GIL or the event loop of the API process.
+"""
+
+import asyncio
+import bisect
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Iterable
+
+import structlog
+from pydantic import BaseModel
+
+from app.ai.budget import current_budget, time_left
+from app.config import settings
+from app.metrics import extraction_bytes, extraction_duration, timed
+
+logger = structlog.get_logger()
+
+
+class ExtractionError(Exception):
+    """Base error for extraction pool failures."""
+
+
+class ExtractionQueueFull(ExtractionError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class ExtractionTimeout(ExtractionError):
+    """Raised when a single document exceeds the per-job timeout."""
+
+
+def page_at(page_offsets: list[int], position: int) -> int:
+    """1-based number of the page containing character `position`."""
+    return max(1, bisect.bisect_right(page_offsets, position))
+
+
+class ExtractedText(BaseModel):
+    """
+    Extracted document text plus the character offset at which each page starts.
+    `complete` is False when extraction stopped early at a character budget;
+    `total_pages` is then the page count of the whole file.
+    """
+    content_hash: str = ""
+    file_type: str
+    text: str
+    page_offsets: list[int] = [0]
+    complete: bool = True
+    total_pages: int | None = None
+
+    @property
+    def page_count(self) -> int:
+        return len(self.page_offsets)
+
+    def page_at(self, position: int) -> int:
+        return page_at(self.page_offsets, position)
+
+    def covers(self, max_chars: int | None) -> bool:
+        """Whether this text serves a consumer that reads max_chars characters (None = all)."""
+        return self.complete or (max_chars is not None and len(self.text) >= max_chars)
+
+
+def file_type_for(file_name: str) -> str:
+    name = file_name.lower()
+    if name.endswith(".pdf"):
+        return "pdf"
+    if name.endswith((".docx", ".doc")):
+        return "docx"
+    return "text"
+
+
+def _join_pages(pages: Iterable[str], max_chars: int | None = None) -> tuple[str, list[int]]:
+    """
+    Join pages with newlines, recording where each starts. Pages are pulled lazily and
+    none is pulled after the one that reaches max_chars.
+    """
+    parts = []
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        parts.append(page)
+        position += len(page) + 1
+        if max_chars is not None and position >= max_chars:
+            break
+    return "\n".join(parts), offsets or [0]
+
+
+def extract_document(source: bytes | str, file_name: str, max_chars: int | None = None) -> ExtractedText:
+    """
+    Extract text from PDF or DOCX, recording where each PDF page starts. `source` is
+    either the file bytes or a path; paths are memory-mapped rather than read whole,
+    so a worker's peak memory stays close to the file size. With max_chars, pages
+    after the one that reaches that many characters are never parsed.
+    """
+    file_type = file_type_for(file_name)
+    if isinstance(source, bytes):
+        return _extract(source, file_type, max_chars)
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ExtractedText(file_type=file_type, text="")
+        if file_type == "docx":
+            # python-docx's zipfile reads only the members it needs straight from the file.
+            return _extract(f, file_type, max_chars)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _extract(mapped, file_type, max_chars)
+
+
+def _decode(data: bytes | mmap.mmap | BinaryIO) -> str:
+    if hasattr(data, "seekable"):
+        data.seek(0)
+        data = data.read()
+    return bytes(data).decode("utf-8", errors="ignore")
+
+
+def _extract(data: bytes | mmap.mmap | BinaryIO, file_type: str, max_chars: int | None = None) -> ExtractedText:
+    if file_type == "pdf":
+        try:
+            import fitz
+            view = memoryview(data)
+            try:
+                with fitz.open(stream=view, filetype="pdf") as doc:
+                    pages = (doc.load_page(number).get_text() for number in range(doc.page_count))
+                    text, offsets = _join_pages(pages, max_chars)
+                    total_pages = doc.page_count
+            finally:
+                view.release()
+            complete = len(offsets) >= total_pages
+            return ExtractedText(
+                file_type=file_type,
+                text=text,
+                page_offsets=offsets,
+                complete=complete,
+                total_pages=None if complete else total_pages,
+            )
+        except Exception:
+            return ExtractedText(file_type=file_type, text=_decode(data))
+    if file_type == "docx":
+        try:
+            import docx
+            from io import BytesIO
+            doc = docx.Document(BytesIO(data) if isinstance(data, bytes) else data)
+            # python-docx parses the whole document up front, so max_chars would save nothing here.
+            return ExtractedText(file_type=file_type, text="\n".join(p.text for p in doc.paragraphs))
+        except Exception:
+            return ExtractedText(file_type=file_type, text=_decode(data))
+    return ExtractedText(file_type=file_type, text=_decode(data))
+
+
+class ExtractionPool:
+    """
+    Process pool with a bounded wait queue, per-job timeout and worker recycling.
+
+    A job that times out cannot be stopped without killing its worker, and killing any
+    worker breaks the whole executor (failing the jobs its siblings are running). So
+    a timed-out job is abandoned: its worker runs on and keeps the job's slot until it
+    ends. Only when every worker is stuck on an abandoned job is the pool restarted,
+    which kills nothing but those jobs.
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float, max_tasks_per_child: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor: ProcessPoolExecutor | None = None
+        # One permit per worker so the job timeout only starts once a worker picks the job up.
+        self._slots = asyncio.Semaphore(workers)
+        self._pending = 0
+        self._abandoned: set[Future] = set()
+
+    def start(self) -> None:
+        if self._executor is None:
+            # spawn: forking a process that already runs an event loop and HTTP pools is unsafe,
+            # and max_tasks_per_child requires a non-fork start method anyway.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+            logger.info(
+                "extraction_pool_started",
+                workers=self.workers,
+                queue_size=self.queue_size,
+                max_tasks_per_child=self.max_tasks_per_child,
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _restart(self) -> None:
+        """
+        Kill the current workers and start fresh ones. Called only when the executor is
+        already broken or every worker is stuck on an abandoned job, so no live job is lost.
+        """
+        executor = self._executor
+        self._executor = None
+        if executor is not None:
+            for process in list(getattr(executor, "_processes", {}).values()):
+                process.terminate()
+            executor.shutdown(wait=False, cancel_futures=True)
+        for future in list(self._abandoned):
+            self._abandoned_ended(future)
+        self.start()
+
+    def _abandon(self, future: Future) -> None:
+        """Leave a timed-out job to its worker; its slot is released when the job ends."""
+        self._abandoned.add(future)
+        loop = asyncio.get_running_loop()
+
+        def ended(f: Future) -> None:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._abandoned_ended, f)
+
+        future.add_done_callback(ended)
+        if len(self._abandoned) >= self.workers:
+            logger.warning("extraction_pool_wedged", stuck_jobs=len(self._abandoned))
+            self._restart()
+
+    def _abandoned_ended(self, future: Future) -> None:
+        if future in self._abandoned:
+            self._abandoned.discard(future)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "stuck": len(self._abandoned),
+        }
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in a worker process, honouring the queue bound and job timeout."""
+        self.start()
+        if self._pending >= self.workers + self.queue_size:
+            raise ExtractionQueueFull("Extraction queue is full")
+        self._pending += 1
+        try:
+            await self._slots.acquire()
+            release = True
+            try:
+                budget = current_budget()
+                if budget is not None:
+                    budget.check("text extraction")
+                timeout = time_left(self.timeout)
+                for attempt in (1, 2):
+                    future = self._executor.submit(fn, *args)
+                    try:
+                        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        release = False
+                        self._abandon(future)
+                        if timeout < self.timeout:
+                            raise budget.timed_out("text extraction")
+                        logger.warning("extraction_timeout", timeout=self.timeout)
+                        raise ExtractionTimeout(f"Text extraction exceeded {self.timeout}s")
+                    except BrokenProcessPool:
+                        # An OOM kill (or a wedged-pool restart) took the pool down; retry once.
+                        if attempt == 2:
+                            raise
+                        logger.warning("extraction_pool_broken_retrying")
+                        if self._executor is None or getattr(self._executor, "_broken", False):
+                            self._restart()
+            finally:
+                if release:
+                    self._slots.release()
+        finally:
+            self._pending -= 1
+
+    async def extract(self, source: bytes | str, file_name: str, max_chars: int | None = None) -> ExtractedText:
+        """
+        Extract from bytes, or from a file path (only the path crosses the process boundary),
+        stopping after the page that reaches max_chars (None = the whole document).
+        """
+        file_type = file_type_for(file_name)
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        extraction_bytes.labels(file_type=file_type).observe(size)
+        with timed(extraction_duration, file_type=file_type, outcome="ok"):
+            return await self.run(extract_document, source, file_name, max_chars)
+
+
+extraction_pool = ExtractionPool(
+    workers=settings.extraction_workers,
+    queue_size=settings.extraction_queue_size,
+    timeout=settings.extraction_timeout,
+    max_tasks_per_child=settings.extraction_max_tasks_per_child,
+)
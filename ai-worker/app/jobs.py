@@ -0,0 +1,404 @@
+"""
+Asynchronous job mode for the long-running endpoints.
+
+A request sent with `Prefer: respond-async` gets 202 Accepted and a job id at
+once; the work runs in this process's bounded job pool. Job state is a JSON file
+in a shared directory, so GET /jobs/{id} answers from any uvicorn worker. An
+`Idempotency-Key` header maps resubmissions to the existing job, and an optional
+`X-Callback-Url` receives the finished job, signed with the worker secret.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlparse
+
+import httpx
+import structlog
+from fastapi import Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.ai.budget import BudgetExhausted, current_budget, start_budget
+from app.ai.scheduler import LLMBusy
+from app.config import settings
+
+logger = structlog.get_logger()
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+_current_job: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_job", default=None)
+# Per running job: when its progress was last written, and the fields reported since.
+_progress: dict[str, tuple[float, dict]] = {}
+
+
+class JobQueueFull(Exception):
+    """Raised when every job worker is busy and the wait queue is full."""
+
+
+def report_progress(**progress: Any) -> None:
+    """
+    Merge progress fields into the job running the current task; a no-op outside a job.
+    The job file is rewritten at most every jobs_progress_interval seconds (and on a
+    stage change); fields reported in between are held and go out with the next write
+    or when the job finishes.
+    """
+    job_id = _current_job.get()
+    if job_id is None:
+        return
+    written, unsaved = _progress.get(job_id, (0.0, {}))
+    unsaved = {**unsaved, **progress}
+    now = time.monotonic()
+    if "stage" not in progress and now - written < settings.jobs_progress_interval:
+        _progress[job_id] = (written, unsaved)
+        return
+    _progress[job_id] = (now, {})
+    job = job_store.get(job_id)
+    if job is not None:
+        job["progress"] = {**job.get("progress", {}), **unsaved}
+        job_store.save(job)
+
+
+class JobStore:
+    """
+    One JSON file per job plus one file per idempotency key, in a directory shared
+    by all worker processes. Writes are atomic (temp file + rename); finished jobs
+    expire `ttl_seconds` after completion.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._last_sweep = 0.0
+
+    def _file(self, job_id: str) -> str:
+        return os.path.join(self.path, f"{job_id}.json")
+
+    def _key_file(self, key: str) -> str:
+        return os.path.join(self.path, f"key-{hashlib.sha256(key.encode('utf-8')).hexdigest()}")
+
+    def get(self, job_id: str) -> dict | None:
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._file(job_id), "rb") as f:
+                job = json.loads(f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if job.get("expires_at") is not None and job["expires_at"] < time.time():
+            self.delete(job_id)
+            return None
+        return job
+
+    def save(self, job: dict) -> None:
+        job["updated_at"] = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(job).encode("utf-8"))
+            os.replace(tmp, self._file(job["id"]))
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def delete(self, job_id: str) -> None:
+        try:
+            os.unlink(self._file(job_id))
+        except FileNotFoundError:
+            pass
+
+    def claim_key(self, key: str, job_id: str) -> str:
+        """
+        Bind an idempotency key to job_id unless it already names a live job; returns the
+        job id the key belongs to. O_EXCL makes the first of two racing workers win.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        path = self._key_file(key)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(path) as f:
+                        existing = f.read().strip()
+                except FileNotFoundError:
+                    continue
+                if existing and (self.get(existing) is not None or self._recent(path)):
+                    # A key claimed moments ago may belong to a job another worker is still saving.
+                    return existing
+                # The key's job expired (or its file was never written): take the key over.
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(job_id)
+            return job_id
+        return job_id
+
+    def release_key(self, key: str, job_id: str) -> None:
+        """Drop an idempotency key claimed for a job that was never created."""
+        path = self._key_file(key)
+        try:
+            with open(path) as f:
+                if f.read().strip() != job_id:
+                    return
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _recent(path: str, seconds: float = 60.0) -> bool:
+        try:
+            return time.time() - os.path.getmtime(path) < seconds
+        except FileNotFoundError:
+            return False
+
+    def sweep(self, interval: float = 300.0) -> int:
+        """Delete files untouched for longer than the TTL, at most once per `interval` seconds."""
+        now = time.time()
+        if now - self._last_sweep < interval:
+            return 0
+        self._last_sweep = now
+        removed = 0
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file() and now - entry.stat().st_mtime > self.ttl_seconds:
+                            os.unlink(entry.path)
+                            removed += 1
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            pass
+        return removed
+
+
+def public_view(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "idempotency_key"}
+
+
+def sign_payload(body: bytes, timestamp: str) -> str:
+    """HMAC-SHA256 over "<timestamp>.<body>" with the worker secret, as sent in X-AI-Worker-Signature."""
+    digest = hmac.new(
+        settings.ai_worker_secret.encode("utf-8"), timestamp.encode("utf-8") + b"." + body, hashlib.sha256
+    ).hexdigest()
+    return f"sha256={digest}"
+
+
+class JobPool:
+    """Bounded in-process pool of async jobs whose state lives in a JobStore."""
+
+    def __init__(self, store: JobStore, workers: int, queue_size: int, timeout: float):
+        self.store = store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(workers)
+        self._pending = 0
+        self._running = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "running": self._running,
+        }
+
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[], Awaitable[Any]],
+        callback_url: str | None = None,
+        idempotency_key: str | None = None,
+    ) -> tuple[dict, bool]:
+        """Start a job, or return the live job already holding idempotency_key. Returns (job, created)."""
+        self.store.sweep()
+        job_id = uuid.uuid4().hex
+        key = f"{kind}:{idempotency_key}" if idempotency_key else None
+        if key:
+            # A retry gets its existing job back even when the queue is full.
+            claimed = self.store.claim_key(key, job_id)
+            if claimed != job_id:
+                return self.store.get(claimed) or {"id": claimed, "status": "queued"}, False
+        if self._pending >= self.workers + self.queue_size:
+            if key:
+                self.store.release_key(key, job_id)
+            raise JobQueueFull("Job queue is full")
+
+        now = time.time()
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "progress": {},
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "expires_at": None,
+            "callback": {"status": "pending"} if callback_url else None,
+            "idempotency_key": idempotency_key,
+        }
+        self.store.save(job)
+        self._pending += 1
+        task = asyncio.create_task(self._execute(job, run, callback_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info("job_submitted", job_id=job_id, kind=kind, pending=self._pending)
+        return job, True
+
+    async def _execute(self, job: dict, run: Callable[[], Awaitable[Any]], callback_url: str | None) -> None:
+        token = _current_job.set(job["id"])
+        try:
+            async with self._slots:
+                self._running += 1
+                self._update(job, status="running", started_at=time.time())
+                started = time.monotonic()
+                # The submitting request's deadline does not apply to the job; its cost cap does.
+                inherited = current_budget()
+                start_budget(self.timeout, inherited.max_cost_usd if inherited else None)
+                try:
+                    result = await asyncio.wait_for(run(), timeout=self.timeout)
+                    self._finish(job, status="completed", result=jsonable_encoder(result))
+                except HTTPException as e:
+                    self._finish(job, status="failed", error={"status_code": e.status_code, "detail": e.detail})
+                except BudgetExhausted as e:
+                    self._finish(job, status="failed", error={"status_code": e.status_code, "detail": str(e)})
+                except LLMBusy as e:
+                    self._finish(job, status="failed", error={
+                        "status_code": 429, "detail": str(e), "retry_after": e.retry_after,
+                    })
+                except asyncio.TimeoutError:
+                    self._finish(job, status="failed", error={"status_code": 504, "detail": "Job timed out"})
+                except asyncio.CancelledError:
+                    self._finish(job, status="failed", error={
+                        "status_code": 503, "detail": "AI worker shut down before the job finished",
+                    })
+                    raise
+                except Exception as e:
+                    logger.error("job_failed", job_id=job["id"], kind=job["kind"], error=str(e))
+                    self._finish(job, status="failed", error={"status_code": 500, "detail": str(e)[:1000]})
+                finally:
+                    self._running -= 1
+                logger.info(
+                    "job_finished",
+                    job_id=job["id"],
+                    kind=job["kind"],
+                    status=job["status"],
+                    duration_ms=round((time.monotonic() - started) * 1000),
+                )
+        finally:
+            self._pending -= 1
+            _current_job.reset(token)
+        if callback_url:
+            await self._deliver_callback(job, callback_url)
+
+    def _update(self, job: dict, **fields: Any) -> None:
+        # Progress reports write the same file; start from it so they are not overwritten,
+        # and add the progress held back by report_progress's throttle.
+        stored = self.store.get(job["id"]) or {}
+        _, unsaved = _progress.pop(job["id"], (0.0, {}))
+        if unsaved:
+            stored["progress"] = {**stored.get("progress", {}), **unsaved}
+        job.update({**stored, **fields})
+        self.store.save(job)
+
+    def _finish(self, job: dict, **fields: Any) -> None:
+        now = time.time()
+        self._update(job, finished_at=now, expires_at=now + self.store.ttl_seconds, **fields)
+
+    async def _deliver_callback(self, job: dict, url: str) -> None:
+        body = json.dumps(public_view({k: v for k, v in job.items() if k != "callback"})).encode("utf-8")
+        attempts = 0
+        error = None
+        async with httpx.AsyncClient(timeout=settings.jobs_callback_timeout) as client:
+            for attempt in range(settings.jobs_callback_attempts):
+                attempts = attempt + 1
+                timestamp = str(int(time.time()))
+                try:
+                    response = await client.post(url, content=body, headers={
+                        "Content-Type": "application/json",
+                        "X-AI-Worker-Timestamp": timestamp,
+                        "X-AI-Worker-Signature": sign_payload(body, timestamp),
+                    })
+                    if response.status_code < 300:
+                        error = None
+                        break
+                    error = f"HTTP {response.status_code}"
+                except httpx.HTTPError as e:
+                    error = str(e) or type(e).__name__
+                if attempt + 1 < settings.jobs_callback_attempts:
+                    await asyncio.sleep(2 ** attempt)
+        if error:
+            logger.warning("job_callback_failed", job_id=job["id"], attempts=attempts, error=error)
+        self._update(job, callback={
+            "status": "failed" if error else "delivered", "attempts": attempts, "error": error,
+        })
+
+    async def shutdown(self) -> None:
+        """Cancel running and queued jobs; they are recorded as failed."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+job_store = JobStore(settings.jobs_path, settings.jobs_ttl_seconds)
+job_pool = JobPool(job_store, settings.jobs_workers, settings.jobs_queue_size, settings.jobs_timeout_seconds)
+
+
+@dataclass
+class JobOptions:
+    callback_url: str | None
+    idempotency_key: str | None
+    route_prefix: str
+
+
+def job_options(
+    request: Request,
+    prefer: str | None = Header(default=None),
+    idempotency_key: str | None = Header(default=None, max_length=255),
+    x_callback_url: str | None = Header(default=None, max_length=2000),
+) -> JobOptions | None:
+    """Job mode options when the request asked for it with `Prefer: respond-async`, else None."""
+    if not prefer or "respond-async" not in prefer.lower():
+        return None
+    if x_callback_url is not None:
+        parsed = urlparse(x_callback_url)
+        allowed = {h.strip().lower() for h in settings.jobs_callback_hosts.split(",") if h.strip()}
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise HTTPException(status_code=422, detail="X-Callback-Url must be an http(s) URL")
+        if allowed and parsed.hostname.lower() not in allowed:
+            raise HTTPException(status_code=422, detail="X-Callback-Url host is not allowed")
+    prefix = "/api/v1" if request.url.path.startswith("/api/v1/") else ""
+    return JobOptions(x_callback_url, idempotency_key, prefix)
+
+
+def submit_job(kind: str, options: JobOptions, run: Callable[[], Awaitable[Any]]) -> JSONResponse:
+    """Run `run` as a background job and answer 202 Accepted with where to poll for it."""
+    try:
+        job, created = job_pool.submit(kind, run, options.callback_url, options.idempotency_key)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full, retry later")
+    status_url = f"{options.route_prefix}/jobs/{job['id']}"
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job["id"], "status": job["status"], "created": created, "status_url": status_url},
+        headers={"Location": status_url},
+    )
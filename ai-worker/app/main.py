@@ -1,9 +1,20 @@
+import time
+from contextlib import asynccontextmanager
+
 import structlog
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from app.ai.client import close_client, init_client
+from app.ai.budget import BudgetExhausted
+from app.ai.scheduler import PRIORITIES, LLMBusy, llm_priority
 from app.config import settings
-from app.routers import analysis, compliance, health, redline
+from app.deps import close_engine
+from app.extraction import extraction_pool
+from app.jobs import job_pool
+from app.metrics import http_request_duration, http_requests_in_flight, mark_process_dead
+from app.routers import analysis, compliance, health, jobs, metrics, redline, reference_data
 
 structlog.configure(
     wrapper_class=structlog.make_filtering_bound_logger(
@@ -11,21 +22,80 @@ structlog.configure(
     )
 )
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_client()
+    extraction_pool.start()
+    yield
+    await job_pool.shutdown()
+    extraction_pool.shutdown()
+    await close_client()
+    await close_engine()
+    mark_process_dead()
+
+
 app = FastAPI(
     title="CCRS AI Worker",
     version="1.0.0",
     description="Internal AI microservice for CCRS contract analysis",
     docs_url=None,
     redoc_url=None,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://ccrs_laravel:8000", "http://app:8000"],
     allow_methods=["POST", "GET"],
-    allow_headers=["X-AI-Worker-Secret", "Content-Type"],
+    allow_headers=[
+        "X-AI-Worker-Secret", "Content-Type", "Prefer", "Idempotency-Key", "X-Callback-Url", "X-AI-Priority",
+        "X-AI-Timeout-Seconds", "X-AI-Max-Cost-Usd",
+    ],
 )
 
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    http_requests_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_requests_in_flight.dec()
+        # Route template (bounded label values, unlike raw paths), set by the router.
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_request_duration.labels(method=request.method, route=route, status=str(status)).observe(
+            time.perf_counter() - start
+        )
+
+
+@app.middleware("http")
+async def llm_priority_header(request: Request, call_next):
+    """X-AI-Priority: interactive (default) | batch; batch Claude calls queue behind interactive ones."""
+    priority = request.headers.get("x-ai-priority", "interactive").lower()
+    llm_priority.set(priority if priority in PRIORITIES else "interactive")
+    return await call_next(request)
+
+
+@app.exception_handler(LLMBusy)
+async def llm_busy_handler(request: Request, exc: LLMBusy):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"{exc}, retry later"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(BudgetExhausted)
+async def budget_exhausted_handler(request: Request, exc: BudgetExhausted):
+    """504 when the deadline ran out before any result existed; 422 when the cost or token cap did."""
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc), "budget": exc.kind})
+
+
 app.include_router(health.router, tags=["health"])
 app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
 app.include_router(analysis.router, tags=["analysis-root"])
@@ -33,3 +103,8 @@ app.include_router(redline.router, prefix="/api/v1", tags=["redline"])
 app.include_router(redline.router, tags=["redline-root"])
 app.include_router(compliance.router, prefix="/api/v1", tags=["compliance"])
 app.include_router(compliance.router, tags=["compliance-root"])
+app.include_router(reference_data.router, prefix="/api/v1", tags=["reference-data"])
+app.include_router(reference_data.router, tags=["reference-data-root"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["jobs"])
+app.include_router(jobs.router, tags=["jobs-root"])
+app.include_router(metrics.router, tags=["metrics"])
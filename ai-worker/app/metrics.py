@@ -0,0 +1,147 @@
+"""
+Prometheus metrics for the worker's hot paths, served at /metrics.
+
+Under `uvicorn --workers N` each worker is a separate process, so set
+PROMETHEUS_MULTIPROC_DIR to an empty directory (wiped before uvicorn starts):
+every process then writes its samples there and /metrics aggregates them across
+workers. Without it, /metrics reports the serving process only.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Analysis and LLM calls run from about a second to several minutes.
+_SLOW_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+_FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+# Extraction (with queueing) runs up to extraction_timeout, 60s by default.
+_EXTRACTION_BUCKETS = (*_FAST_BUCKETS, 45, 60, 90, 120)
+_BYTES_BUCKETS = (10e3, 50e3, 100e3, 500e3, 1e6, 2.5e6, 5e6, 10e6, 25e6)
+
+http_request_duration = Histogram(
+    "ccrs_http_request_duration_seconds",
+    "HTTP request latency until the response starts, by route template.",
+    ["method", "route", "status"],
+    buckets=_SLOW_BUCKETS,
+)
+http_requests_in_flight = Gauge(
+    "ccrs_http_requests_in_flight",
+    "HTTP requests being handled (until their response starts).",
+    multiprocess_mode="livesum",
+)
+analysis_duration = Histogram(
+    "ccrs_analysis_duration_seconds",
+    "One analysis run (including result cache lookups), by analysis_type.",
+    ["analysis_type", "cache", "chunked"],
+    buckets=_SLOW_BUCKETS,
+)
+llm_request_duration = Histogram(
+    "ccrs_llm_request_duration_seconds",
+    "Round-trip time of one Claude request (a stream counts until it is closed).",
+    ["model", "kind", "outcome"],
+    buckets=_SLOW_BUCKETS,
+)
+llm_queue_wait = Histogram(
+    "ccrs_llm_queue_wait_seconds",
+    "Time a Claude request waited in the scheduler queue.",
+    ["priority"],
+    buckets=_FAST_BUCKETS,
+)
+llm_requests_in_flight = Gauge(
+    "ccrs_llm_requests_in_flight",
+    "Claude requests currently open.",
+    multiprocess_mode="livesum",
+)
+llm_tokens = Counter(
+    "ccrs_llm_tokens",
+    "Tokens reported by Claude responses.",
+    ["model", "type"],
+)
+agent_tool_rounds = Histogram(
+    "ccrs_agent_tool_rounds",
+    "Claude round trips per analyze_complex call.",
+    ["analysis_type"],
+    buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10),
+)
+model_route_duration = Histogram(
+    "ccrs_model_route_duration_seconds",
+    "One analysis attempt on a routed model; an escalation is a second attempt on its own route.",
+    ["route", "analysis_type"],
+    buckets=_SLOW_BUCKETS,
+)
+model_route_escalations = Counter(
+    "ccrs_model_route_escalations",
+    "Fast-route results re-run on the standard route, by reason (invalid | low_confidence).",
+    ["analysis_type", "reason"],
+)
+mcp_tool_duration = Histogram(
+    "ccrs_mcp_tool_duration_seconds",
+    "MCP tool handler latency.",
+    ["tool", "outcome"],
+    buckets=_FAST_BUCKETS,
+)
+extraction_duration = Histogram(
+    "ccrs_extraction_duration_seconds",
+    "Text extraction time in the process pool (including queueing), by file type.",
+    ["file_type", "outcome"],
+    buckets=_EXTRACTION_BUCKETS,
+)
+extraction_bytes = Histogram(
+    "ccrs_extraction_input_bytes",
+    "Size of files sent to text extraction, by file type.",
+    ["file_type"],
+    buckets=_BYTES_BUCKETS,
+)
+redline_write_duration = Histogram(
+    "ccrs_redline_clause_write_seconds",
+    "Redline clause DB writes: streamed batches and the final transaction.",
+    ["phase"],
+    buckets=_FAST_BUCKETS,
+)
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels: str) -> Iterator[dict]:
+    """
+    Observe the block's duration on histogram. The yielded dict holds the labels and
+    may be updated inside the block; "outcome", if a label, becomes "error" on exceptions.
+    """
+    values = dict(labels)
+    start = time.perf_counter()
+    try:
+        yield values
+    except BaseException:
+        if "outcome" in values:
+            values["outcome"] = "error"
+        raise
+    finally:
+        histogram.labels(**values).observe(time.perf_counter() - start)
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition-format payload and its content type."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this process's live gauges from the shared directory (called at shutdown)."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,27 @@
+from fastapi import Header, HTTPException
+
+from app.ai.budget import start_budget
+from app.config import settings
+
+
+def request_budget(default_timeout: float):
+    """
+    Dependency that starts the request's deadline and spend budget. Laravel may pass
+    X-AI-Timeout-Seconds (a deadline shorter than its own HTTP timeout leaves room for
+    partial results) and X-AI-Max-Cost-Usd (capped at ai_max_budget_usd).
+    """
+
+    async def dependency(
+        x_ai_timeout_seconds: float | None = Header(default=None),
+        x_ai_max_cost_usd: float | None = Header(default=None),
+    ) -> None:
+        if x_ai_timeout_seconds is not None and x_ai_timeout_seconds <= 0:
+            raise HTTPException(status_code=422, detail="X-AI-Timeout-Seconds must be positive")
+        if x_ai_max_cost_usd is not None and x_ai_max_cost_usd <= 0:
+            raise HTTPException(status_code=422, detail="X-AI-Max-Cost-Usd must be positive")
+        start_budget(
+            timeout=x_ai_timeout_seconds or default_timeout,
+            max_cost_usd=min(x_ai_max_cost_usd or settings.ai_max_budget_usd, settings.ai_max_budget_usd),
+        )
+
+    return dependency
@@ -1,18 +1,28 @@
 """
 Redline analysis module — compares contract clauses against WikiContract templates
 using Claude AI for structured diff output.
+
+Clauses are first aligned locally (app.clauses); clauses that match the template
+exactly or near-exactly are marked unchanged without involving Claude, and only
+the divergent, added and deleted clauses are sent for review.
 """
 
 import json
 import logging
-from typing import Any
-
-import anthropic
+from typing import Any, Awaitable, Callable
 
+from app.ai.budget import BudgetExhausted, usage_cost
+from app.ai.json_stream import JSONArrayItemStream
+from app.ai.prompt_cache import cache_tokens, cached_system
+from app.ai.scheduler import stream_message
+from app.clauses import Alignment, Clause, align
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Stop reasons after which the clauses that arrived whole are kept.
+_TRUNCATED = ("max_tokens", "budget")
+
 REDLINE_SYSTEM_PROMPT = """You are a legal contract analyst. Your task is to compare a contract against a standard template and produce a structured clause-by-clause analysis.
 
 For each clause in the contract:
@@ -32,14 +42,16 @@ Focus on material deviations: changed payment terms, altered liability caps, mis
 
 You MUST respond with valid JSON only, no markdown, no explanation outside the JSON."""
 
-REDLINE_USER_PROMPT = """Compare the following contract against the standard template.
+# The template goes in the (cached) system prompt: the same WikiContract template is
+# compared against many contracts, so its tokens are only paid for once per cache window.
+REDLINE_TEMPLATE_PROMPT = """=== TEMPLATE TEXT ===
+{template_text}"""
+
+REDLINE_USER_PROMPT = """Compare the following contract against the standard template given in the system prompt.
 
 === CONTRACT TEXT ===
 {contract_text}
 
-=== TEMPLATE TEXT ===
-{template_text}
-
 Respond with a JSON object in exactly this format:
 {{
     "clauses": [
@@ -65,32 +77,336 @@ Respond with a JSON object in exactly this format:
 }}"""
 
 
-def analyze_redline(contract_text: str, template_text: str) -> dict[str, Any]:
+REDLINE_ALIGNED_SYSTEM_PROMPT = """You are a legal contract analyst reviewing a contract against a standard template. The clauses have already been aligned, and clauses identical to the template are not shown.
+
+You receive:
+- PAIRED clauses: a contract clause (C-id) and the template clause (T-id) it most resembles. Classify it as "unchanged" if the difference is not material (formatting, numbering, wording with the same meaning), otherwise as "modification".
+- UNPAIRED CONTRACT clauses: no similar template clause was found. If an UNPAIRED TEMPLATE clause covers the same subject, classify it as "modification" and give that clause's id as template_ref; otherwise classify it as "addition".
+- UNPAIRED TEMPLATE clauses: not found in the contract. Each one you did not use as a template_ref is a "deletion".
+
+For modifications, deletions and additions provide:
+- The suggested text (what the template says, or what should be added)
+- A plain English rationale explaining the material difference and its business/legal impact
+- A confidence score from 0.0 to 1.0 indicating how certain you are about the comparison
+
+Focus on material deviations: changed payment terms, altered liability caps, missing indemnification, removed cure periods, added obligations, changed termination rights, modified IP ownership, and similar substantive changes. Ignore minor formatting or stylistic differences.
+
+You MUST respond with valid JSON only, no markdown, no explanation outside the JSON."""
+
+REDLINE_ALIGNED_USER_PROMPT = """{sections}
+
+Respond with a JSON object in exactly this format, with one "clauses" item per contract clause shown and one "deletions" item per deleted template clause:
+{{
+    "clauses": [
+        {{
+            "ref": "C3",
+            "change_type": "unchanged|modification|addition",
+            "template_ref": "T4 (the template clause it corresponds to, null for additions)",
+            "suggested_text": "The template clause text the contract should use (null if unchanged)",
+            "ai_rationale": "Plain English explanation of the difference and its impact (null if unchanged)",
+            "confidence": 0.95
+        }}
+    ],
+    "deletions": [
+        {{
+            "ref": "T7",
+            "ai_rationale": "Plain English explanation of the impact of removing this clause",
+            "confidence": 0.9
+        }}
+    ],
+    "summary": {{
+        "material_risk_areas": ["Liability cap reduced from 2x to 1x annual fees", "30-day cure period removed"],
+        "overall_assessment": "Contract has 2 material deviations from the standard template..."
+    }}
+}}"""
+
+
+OnClauses = Callable[[list[dict]], Awaitable[None]]
+
+
+async def analyze_redline(
+    contract_text: str,
+    template_text: str,
+    on_clauses: OnClauses | None = None,
+) -> dict[str, Any]:
     """
-    Use Claude to compare a contract against a template and produce
-    a structured clause-by-clause redline analysis.
+    Compare a contract against a template and produce a structured
+    clause-by-clause redline analysis.
+
+    Claude's response is streamed; `on_clauses` is awaited with each batch of
+    clauses (already carrying their clause_number) as soon as they are known, so
+    callers can persist them before the analysis finishes. The returned list is
+    final: it may renumber clauses when a provisional deletion turns out to be a match.
 
     Returns a dict with 'clauses' (list) and 'summary' (dict).
     """
-    client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
+    if settings.redline_local_alignment:
+        alignment = align(contract_text, template_text)
+        # Alignment only pays off when both texts have recognisable clause structure.
+        template_clauses = len(alignment.unmatched_template) + sum(1 for _, t, _ in alignment.pairs if t)
+        if len(alignment.pairs) >= 2 and template_clauses >= 2:
+            return await _analyze_aligned(alignment, on_clauses)
+    return await _analyze_full(contract_text, template_text, on_clauses)
 
-    user_prompt = REDLINE_USER_PROMPT.format(
-        contract_text=contract_text,
-        template_text=template_text,
-    )
+
+async def _stream_items(
+    system: list[dict],
+    user_prompt: str,
+    keys: tuple[str, ...],
+    on_item: Callable[[str, dict], Awaitable[None]],
+) -> tuple[str, str | None]:
+    """
+    Stream one Claude response, awaiting on_item(array key, item) for every object
+    completed inside the given top-level arrays. Returns (response text, stop_reason).
+    If the request budget runs out after items have arrived, the stream is cut and
+    stop_reason is "budget", so callers keep what they have like a max_tokens cut.
+    """
+    parser = JSONArrayItemStream(keys)
+    items = 0
+    try:
+        async with stream_message(
+            model=settings.ai_model,
+            max_tokens=8192,
+            system=system,
+            messages=[
+                {"role": "user", "content": user_prompt},
+            ],
+        ) as stream:
+            async for text in stream.text_stream:
+                for key, item in parser.feed(text):
+                    if isinstance(item, dict):
+                        items += 1
+                        await on_item(key, item)
+            message = await stream.get_final_message()
+    except BudgetExhausted as e:
+        if not items:
+            raise
+        logger.warning("Redline response cut after %d items: %s", items, e)
+        return parser.buffer, "budget"
+    _log_usage(message)
+    return parser.buffer, message.stop_reason
+
+
+async def _analyze_full(contract_text: str, template_text: str, on_clauses: OnClauses | None) -> dict[str, Any]:
+    """Send both whole texts to Claude and let it align the clauses itself."""
+    clauses: list[dict] = []
+
+    async def on_item(_key: str, item: dict) -> None:
+        clauses.append(item)
+        # Positions, not Claude's own numbering: clause_number is unique per session.
+        item["clause_number"] = len(clauses)
+        if on_clauses is not None:
+            await on_clauses([item])
 
     logger.info("Sending redline analysis request to Claude (%s)", settings.ai_model)
 
-    response = client.messages.create(
-        model=settings.ai_model,
-        max_tokens=8192,
-        system=REDLINE_SYSTEM_PROMPT,
-        messages=[
-            {"role": "user", "content": user_prompt},
-        ],
+    raw_text, stop_reason = await _stream_items(
+        cached_system(REDLINE_SYSTEM_PROMPT, REDLINE_TEMPLATE_PROMPT.format(template_text=template_text)),
+        REDLINE_USER_PROMPT.format(contract_text=contract_text),
+        ("clauses",),
+        on_item,
     )
 
-    raw_text = response.content[0].text.strip()
+    try:
+        result = _parse_json(raw_text)
+    except ValueError:
+        if stop_reason not in _TRUNCATED or not clauses:
+            raise
+        # Truncated: keep every clause that arrived whole instead of failing the session.
+        logger.warning("Redline response truncated after %d clauses", len(clauses))
+        return {"clauses": clauses, "summary": {**_counts(clauses), "truncated": True}}
+
+    if "clauses" not in result:
+        raise ValueError("AI response missing 'clauses' key")
+    if "summary" not in result:
+        raise ValueError("AI response missing 'summary' key")
+    for number, clause in enumerate(result["clauses"], start=1):
+        clause["clause_number"] = number
+    return result
+
+
+def _slots(alignment: Alignment) -> list[tuple[str, Clause]]:
+    """
+    Final clause order: contract clauses in order, with each unmatched template clause
+    (a provisional deletion) after the contract clause matched to the template clause
+    before it.
+    """
+    anchor_of = {t.index: pos for pos, (_, t, _) in enumerate(alignment.pairs) if t is not None}
+    after: dict[int, list[Clause]] = {}
+    for template_clause in alignment.unmatched_template:
+        before = [i for i in anchor_of if i < template_clause.index]
+        after.setdefault(anchor_of[max(before)] if before else -1, []).append(template_clause)
+    slots = [("T", t) for t in after.get(-1, [])]
+    for pos, (contract_clause, _, _) in enumerate(alignment.pairs):
+        slots.append(("C", contract_clause))
+        slots.extend(("T", t) for t in after.get(pos, []))
+    return slots
+
+
+async def _analyze_aligned(alignment: Alignment, on_clauses: OnClauses | None) -> dict[str, Any]:
+    """Settle matching clauses locally and ask Claude only about the rest."""
+    threshold = settings.redline_unchanged_similarity
+    pairs = {f"C{c.index + 1}": (c, t, score) for c, t, score in alignment.pairs}
+    review = [(c, t, score) for c, t, score in alignment.pairs if t is None or score < threshold]
+    review_template = list(alignment.unmatched_template)
+    template_by_ref = {f"T{t.index + 1}": t for t in review_template}
+    slots = _slots(alignment)
+    number_of = {f"{kind}{clause.index + 1}": n for n, (kind, clause) in enumerate(slots, start=1)}
+
+    rows: dict[str, dict] = {}
+    reused_template: set[str] = set()
+
+    async def emit(batch: list[tuple[str, dict]]) -> None:
+        for ref, row in batch:
+            row["clause_number"] = number_of[ref]
+            rows[ref] = row
+        if on_clauses is not None and batch:
+            await on_clauses([row for _, row in batch])
+
+    # Locally settled clauses are available before Claude is even called.
+    await emit([
+        (ref, _clause_row(contract_clause, None, "unchanged", None, round(score, 2)))
+        for ref, (contract_clause, template_clause, score) in pairs.items()
+        if template_clause is not None and score >= threshold
+    ])
+
+    def contract_row(ref: str, item: dict) -> dict:
+        contract_clause, counterpart, score = pairs[ref]
+        template_ref = str(item.get("template_ref") or "")
+        if counterpart is None and template_ref in template_by_ref:
+            counterpart = template_by_ref[template_ref]
+            reused_template.add(template_ref)
+        change_type = item.get("change_type")
+        if change_type not in ("unchanged", "modification", "addition"):
+            change_type = "modification" if counterpart is not None else "addition"
+        if change_type == "unchanged":
+            return _clause_row(contract_clause, None, "unchanged", None, item.get("confidence", round(score, 2)))
+        suggested = item.get("suggested_text")
+        if change_type == "modification" and not suggested and counterpart is not None:
+            suggested = counterpart.text
+        return _clause_row(
+            contract_clause, suggested, change_type, item.get("ai_rationale"), item.get("confidence", round(score, 2))
+        )
+
+    def deletion_row(template_clause: Clause, item: dict) -> dict:
+        return {
+            "clause_heading": template_clause.heading,
+            "original_text": "",
+            "suggested_text": template_clause.text,
+            "change_type": "deletion",
+            "ai_rationale": item.get("ai_rationale"),
+            "confidence": item.get("confidence"),
+        }
+
+    async def on_item(key: str, item: dict) -> None:
+        ref = str(item.get("ref"))
+        if key == "clauses" and ref in pairs and ref not in rows:
+            await emit([(ref, contract_row(ref, item))])
+        elif key == "deletions" and ref in template_by_ref and ref not in rows:
+            await emit([(ref, deletion_row(template_by_ref[ref], item))])
+
+    claude_summary: dict = {}
+    stop_reason = None
+    if review or review_template:
+        logger.info(
+            "Sending %d of %d contract clauses and %d unmatched template clauses to Claude (%s)",
+            len(review), len(alignment.pairs), len(review_template), settings.ai_model,
+        )
+        try:
+            raw_text, stop_reason = await _stream_items(
+                cached_system(REDLINE_ALIGNED_SYSTEM_PROMPT),
+                REDLINE_ALIGNED_USER_PROMPT.format(sections=_review_sections(review, review_template)),
+                ("clauses", "deletions"),
+                on_item,
+            )
+        except BudgetExhausted as e:
+            # Every clause already has a local classification to fall back on.
+            logger.warning("No budget left for the redline review: %s", e)
+            raw_text, stop_reason = "", "budget"
+        try:
+            claude_summary = _parse_json(raw_text).get("summary") or {}
+        except ValueError:
+            if stop_reason not in _TRUNCATED:
+                raise
+            logger.warning("Redline response truncated; unreviewed clauses keep their local classification")
+    else:
+        logger.info("All %d contract clauses match the template; no Claude call needed", len(alignment.pairs))
+
+    # Assemble in slot order; clauses Claude did not return keep a local classification,
+    # and template clauses Claude matched to a contract clause are not deletions.
+    clauses: list[dict] = []
+    for kind, clause in slots:
+        ref = f"{kind}{clause.index + 1}"
+        if kind == "T" and ref in reused_template:
+            continue
+        row = rows.get(ref) or (contract_row(ref, {}) if kind == "C" else deletion_row(clause, {}))
+        clauses.append(row)
+    for number, clause in enumerate(clauses, start=1):
+        clause["clause_number"] = number
+
+    summary = {
+        **_counts(clauses),
+        "matched_locally": len(alignment.pairs) - len(review),
+        "material_risk_areas": claude_summary.get("material_risk_areas", []),
+        "overall_assessment": claude_summary.get(
+            "overall_assessment", "Contract matches the standard template; no material deviations."
+        ),
+    }
+    if stop_reason in _TRUNCATED:
+        summary["truncated"] = True
+    return {"clauses": clauses, "summary": summary}
+
+
+def _counts(clauses: list[dict]) -> dict:
+    counts = {t: sum(1 for c in clauses if c.get("change_type") == t) for t in ("unchanged", "modification", "deletion", "addition")}
+    return {
+        "total_clauses": len(clauses),
+        "unchanged": counts["unchanged"],
+        "modifications": counts["modification"],
+        "deletions": counts["deletion"],
+        "additions": counts["addition"],
+    }
+
+
+def _review_sections(review: list[tuple[Clause, Clause | None, float]], template: list[Clause]) -> str:
+    paired = [(c, t) for c, t, _ in review if t is not None]
+    unpaired = [c for c, t, _ in review if t is None]
+    parts = []
+    if paired:
+        parts.append("=== PAIRED CLAUSES ===")
+        for c, t in paired:
+            parts.append(f"--- C{c.index + 1} (contract) ---\n{c.text}\n--- T{t.index + 1} (template) ---\n{t.text}")
+    if unpaired:
+        parts.append("=== UNPAIRED CONTRACT CLAUSES ===")
+        parts.extend(f"--- C{c.index + 1} ---\n{c.text}" for c in unpaired)
+    if template:
+        parts.append("=== UNPAIRED TEMPLATE CLAUSES ===")
+        parts.extend(f"--- T{t.index + 1} ---\n{t.text}" for t in template)
+    return "\n\n".join(parts)
+
+
+def _clause_row(clause: Clause, suggested: str | None, change_type: str, rationale: str | None, confidence) -> dict:
+    return {
+        "clause_heading": clause.heading,
+        "original_text": clause.text,
+        "suggested_text": suggested,
+        "change_type": change_type,
+        "ai_rationale": rationale,
+        "confidence": confidence,
+    }
+
+
+def _log_usage(response) -> None:
+    cache_creation, cache_read = cache_tokens(response.usage)
+    logger.info(
+        "Redline response received: input_tokens=%s output_tokens=%s cache_creation=%s cache_read=%s cost_usd=%.4f",
+        response.usage.input_tokens, response.usage.output_tokens, cache_creation, cache_read,
+        usage_cost(settings.ai_model, response.usage),
+    )
+
+
+def _parse_json(raw_text: str) -> dict[str, Any]:
+    raw_text = raw_text.strip()
 
     # Strip markdown code fences if present
     if raw_text.startswith("```"):
@@ -99,15 +415,8 @@ def analyze_redline(contract_text: str, template_text: str) -> dict[str, Any]:
         raw_text = "\n".join(lines)
 
     try:
-        result = json.loads(raw_text)
+        return json.loads(raw_text)
     except json.JSONDecodeError as e:
         logger.error("Failed to parse Claude response as JSON: %s", e)
         logger.error("Raw response (first 500 chars): %s", raw_text[:500])
         raise ValueError(f"AI returned invalid JSON: {e}") from e
-
-    if "clauses" not in result:
-        raise ValueError("AI response missing 'clauses' key")
-    if "summary" not in result:
-        raise ValueError("AI response missing 'summary' key")
-
-    return result
@@ -0,0 +1,101 @@
+"""
+Local keyword retrieval over contract sections (Okapi BM25), used to pick the
+parts of a long contract that are relevant to a set of requirements.
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+
+from app.clauses import segment_clauses
+
+_STOPWORDS = frozenset(
+    "a an and any are as at be been by for from has have if in into is it its may must not "
+    "of on or other such that the their then there these this to under was were which will "
+    "with within without shall should each all".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+@dataclass
+class Section:
+    index: int
+    start: int
+    text: str
+
+
+def split_sections(text: str, max_chars: int = 4_000) -> list[Section]:
+    """Clause-level sections; clauses longer than max_chars are cut at line breaks."""
+    sections: list[Section] = []
+    cursor = 0
+    for clause in segment_clauses(text):
+        start = text.find(clause.text[:200], cursor)
+        start = start if start != -1 else cursor
+        cursor = start + len(clause.text)
+        body = clause.text
+        offset = 0
+        while body:
+            piece = body if len(body) <= max_chars else body[:max_chars]
+            if len(body) > max_chars:
+                cut = piece.rfind("\n", max_chars // 2)
+                piece = body[:cut] if cut > 0 else piece
+            sections.append(Section(len(sections), start + offset, piece))
+            offset += len(piece)
+            body = body[len(piece):]
+    return sections
+
+
+class BM25Index:
+    def __init__(self, documents: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = [Counter(tokenize(d)) for d in documents]
+        self.lengths = [sum(t.values()) for t in self.terms]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        df: Counter = Counter()
+        for terms in self.terms:
+            df.update(terms.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - f + 0.5) / (f + 0.5)) for term, f in df.items()}
+
+    def scores(self, query: str) -> list[float]:
+        query_terms = set(tokenize(query))
+        out = []
+        for terms, length in zip(self.terms, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in query_terms:
+                tf = terms.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            out.append(score)
+        return out
+
+    def search(self, query: str, top_k: int) -> list[int]:
+        """Indexes of the top_k best-scoring documents with a non-zero score, best first."""
+        scores = self.scores(query)
+        ranked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: scores[i], reverse=True)
+        return ranked[:top_k]
+
+
+_ELISION = re.compile(r"\[?(?:\.\s*){3,}\]?|…")
+
+
+def locate_quote(text: str, quote: str, max_words: int = 12) -> int | None:
+    """
+    Character offset in text where a quoted passage starts, or None. Matching ignores
+    case, whitespace and punctuation; a quote elided with "..." is located by its
+    longest fragment. Quotes of fewer than four words are too ambiguous to place.
+    """
+    for fragment in sorted(_ELISION.split(quote), key=len, reverse=True):
+        words = re.findall(r"\w+", fragment)
+        if len(words) < 4:
+            continue
+        match = re.search(r"\W+".join(re.escape(w) for w in words[:max_words]), text, re.IGNORECASE)
+        if match:
+            return match.start()
+    return None
@@ -1,29 +1,85 @@
+import asyncio
 import base64
-import structlog
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
-from sqlalchemy.orm import Session
+import re
+import time
+from typing import Awaitable, Callable, Literal
 
-from app.deps import get_db
+import structlog
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 import json
 
+from app.ai.agent_client import PROMPT_VERSION as AGENT_PROMPT_VERSION
+from app.ai.budget import BudgetExhausted, current_budget
 from app.ai.agent_client import analyze_complex
-from app.ai.config import get_task_type
+from app.ai.chunking import analyze_chunked
+from app.ai.config import ModelRoute, get_task_type, route_for
+from app.ai.discovery import PROMPT_VERSION as DISCOVERY_PROMPT_VERSION
+from app.ai.discovery import analyze_discovery
+from app.ai.mcp_tools import get_tools
+from app.ai.messages_client import PROMPT_VERSION as SUMMARY_PROMPT_VERSION
 from app.ai.messages_client import analyze_summary
-from app.ai.config import settings
-from app.ai.workflow_generator import generate_workflow
+from app.ai.result_cache import cache_key, is_cacheable, result_cache
+from app.ai.routing import run_routed
+from app.ai.scheduler import LLMBusy
+from app.ai.schemas import AnalysisUsage
+from app.ai.workflow_generator import generate_workflow, stream_workflow
+from app.config import settings
+from app.extraction import ExtractedText, ExtractionQueueFull, ExtractionTimeout
+from app.jobs import JobOptions, job_options, report_progress, submit_job
+from app.storage import StorageError, StorageNotFound, StorageRef
+from app.storage import resolve as resolve_storage
+from app.text_store import get_contract_text, text_store
+from app.uploads import UploadTooLarge, new_upload
+from app.metrics import analysis_duration
 from app.middleware.auth import verify_ai_worker_secret
+from app.middleware.budget import request_budget
 
 logger = structlog.get_logger()
 router = APIRouter(dependencies=[Depends(verify_ai_worker_secret)])
 
+OnText = Callable[[str], Awaitable[None]]
+_budget = request_budget(settings.ai_analysis_timeout)
+
+
+class FileRequest(BaseModel):
+    """A contract file sent inline as base64, or referenced on a Laravel storage disk."""
+    file_content_base64: str | None = Field(default=None, max_length=20_000_000)  # ~15MB decoded
+    storage: StorageRef | None = None  # file already in Laravel storage; no bytes cross the HTTP hop
+    file_name: str = Field(max_length=500)
+
+    @model_validator(mode="after")
+    def _one_file_source(self):
+        if (self.file_content_base64 is None) == (self.storage is None):
+            raise ValueError("Provide exactly one of file_content_base64 or storage")
+        return self
+
 
-class AnalyzeRequest(BaseModel):
+class AnalyzeRequest(FileRequest):
     contract_id: str
     analysis_type: str  # summary | extraction | risk | deviation | obligations
-    file_content_base64: str = Field(max_length=20_000_000)  # ~15MB decoded
-    file_name: str = Field(max_length=500)
     context: dict = {}  # optional: region_id, entity_id, counterparty_id for mcp_tools
+    bypass_cache: bool = False  # force a fresh Claude run instead of a cached result
+    full_text: bool = False  # analyse the whole document, not just the first analysis_max_chars
+
+
+class AnalyzeMultiRequest(FileRequest):
+    contract_id: str
+    analysis_types: list[str] = Field(min_length=1, max_length=10)  # any /analyze analysis_type
+    context: dict = {}
+    bypass_cache: bool = False
+    full_text: bool = False
+
+
+class AnalyzeSummaryStreamRequest(FileRequest):
+    contract_id: str
+    bypass_cache: bool = False
+    full_text: bool = False
+
+
+class ExtractRequest(FileRequest):
+    max_chars: int | None = Field(default=None, gt=0)  # stop after the page reaching this; None = whole file
 
 
 class GenerateWorkflowRequest(BaseModel):
@@ -33,51 +89,29 @@ class GenerateWorkflowRequest(BaseModel):
     project_id: str | None = None
 
 
-@router.post("/analyze")
-async def analyze(req: AnalyzeRequest, db: Session = Depends(get_db)):
+@router.post("/analyze", dependencies=[Depends(_budget)])
+async def analyze(req: AnalyzeRequest, job: JobOptions | None = Depends(job_options)):
     """
     Runs AI analysis on a contract file. Does NOT write to database.
     Returns result + usage. Caller (Laravel) writes to database.
+    The file is either inline (file_content_base64) or a `storage` reference.
+    With `Prefer: respond-async` it returns 202 and a job id instead (see /jobs/{id}).
     """
-    try:
-        try:
-            file_bytes = base64.b64decode(req.file_content_base64)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid base64 file content")
+    if job is not None:
+        return submit_job("analyze", job, lambda: _analyze_request(req))
+    return await _analyze_request(req)
 
-        contract_text = _extract_text(file_bytes, req.file_name)
-        if not contract_text.strip():
-            raise HTTPException(status_code=422, detail="Could not extract text from file")
 
-        from app.ai.mcp_tools import get_tools
-        tools = get_tools(db, req.contract_id)
-
-        task_type = get_task_type(req.analysis_type)
-        if task_type == "simple":
-            result, usage = await analyze_summary(contract_text)
-            result_dict = result.model_dump()
-        elif req.analysis_type == "discovery":
-            result_dict, usage = await analyze_discovery(contract_text, req.context, tools)
-        else:
-            result_dict, usage = await analyze_complex(
-                req.analysis_type,
-                contract_text,
-                req.contract_id,
-                tools,
-            )
+async def _analyze_request(req: AnalyzeRequest) -> dict:
+    try:
+        report_progress(stage="extracting")
+        max_chars = _analysis_chars(req.full_text)
+        extracted, _ = await _extract(await _load_file(req), req.file_name, max_chars=max_chars)
+        return await _analyze_extracted(
+            req.contract_id, req.analysis_type, extracted, req.context, req.bypass_cache, max_chars
+        )
 
-        return {
-            "result": result_dict,
-            "usage": {
-                "input_tokens": usage.input_tokens,
-                "output_tokens": usage.output_tokens,
-                "cost_usd": usage.cost_usd,
-                "processing_time_ms": usage.processing_time_ms,
-                "model_used": usage.model_used,
-            }
-        }
-
-    except HTTPException:
+    except (HTTPException, LLMBusy, BudgetExhausted):
         raise
     except Exception as e:
         error_msg = str(e)
@@ -86,125 +120,428 @@ async def analyze(req: AnalyzeRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Analysis failed: {error_msg[:1000]}")
 
 
-@router.post("/generate-workflow")
-async def generate_workflow_endpoint(req: GenerateWorkflowRequest):
-    """Generate a workflow template using AI."""
+@router.post("/analyze-upload", dependencies=[Depends(_budget)])
+async def analyze_upload(
+    request: Request,
+    contract_id: str,
+    analysis_type: str,
+    file_name: str = Query(max_length=500),
+    context: str = "{}",
+    bypass_cache: bool = False,
+    full_text: bool = False,
+):
+    """
+    Same as /analyze, but the file is sent as the raw request body
+    (Content-Type: application/octet-stream) with the other fields as query
+    parameters; `context` is a JSON object. The body is streamed to a spooled
+    temp file and hashed on the way in, avoiding base64 inflation and the
+    decoded in-memory copies of the JSON variant.
+    """
     try:
-        result = await generate_workflow(
+        context_dict = json.loads(context)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="context must be a JSON object")
+
+    upload = new_upload()
+    try:
+        try:
+            await upload.receive(request.stream())
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        if upload.size == 0:
+            raise HTTPException(status_code=400, detail="Empty request body")
+
+        max_chars = _analysis_chars(full_text)
+        extracted, _ = await _extract(upload.source, file_name, upload.content_hash, max_chars)
+        return await _analyze_extracted(
+            contract_id, analysis_type, extracted, context_dict, bypass_cache, max_chars
+        )
+
+    except (HTTPException, LLMBusy, BudgetExhausted):
+        raise
+    except Exception as e:
+        error_msg = str(e)
+        logger.error("analyze_failed", contract_id=contract_id, analysis_type=analysis_type, error=error_msg)
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {error_msg[:1000]}")
+    finally:
+        upload.cleanup()
+
+
+@router.post("/analyze-multi", dependencies=[Depends(_budget)])
+async def analyze_multi(req: AnalyzeMultiRequest):
+    """
+    Runs several analysis types on one uploaded file. The file is extracted once and
+    all analyses run concurrently; results stream back as NDJSON, one line per
+    analysis type in completion order, followed by a final "done" line.
+    """
+    max_chars = _analysis_chars(req.full_text)
+    extracted, _ = await _extract(await _load_file(req), req.file_name, max_chars=max_chars)
+    contract_text, page_offsets, truncated = _analysis_text(extracted, max_chars)
+    if not contract_text.strip():
+        raise HTTPException(status_code=422, detail="Could not extract text from file")
+    analysis_types = list(dict.fromkeys(req.analysis_types))
+
+    async def run_one(analysis_type: str) -> dict:
+        try:
+            result_dict, usage = await _run_analysis(
+                analysis_type, contract_text, req.contract_id, req.context,
+                get_tools(req.contract_id), req.bypass_cache, page_offsets,
+            )
+            return {"analysis_type": analysis_type, "status": "completed",
+                    "result": result_dict, "usage": _usage_dict(usage), "text_truncated": truncated}
+        except LLMBusy as e:
+            return {"analysis_type": analysis_type, "status": "failed",
+                    "error": str(e), "retry_after": e.retry_after}
+        except BudgetExhausted as e:
+            return {"analysis_type": analysis_type, "status": "failed", "error": str(e)}
+        except Exception as e:
+            logger.error("analyze_failed", contract_id=req.contract_id, analysis_type=analysis_type, error=str(e))
+            return {"analysis_type": analysis_type, "status": "failed",
+                    "error": f"Analysis failed: {str(e)[:1000]}"}
+
+    async def stream():
+        start = time.perf_counter()
+        tasks = [asyncio.create_task(run_one(t)) for t in analysis_types]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                failed += line["status"] == "failed"
+                yield json.dumps(line, default=str) + "\n"
+            yield json.dumps({
+                "status": "done",
+                "completed": len(tasks) - failed,
+                "failed": failed,
+                "elapsed_ms": int((time.perf_counter() - start) * 1000),
+            }) + "\n"
+        finally:
+            # Client went away or the stream errored: stop paying for the remaining calls.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.post("/analyze-summary-stream", dependencies=[Depends(_budget)])
+async def analyze_summary_stream(req: AnalyzeSummaryStreamRequest):
+    """
+    Summary analysis as server-sent events: `delta` events carry the summary text as
+    Claude writes it, then one `result` event carries the /analyze response body
+    (result + usage), or an `error` event. A cached summary arrives as the result
+    alone. Closing the connection cancels the Claude request.
+    """
+    source = await _load_file(req)
+
+    async def run(on_text: OnText) -> dict:
+        max_chars = _analysis_chars(req.full_text)
+        extracted, _ = await _extract(source, req.file_name, max_chars=max_chars)
+        contract_text, page_offsets, truncated = _analysis_text(extracted, max_chars)
+        if not contract_text.strip():
+            raise HTTPException(status_code=422, detail="Could not extract text from file")
+        result_dict, usage = await _run_analysis(
+            "summary", contract_text, req.contract_id, {}, [], req.bypass_cache, page_offsets, on_text,
+        )
+        return {"result": result_dict, "usage": _usage_dict(usage), "text_truncated": truncated}
+
+    return _sse_response(run, "analyze_summary_stream", contract_id=req.contract_id)
+
+
+@router.post("/generate-workflow-stream", dependencies=[Depends(_budget)])
+async def generate_workflow_stream(req: GenerateWorkflowRequest):
+    """
+    /generate-workflow as server-sent events: `delta` events carry the raw JSON text as
+    Claude writes it, then a `result` event with {"result": {"stages": [...]}, "usage"},
+    or an `error` event. Closing the connection cancels the Claude request.
+    """
+    async def run(on_text: OnText) -> dict:
+        result, usage = await stream_workflow(
+            on_text,
             description=req.description,
             region_id=req.region_id,
             entity_id=req.entity_id,
             project_id=req.project_id,
         )
-        return result
-    except Exception as e:
-        logger.error("generate_workflow_failed", error=str(e))
-        raise HTTPException(status_code=500, detail="Workflow generation failed. See AI worker logs for details.")
+        return {"result": result, "usage": _usage_dict(usage)}
+
+    return _sse_response(run, "generate_workflow_stream")
 
 
-def _strip_markdown_json(text: str) -> str:
-    """Strip markdown code fences from Claude's JSON responses.
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    Claude frequently wraps JSON in ```json ... ``` blocks even when asked not to.
-    This function extracts the raw JSON string from such wrappers.
+
+def _sse_response(run: Callable[[OnText], Awaitable[dict]], name: str, **log_fields) -> StreamingResponse:
+    """
+    Stream run(on_text) as SSE: each on_text delta becomes a `delta` event, the return
+    value the `result` event, a failure an `error` event. Comment lines keep idle
+    connections open through proxies while nothing is being generated (e.g. extraction).
+    Starlette cancels the generator when the client disconnects; the finally block then
+    cancels the run, which closes the upstream Claude stream.
     """
-    import re
-    stripped = text.strip()
-    # Match ```json ... ``` or ``` ... ``` (with optional language tag)
-    m = re.match(r"^```(?:json)?\s*\n?(.*?)```\s*$", stripped, re.DOTALL)
-    if m:
-        return m.group(1).strip()
-    return stripped
+    queue: asyncio.Queue[tuple[str, dict] | None] = asyncio.Queue()
 
+    async def on_text(text: str) -> None:
+        await queue.put(("delta", {"text": text}))
 
-async def analyze_discovery(contract_text: str, context: dict, mcp_tools: list) -> tuple[dict, "AnalysisUsage"]:
-    """Extract structured entity data from contract text using Claude."""
-    import time
-    import anthropic
-    from app.ai.schemas import AnalysisUsage
+    async def produce() -> None:
+        try:
+            await queue.put(("result", await run(on_text)))
+        except HTTPException as e:
+            await queue.put(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except LLMBusy as e:
+            await queue.put(("error", {"status_code": 429, "detail": str(e), "retry_after": e.retry_after}))
+        except BudgetExhausted as e:
+            await queue.put(("error", {"status_code": e.status_code, "detail": str(e)}))
+        except Exception as e:
+            logger.error(f"{name}_failed", error=str(e), **log_fields)
+            await queue.put(("error", {"status_code": 500, "detail": f"Generation failed: {str(e)[:1000]}"}))
+        finally:
+            await queue.put(None)
+
+    async def stream():
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    break
+                yield _sse_event(*item)
+        finally:
+            if not task.done():
+                logger.info(f"{name}_cancelled", **log_fields)
+                task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    prompt = f"""Analyze this contract and extract the following structured information.
-For each item found, provide the data and a confidence score (0.0 to 1.0).
 
-Return ONLY raw valid JSON (no markdown, no code fences, no explanation).
-The JSON must have a 'discoveries' array. Each item has:
-- type: one of 'counterparty', 'entity', 'jurisdiction', 'governing_law'
-- confidence: float 0.0-1.0
-- data: object with relevant fields
+@router.post("/extract")
+async def extract(req: ExtractRequest):
+    """
+    Extract (or fetch the cached) text of a contract file. Redline and compliance
+    jobs call this instead of parsing the file again on the Laravel side. The
+    response carries the page index (page_offsets: where each page starts in
+    `text`); with max_chars, extraction stops after the page that reaches it and
+    `complete` is false.
+    """
+    extracted, cached = await _extract(await _load_file(req), req.file_name, max_chars=req.max_chars)
+    if not extracted.text.strip():
+        raise HTTPException(status_code=422, detail="Could not extract text from file")
+    return _extract_response(extracted, cached)
+
+
+@router.get("/extract/{content_hash}")
+async def get_extracted(content_hash: str, file_type: Literal["pdf", "docx", "text"] = "pdf"):
+    """Return previously extracted text by file SHA-256 (e.g. contracts.file_hash)."""
+    content_hash = content_hash.lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", content_hash):
+        raise HTTPException(status_code=400, detail="content_hash must be a SHA-256 hex digest")
+    extracted = await text_store.get(content_hash, file_type)
+    if extracted is None:
+        raise HTTPException(status_code=404, detail="No extracted text cached for this file")
+    return _extract_response(extracted, True)
+
+
+async def _load_file(req: FileRequest) -> bytes | str:
+    """Return the file bytes, or a local path for storage references read lazily by the extractor."""
+    if req.storage is not None:
+        try:
+            return await resolve_storage(req.storage)
+        except StorageNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except StorageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return base64.b64decode(req.file_content_base64)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid base64 file content")
 
-For counterparty: legal_name, registration_number, registered_address, jurisdiction
-For entity: name, registration_number, code
-For jurisdiction: name, country_code
-For governing_law: name, country_code
 
-Contract text:
-{contract_text[:50000]}
+async def _extract(
+    source: bytes | str,
+    file_name: str,
+    digest: str | None = None,
+    max_chars: int | None = None,
+) -> tuple[ExtractedText, bool]:
+    try:
+        return await get_contract_text(source, file_name, digest, max_chars)
+    except ExtractionQueueFull:
+        raise HTTPException(status_code=503, detail="Text extraction queue is full, retry later")
+    except ExtractionTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+
+def _extract_response(extracted: ExtractedText, cached: bool) -> dict:
+    return {
+        "content_hash": extracted.content_hash,
+        "file_type": extracted.file_type,
+        "text": extracted.text,
+        "page_offsets": extracted.page_offsets,
+        "page_count": extracted.page_count,
+        "total_pages": extracted.total_pages or extracted.page_count,
+        "complete": extracted.complete,
+        "cached": cached,
+    }
+
+
+def _analysis_chars(full_text: bool) -> int | None:
+    """Characters an analysis reads: analysis_max_chars, or None (everything) for full_text."""
+    if full_text or settings.analysis_max_chars <= 0:
+        return None
+    return settings.analysis_max_chars
+
+
+def _analysis_text(extracted: ExtractedText, max_chars: int | None) -> tuple[str, list[int], bool]:
+    """
+    The text an analysis reads (cut to exactly max_chars, so the result cache key does not
+    depend on where extraction stopped), its page offsets, and whether the document was cut.
+    """
+    if max_chars is None or len(extracted.text) <= max_chars:
+        return extracted.text, extracted.page_offsets, False
+    text = extracted.text[:max_chars]
+    return text, [offset for offset in extracted.page_offsets if offset < max_chars], True
 
-Context from the system:
-{json.dumps(context, default=str)}"""
 
-    start = time.perf_counter()
-    client = anthropic.AsyncAnthropic(api_key=settings.anthropic_api_key)
-    msg = await client.messages.create(
-        model=settings.ai_model,
-        max_tokens=4096,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    elapsed_ms = int((time.perf_counter() - start) * 1000)
+@router.post("/generate-workflow", dependencies=[Depends(_budget)])
+async def generate_workflow_endpoint(req: GenerateWorkflowRequest):
+    """Generate a workflow template using AI."""
+    try:
+        result = await generate_workflow(
+            description=req.description,
+            region_id=req.region_id,
+            entity_id=req.entity_id,
+            project_id=req.project_id,
+        )
+        return result
+    except (LLMBusy, BudgetExhausted):
+        raise
+    except Exception as e:
+        logger.error("generate_workflow_failed", error=str(e))
+        raise HTTPException(status_code=500, detail="Workflow generation failed. See AI worker logs for details.")
 
-    raw_text = ""
-    if msg.content and len(msg.content) > 0:
-        raw_text = msg.content[0].text if hasattr(msg.content[0], "text") else str(msg.content[0])
 
-    # Strip markdown code fences — Claude frequently wraps JSON despite instructions
-    cleaned_text = _strip_markdown_json(raw_text)
+async def _analyze_extracted(
+    contract_id: str,
+    analysis_type: str,
+    extracted: ExtractedText,
+    context: dict,
+    bypass_cache: bool = False,
+    max_chars: int | None = None,
+) -> dict:
+    """
+    Run one analysis on already-extracted text (its first max_chars characters) and build
+    the /analyze response body; text_truncated says whether the document was longer.
+    """
+    contract_text, page_offsets, truncated = _analysis_text(extracted, max_chars)
+    if not contract_text.strip():
+        raise HTTPException(status_code=422, detail="Could not extract text from file")
 
-    try:
-        result_dict = json.loads(cleaned_text)
-    except json.JSONDecodeError:
-        logger.warning("analyze_discovery_json_parse_failed",
-                       raw=raw_text[:500],
-                       cleaned=cleaned_text[:500])
-        result_dict = {"discoveries": []}
-
-    # Validate we got a discoveries array
-    if "discoveries" not in result_dict:
-        logger.warning("analyze_discovery_missing_key",
-                       keys=list(result_dict.keys()),
-                       raw_preview=raw_text[:300])
-        result_dict = {"discoveries": result_dict.get("results", result_dict.get("data", []))}
-        if not isinstance(result_dict["discoveries"], list):
-            result_dict = {"discoveries": []}
-
-    logger.info("analyze_discovery_completed",
-                discovery_count=len(result_dict.get("discoveries", [])),
-                elapsed_ms=elapsed_ms)
-
-    usage = AnalysisUsage(
-        input_tokens=msg.usage.input_tokens if msg.usage else 0,
-        output_tokens=msg.usage.output_tokens if msg.usage else 0,
-        cost_usd=0.0,
-        processing_time_ms=elapsed_ms,
-        model_used=settings.ai_model,
+    tools = get_tools(contract_id)
+
+    report_progress(stage="analyzing", text_chars=len(contract_text))
+    result_dict, usage = await _run_analysis(
+        analysis_type, contract_text, contract_id, context, tools, bypass_cache, page_offsets
     )
+    return {
+        "result": result_dict,
+        "usage": _usage_dict(usage),
+        "text_truncated": truncated,
+    }
+
+
+async def _run_analysis(
+    analysis_type: str,
+    contract_text: str,
+    contract_id: str,
+    context: dict,
+    tools: list[dict],
+    bypass_cache: bool = False,
+    page_offsets: list[int] | None = None,
+    on_text: OnText | None = None,
+) -> tuple[dict, AnalysisUsage]:
+    """
+    Dispatch one analysis type to the summary, discovery or agent client on the model
+    route_for picks (escalating fast-model results that fail validation), serving
+    repeats from the result cache. bypass_cache forces a fresh run (which refreshes
+    the cached entry). Texts above analysis_chunk_threshold_chars are analysed in
+    concurrent chunks and merged (see app.ai.chunking). For summaries, on_text
+    receives the text deltas of the final summary (the reduce step when chunked).
+    """
+    start = time.perf_counter()
+    task_type = get_task_type(analysis_type)
+    route = route_for(analysis_type, len(contract_text), context)
+    if task_type == "simple":
+        prompt_version, tool_defs = SUMMARY_PROMPT_VERSION, None
+    elif analysis_type == "discovery":
+        prompt_version, tool_defs = DISCOVERY_PROMPT_VERSION, None
+    else:
+        prompt_version = AGENT_PROMPT_VERSION
+        tool_defs = [t["definition"] for t in tools]
+    chunked = len(contract_text) > settings.analysis_chunk_threshold_chars
+    if chunked:
+        prompt_version += f"+chunked:{settings.analysis_chunk_chars}:{settings.analysis_chunk_overlap_chars}"
+    key = cache_key(contract_text, analysis_type, route.model, prompt_version, context, tool_defs)
+
+    if not bypass_cache:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            result_dict, usage = cached
+            usage.processing_time_ms = int((time.perf_counter() - start) * 1000)
+            logger.info("analysis_cache_hit", contract_id=contract_id, analysis_type=analysis_type)
+            analysis_duration.labels(analysis_type=analysis_type, cache="hit", chunked=str(chunked).lower()).observe(
+                time.perf_counter() - start
+            )
+            return result_dict, usage
+
+    async def analyze(text: str, on_text: OnText | None = None) -> tuple[dict, AnalysisUsage]:
+        async def run(route: ModelRoute) -> tuple[dict, AnalysisUsage]:
+            if task_type == "simple":
+                result, usage = await analyze_summary(text, on_text, route)
+                return result.model_dump(), usage
+            if analysis_type == "discovery":
+                return await analyze_discovery(text, context, tools, route)
+            return await analyze_complex(analysis_type, text, contract_id, tools, route)
+
+        return await run_routed(route, analysis_type, run)
+
+    async def reduce(text: str) -> tuple[dict, AnalysisUsage]:
+        return await analyze(text, on_text)
+
+    if chunked:
+        result_dict, usage = await analyze_chunked(
+            analysis_type, contract_text, page_offsets, analyze,
+            reduce_summaries=reduce if task_type == "simple" else None,
+        )
+    else:
+        result_dict, usage = await analyze(contract_text, on_text)
+
+    budget = current_budget()
+    if budget is not None and budget.exhausted:
+        result_dict = {**result_dict, "partial": True, "budget_exhausted": budget.exhausted}
+    if is_cacheable(result_dict):
+        await result_cache.put(key, result_dict, usage)
+    analysis_duration.labels(
+        analysis_type=analysis_type, cache="bypass" if bypass_cache else "miss", chunked=str(chunked).lower()
+    ).observe(time.perf_counter() - start)
     return result_dict, usage
 
 
-def _extract_text(file_bytes: bytes, file_name: str) -> str:
-    """Extract text from PDF or DOCX."""
-    if file_name.lower().endswith(".pdf"):
-        try:
-            import fitz
-            doc = fitz.open(stream=file_bytes, filetype="pdf")
-            return "\n".join(page.get_text() for page in doc)
-        except Exception:
-            return file_bytes.decode("utf-8", errors="ignore")
-    if file_name.lower().endswith((".docx", ".doc")):
-        try:
-            import docx
-            from io import BytesIO
-            doc = docx.Document(BytesIO(file_bytes))
-            return "\n".join(p.text for p in doc.paragraphs)
-        except Exception:
-            return file_bytes.decode("utf-8", errors="ignore")
-    return file_bytes.decode("utf-8", errors="ignore")
+def _usage_dict(usage: AnalysisUsage) -> dict:
+    return {
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cache_creation_input_tokens": usage.cache_creation_input_tokens,
+        "cache_read_input_tokens": usage.cache_read_input_tokens,
+        "cost_usd": usage.cost_usd,
+        "processing_time_ms": usage.processing_time_ms,
+        "model_used": usage.model_used,
+        "route": usage.route,
+        "cache_hit": usage.cache_hit,
+    }
@@ -1,12 +1,22 @@
+import asyncio
 import json
 from typing import Literal, Optional
 
 import structlog
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
+from app.ai.prompt_cache import cache_tokens, cached_system
+from app.ai.budget import BudgetExhausted, cost_usd, current_budget
+from app.ai.scheduler import LLMBusy, create_message
 from app.config import settings
+from app.extraction import page_at
+from app.jobs import JobOptions, job_options, report_progress, submit_job
 from app.middleware.auth import verify_ai_worker_secret
+from app.middleware.budget import request_budget
+from app.retrieval import BM25Index, locate_quote, split_sections
+from app.storage import StorageError, StorageNotFound, StorageRef
+from app.text_store import get_stored_text
 
 logger = structlog.get_logger()
 router = APIRouter(dependencies=[Depends(verify_ai_worker_secret)])
@@ -27,10 +37,17 @@ class ComplianceFramework(BaseModel):
 
 
 class ComplianceCheckRequest(BaseModel):
-    contract_text: str = Field(max_length=500_000)  # ~500K chars max
+    contract_text: str | None = Field(default=None, max_length=500_000)  # ~500K chars max
+    contract_file: StorageRef | None = None  # alternative to contract_text: file in Laravel storage
     contract_id: str
     framework: ComplianceFramework
 
+    @model_validator(mode="after")
+    def _text_or_file(self):
+        if (self.contract_text is None) == (self.contract_file is None):
+            raise ValueError("Provide exactly one of contract_text or contract_file")
+        return self
+
 
 class ComplianceFindingResult(BaseModel):
     requirement_id: str
@@ -47,103 +64,289 @@ class ComplianceCheckResponse(BaseModel):
     findings: list[ComplianceFindingResult]
 
 
-@router.post("/check-compliance", response_model=ComplianceCheckResponse)
-async def check_compliance(request: ComplianceCheckRequest):
+SYSTEM_PROMPT = (
+    "You are a regulatory compliance checking assistant for contract review. "
+    "IMPORTANT: You are NOT providing legal advice or legal opinions. "
+    "You are checking whether specific clauses or provisions in the contract text "
+    "appear to address each regulatory requirement. Flag issues for human legal review. "
+    "You must NOT make definitive legal determinations. "
+    "For each requirement, provide:\n"
+    "1. status: 'compliant' if the contract clearly addresses the requirement, "
+    "'non_compliant' if the requirement is clearly not addressed, "
+    "'unclear' if the contract partially addresses it or the language is ambiguous, "
+    "'not_applicable' if the requirement does not apply to this type of contract.\n"
+    "2. evidence_clause: A direct quote from the contract that relates to this requirement (if any).\n"
+    "3. evidence_page: The approximate page number where the evidence was found (if determinable).\n"
+    "4. rationale: A brief explanation of your assessment.\n"
+    "5. confidence: A float between 0.0 and 1.0 indicating your confidence in this assessment.\n\n"
+    "Respond with a JSON array of findings. Each finding must have the fields: "
+    "requirement_id, status, evidence_clause, evidence_page, rationale, confidence."
+)
+
+
+@router.post(
+    "/check-compliance",
+    response_model=ComplianceCheckResponse,
+    dependencies=[Depends(request_budget(settings.compliance_timeout))],
+)
+async def check_compliance(request: ComplianceCheckRequest, job: JobOptions | None = Depends(job_options)):
     """
     Evaluate a contract against a regulatory framework's requirements.
 
     This endpoint checks whether specific clauses or provisions in the contract
     appear to address each requirement. It does NOT provide legal advice or
     automated legal opinions.
+
+    Requirements are evaluated in shards (by category) concurrently. When the
+    contract is longer than a shard's context budget, each shard only sees the
+    sections a local BM25 index ranks as relevant to its requirements.
+    With `Prefer: respond-async` it returns 202 and a job id instead (see /jobs/{id}).
     """
-    import anthropic
+    if job is not None:
+        return submit_job("check-compliance", job, lambda: _check_compliance(request))
+    return await _check_compliance(request)
+
+
+async def _check_compliance(request: ComplianceCheckRequest) -> ComplianceCheckResponse:
+    contract_text = request.contract_text
+    page_offsets: list[int] | None = None
+    if contract_text is None:
+        try:
+            extracted = await get_stored_text(request.contract_file, settings.compliance_max_chars or None)
+        except StorageNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except StorageError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            logger.error("compliance_contract_load_failed", error=str(e), contract_id=request.contract_id)
+            raise HTTPException(status_code=500, detail="Could not load contract file. See AI worker logs for details.")
+        contract_text = extracted.text[:settings.compliance_max_chars or None]
+        page_offsets = extracted.page_offsets
+        if not extracted.complete:
+            logger.info(
+                "compliance_contract_truncated",
+                contract_id=request.contract_id,
+                pages=extracted.page_count,
+                total_pages=extracted.total_pages,
+            )
+
+    shards = _shard_requirements(request.framework.requirements)
+    contexts = _shard_contexts(contract_text, page_offsets, shards)
+    semaphore = asyncio.Semaphore(settings.compliance_shard_concurrency)
+
+    excerpts = len(contract_text) > settings.compliance_shard_context_chars
+    done = 0
+    report_progress(shards_total=len(shards), shards_done=0)
+
+    async def run(shard: list[ComplianceRequirement], context: str):
+        nonlocal done
+        try:
+            async with semaphore:
+                return await _evaluate_shard(request.framework, shard, context, excerpts)
+        finally:
+            done += 1
+            report_progress(shards_done=done)
+
+    outcomes = await asyncio.gather(
+        *(run(shard, context) for shard, context in zip(shards, contexts)),
+        return_exceptions=True,
+    )
+
+    failures = [o for o in outcomes if isinstance(o, BaseException)]
+    if len(failures) == len(outcomes) and failures:
+        error = failures[0]
+        if isinstance(error, (LLMBusy, BudgetExhausted)):
+            raise error
+        if isinstance(error, json.JSONDecodeError):
+            logger.error("compliance_check_json_parse_error", error=str(error), contract_id=request.contract_id)
+            raise HTTPException(status_code=500, detail="Failed to parse AI response. See AI worker logs for details.")
+        logger.error("compliance_check_failed", error=str(error), contract_id=request.contract_id)
+        raise HTTPException(status_code=500, detail="Compliance check failed. See AI worker logs for details.")
+
+    findings: dict[str, ComplianceFindingResult] = {}
+    usage = {"input_tokens": 0, "output_tokens": 0, "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    for shard, outcome in zip(shards, outcomes):
+        if isinstance(outcome, BaseException):
+            logger.error(
+                "compliance_shard_failed",
+                error=str(outcome),
+                contract_id=request.contract_id,
+                requirement_ids=[r.id for r in shard],
+            )
+            continue
+        shard_findings, shard_usage = outcome
+        for finding in shard_findings:
+            _resolve_evidence_page(finding, contract_text, page_offsets)
+            findings.setdefault(finding.requirement_id, finding)
+        for key in usage:
+            usage[key] += shard_usage[key]
+
+    # Every requirement gets a finding; ones whose shard failed or that Claude skipped need a human.
+    ordered = []
+    for requirement in request.framework.requirements:
+        ordered.append(findings.pop(requirement.id, None) or ComplianceFindingResult(
+            requirement_id=requirement.id,
+            status="unclear",
+            rationale="The automated check did not return an assessment for this requirement; manual review required.",
+            confidence=0.0,
+        ))
+
+    logger.info(
+        "compliance_check_completed",
+        contract_id=request.contract_id,
+        framework_id=request.framework.id,
+        findings_count=len(ordered),
+        shards=len(shards),
+        failed_shards=len(failures),
+        model=settings.ai_model,
+        analysis_type="compliance_check",
+        cost_usd=cost_usd(settings.ai_model, *usage.values()),
+        budget_exhausted=budget.exhausted if (budget := current_budget()) else None,
+        **usage,
+    )
+
+    return ComplianceCheckResponse(
+        contract_id=request.contract_id,
+        framework_id=request.framework.id,
+        findings=ordered,
+    )
+
+
+def _shard_requirements(requirements: list[ComplianceRequirement]) -> list[list[ComplianceRequirement]]:
+    """Group requirements by category, splitting categories larger than the shard size."""
+    by_category: dict[str, list[ComplianceRequirement]] = {}
+    for requirement in requirements:
+        by_category.setdefault(requirement.category, []).append(requirement)
+    size = settings.compliance_shard_max_requirements
+    return [group[i:i + size] for group in by_category.values() for i in range(0, len(group), size)]
 
-    client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
+
+def _shard_contexts(
+    contract_text: str,
+    page_offsets: list[int] | None,
+    shards: list[list[ComplianceRequirement]],
+) -> list[str]:
+    """
+    Contract text each shard is shown: the whole contract when it fits the budget,
+    otherwise the sections BM25 ranks highest for the shard's requirements (taken
+    round-robin across requirements so each gets its best matches), in document order.
+    """
+    budget = settings.compliance_shard_context_chars
+    if len(contract_text) <= budget:
+        return [contract_text] * len(shards)
+
+    sections = split_sections(contract_text)
+    index = BM25Index([s.text for s in sections])
+    per_requirement = settings.compliance_sections_per_requirement
+    contexts = []
+    for shard in shards:
+        rankings = [
+            index.search(f"{r.category} {r.text}", per_requirement)
+            for r in shard
+        ]
+        chosen: list[int] = []
+        used = 0
+        for rank in range(per_requirement):
+            for ranking in rankings:
+                if rank < len(ranking) and ranking[rank] not in chosen:
+                    size = len(sections[ranking[rank]].text)
+                    if used + size <= budget:
+                        chosen.append(ranking[rank])
+                        used += size
+        contexts.append("\n\n".join(
+            f"[Excerpt{_page_label(sections[i].start, page_offsets)}]\n{sections[i].text}" for i in sorted(chosen)
+        ) or contract_text[:budget])
+    return contexts
+
+
+def _page_label(position: int, page_offsets: list[int] | None) -> str:
+    if not page_offsets or len(page_offsets) < 2:
+        return ""
+    return f", page {page_at(page_offsets, position)}"
+
+
+def _resolve_evidence_page(
+    finding: ComplianceFindingResult,
+    contract_text: str,
+    page_offsets: list[int] | None,
+) -> None:
+    """
+    Set evidence_page from where the quoted evidence_clause sits in the extracted text.
+    The model's own page number is kept only when there is no page index (inline text)
+    or the quote cannot be found.
+    """
+    if not finding.evidence_clause or not page_offsets or len(page_offsets) < 2:
+        return
+    position = locate_quote(contract_text, finding.evidence_clause)
+    if position is not None:
+        finding.evidence_page = page_at(page_offsets, position)
+
+
+async def _evaluate_shard(
+    framework: ComplianceFramework,
+    requirements: list[ComplianceRequirement],
+    contract_text: str,
+    excerpts: bool = False,
+) -> tuple[list[ComplianceFindingResult], dict]:
 
     requirements_text = "\n".join([
         f"- [{req.id}] (Category: {req.category}, Severity: {req.severity}): {req.text}"
-        for req in request.framework.requirements
+        for req in requirements
     ])
 
-    system_prompt = (
-        "You are a regulatory compliance checking assistant for contract review. "
-        "IMPORTANT: You are NOT providing legal advice or legal opinions. "
-        "You are checking whether specific clauses or provisions in the contract text "
-        "appear to address each regulatory requirement. Flag issues for human legal review. "
-        "You must NOT make definitive legal determinations. "
-        "For each requirement, provide:\n"
-        "1. status: 'compliant' if the contract clearly addresses the requirement, "
-        "'non_compliant' if the requirement is clearly not addressed, "
-        "'unclear' if the contract partially addresses it or the language is ambiguous, "
-        "'not_applicable' if the requirement does not apply to this type of contract.\n"
-        "2. evidence_clause: A direct quote from the contract that relates to this requirement (if any).\n"
-        "3. evidence_page: The approximate page number where the evidence was found (if determinable).\n"
-        "4. rationale: A brief explanation of your assessment.\n"
-        "5. confidence: A float between 0.0 and 1.0 indicating your confidence in this assessment.\n\n"
-        "Respond with a JSON array of findings. Each finding must have the fields: "
-        "requirement_id, status, evidence_clause, evidence_page, rationale, confidence."
+    # The framework and its requirements are identical for every contract checked against
+    # it, so they sit in the cached system prefix; only the contract text varies.
+    framework_prompt = (
+        f"## Regulatory Framework: {framework.name}\n"
+        f"## Jurisdiction: {framework.jurisdiction_code}\n\n"
+        f"## Requirements to check:\n{requirements_text}"
     )
 
+    heading = (
+        "## Contract Excerpts (the sections of a longer contract most relevant to these requirements)"
+        if excerpts else "## Contract Text"
+    )
     user_prompt = (
-        f"## Regulatory Framework: {request.framework.name}\n"
-        f"## Jurisdiction: {request.framework.jurisdiction_code}\n\n"
-        f"## Requirements to check:\n{requirements_text}\n\n"
-        f"## Contract Text:\n{request.contract_text}\n\n"
+        f"{heading}:\n{contract_text}\n\n"
         "Evaluate the contract against each requirement and return a JSON array of findings."
     )
 
-    try:
-        response = client.messages.create(
-            model=settings.ai_model,
-            max_tokens=4096,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_prompt}],
-        )
-
-        response_text = response.content[0].text
-
-        # Extract JSON from potential markdown code blocks
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-
-        findings_raw = json.loads(response_text)
-
-        findings = []
-        for finding in findings_raw:
-            findings.append(ComplianceFindingResult(
-                requirement_id=finding["requirement_id"],
-                status=finding.get("status", "unclear"),
-                evidence_clause=finding.get("evidence_clause"),
-                evidence_page=finding.get("evidence_page"),
-                rationale=finding.get("rationale", ""),
-                confidence=float(finding.get("confidence", 0.5)),
-            ))
-
-        usage = {
-            "input_tokens": response.usage.input_tokens,
-            "output_tokens": response.usage.output_tokens,
-            "model": settings.ai_model,
-            "analysis_type": "compliance_check",
-        }
-        logger.info(
-            "compliance_check_completed",
-            contract_id=request.contract_id,
-            framework_id=request.framework.id,
-            findings_count=len(findings),
-            **usage,
-        )
-
-        return ComplianceCheckResponse(
-            contract_id=request.contract_id,
-            framework_id=request.framework.id,
-            findings=findings,
-        )
-
-    except json.JSONDecodeError as e:
-        logger.error("compliance_check_json_parse_error", error=str(e), contract_id=request.contract_id)
-        raise HTTPException(status_code=500, detail="Failed to parse AI response. See AI worker logs for details.")
-    except Exception as e:
-        logger.error("compliance_check_failed", error=str(e), contract_id=request.contract_id)
-        raise HTTPException(status_code=500, detail="Compliance check failed. See AI worker logs for details.")
+    response = await create_message(
+        model=settings.ai_model,
+        max_tokens=4096,
+        system=cached_system(SYSTEM_PROMPT, framework_prompt),
+        messages=[{"role": "user", "content": user_prompt}],
+    )
+
+    response_text = response.content[0].text
+
+    # Extract JSON from potential markdown code blocks
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0].strip()
+
+    findings_raw = json.loads(response_text)
+
+    wanted = {r.id for r in requirements}
+    findings = []
+    for finding in findings_raw:
+        if finding.get("requirement_id") not in wanted:
+            continue
+        findings.append(ComplianceFindingResult(
+            requirement_id=finding["requirement_id"],
+            status=finding.get("status", "unclear"),
+            evidence_clause=finding.get("evidence_clause"),
+            evidence_page=finding.get("evidence_page"),
+            rationale=finding.get("rationale", ""),
+            confidence=float(finding.get("confidence", 0.5)),
+        ))
+
+    cache_creation, cache_read = cache_tokens(response.usage)
+    usage = {
+        "input_tokens": response.usage.input_tokens,
+        "output_tokens": response.usage.output_tokens,
+        "cache_creation_input_tokens": cache_creation,
+        "cache_read_input_tokens": cache_read,
+    }
+    return findings, usage
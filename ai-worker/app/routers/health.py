@@ -1,5 +1,15 @@
 from fastapi import APIRouter
+from app.ai.client import pool_gauge
+from app.ai.reference_data import reference_cache
+from app.ai.result_cache import result_cache
+from app.ai.routing import route_stats
+from app.ai.scheduler import scheduler
+from app.clauses import template_cache_stats
 from app.config import settings
+from app.deps import pool_stats
+from app.extraction import extraction_pool
+from app.jobs import job_pool
+from app.text_store import text_store
 
 router = APIRouter()
 
@@ -10,4 +20,14 @@ async def health():
         "status": "ok",
         "service": "ccrs-ai-worker",
         "model": settings.ai_model,
+        "anthropic_pool": pool_gauge.snapshot(),
+        "llm_scheduler": scheduler.stats(),
+        "model_routes": route_stats.stats(),
+        "db_pool": pool_stats(),
+        "extraction_pool": extraction_pool.stats(),
+        "job_pool": job_pool.stats(),
+        "text_store": text_store.stats(),
+        "result_cache": result_cache.stats(),
+        "reference_cache": reference_cache.stats(),
+        "redline_template_index": template_cache_stats(),
     }
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.jobs import job_store, public_view
+from app.middleware.auth import verify_ai_worker_secret
+
+router = APIRouter(dependencies=[Depends(verify_ai_worker_secret)])
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Status of a job submitted with `Prefer: respond-async`: queued | running |
+    completed | failed, with progress, and the result (or error) once finished.
+    Readable from any worker process until the job's TTL expires.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return public_view(job)
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.metrics import render
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint; aggregates every worker process when PROMETHEUS_MULTIPROC_DIR is set."""
+    payload, content_type = render()
+    return Response(content=payload, media_type=content_type)
@@ -4,22 +4,42 @@ from datetime import datetime
 
 import structlog
 from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, model_validator
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.deps import get_db
+from app.ai.budget import BudgetExhausted
+from app.ai.scheduler import LLMBusy
+from app.config import settings
+from app.deps import SessionLocal, get_db
+from app.jobs import JobOptions, job_options, report_progress, submit_job
+from app.metrics import redline_write_duration, timed
 from app.middleware.auth import verify_ai_worker_secret
+from app.middleware.budget import request_budget
 from app.redline import analyze_redline
+from app.storage import StorageError, StorageNotFound, StorageRef
+from app.text_store import get_stored_text
 
 logger = structlog.get_logger()
 router = APIRouter(dependencies=[Depends(verify_ai_worker_secret)])
 
 
 class RedlineRequest(BaseModel):
-    contract_text: str
-    template_text: str
+    contract_text: str | None = None
+    template_text: str | None = None
     contract_id: str
     session_id: str
+    # Alternatives to the inline texts: files already in Laravel storage
+    contract_file: StorageRef | None = None
+    template_file: StorageRef | None = None
+
+    @model_validator(mode="after")
+    def _texts_or_files(self):
+        if (self.contract_text is None) == (self.contract_file is None):
+            raise ValueError("Provide exactly one of contract_text or contract_file")
+        if (self.template_text is None) == (self.template_file is None):
+            raise ValueError("Provide exactly one of template_text or template_file")
+        return self
 
 
 class RedlineResponse(BaseModel):
@@ -29,82 +49,61 @@ class RedlineResponse(BaseModel):
     message: str
 
 
-@router.post("/analyze-redline", response_model=RedlineResponse)
-async def analyze_redline_endpoint(request: RedlineRequest, db: Session = Depends(get_db)):
+@router.post(
+    "/analyze-redline",
+    response_model=RedlineResponse,
+    dependencies=[Depends(request_budget(settings.redline_timeout))],
+)
+async def analyze_redline_endpoint(
+    request: RedlineRequest,
+    db: AsyncSession = Depends(get_db),
+    job: JobOptions | None = Depends(job_options),
+):
     """
     Analyze a contract against a template and store clause-by-clause
     redline results directly in MySQL.
 
-    Called by Laravel's ProcessRedlineAnalysis job.
+    Called by Laravel's ProcessRedlineAnalysis job. Clauses are written as
+    Claude streams them (with a running total_clauses on the session), so the
+    UI shows progress early and partial results survive a failure; the final
+    write replaces them with the complete, renumbered set. With
+    `Prefer: respond-async` it returns 202 and a job id instead (see /jobs/{id}).
     """
+    if job is not None:
+        return submit_job("analyze-redline", job, lambda: _run_redline_job(request))
+    return await _run_redline(request, db)
+
+
+async def _run_redline_job(request: RedlineRequest) -> RedlineResponse:
+    # The request's session closes once the 202 is sent; the job needs its own.
+    async with SessionLocal() as db:
+        return await _run_redline(request, db)
+
+
+async def _run_redline(request: RedlineRequest, db: AsyncSession) -> RedlineResponse:
     session_id = request.session_id
+    writer = _ClauseWriter(db, session_id)
 
     try:
         # Update session status to 'processing'
-        db.execute(
-            __import__("sqlalchemy").text(
-                "UPDATE redline_sessions SET status = :status, updated_at = :now WHERE id = :id"
-            ),
-            {"status": "processing", "now": datetime.utcnow(), "id": session_id},
-        )
-        db.commit()
+        await _mark_session_processing(db, session_id)
+
+        contract_text = request.contract_text
+        if contract_text is None:
+            contract_text = (await get_stored_text(request.contract_file)).text
+        template_text = request.template_text
+        if template_text is None:
+            template_text = (await get_stored_text(request.template_file)).text
 
         # Run AI analysis
-        result = analyze_redline(request.contract_text, request.template_text)
+        result = await analyze_redline(contract_text, template_text, on_clauses=writer.write)
 
         clauses = result.get("clauses", [])
         summary = result.get("summary", {})
         total_clauses = len(clauses)
 
-        # Insert each clause into redline_clauses
-        for clause in clauses:
-            now = datetime.utcnow()
-            db.execute(
-                __import__("sqlalchemy").text(
-                    """
-                    INSERT INTO redline_clauses
-                        (id, session_id, clause_number, clause_heading, original_text,
-                         suggested_text, change_type, ai_rationale, confidence,
-                         status, created_at, updated_at)
-                    VALUES (:id, :session_id, :clause_number, :clause_heading, :original_text,
-                            :suggested_text, :change_type, :ai_rationale, :confidence,
-                            :status, :created_at, :updated_at)
-                    """
-                ),
-                {
-                    "id": str(uuid.uuid4()),
-                    "session_id": session_id,
-                    "clause_number": clause.get("clause_number", 0),
-                    "clause_heading": clause.get("clause_heading"),
-                    "original_text": clause.get("original_text", ""),
-                    "suggested_text": clause.get("suggested_text"),
-                    "change_type": clause.get("change_type", "unchanged"),
-                    "ai_rationale": clause.get("ai_rationale"),
-                    "confidence": clause.get("confidence"),
-                    "status": "pending",
-                    "created_at": now,
-                    "updated_at": now,
-                },
-            )
-
-        # Update session to completed with summary
-        db.execute(
-            __import__("sqlalchemy").text(
-                """
-                UPDATE redline_sessions
-                SET status = :status, total_clauses = :total, summary = :summary, updated_at = :now
-                WHERE id = :id
-                """
-            ),
-            {
-                "status": "completed",
-                "total": total_clauses,
-                "summary": json.dumps(summary),
-                "now": datetime.utcnow(),
-                "id": session_id,
-            },
-        )
-        db.commit()
+        with timed(redline_write_duration, phase="final"):
+            await _store_redline_result(db, session_id, clauses, summary)
 
         logger.info(
             "redline_analysis_completed",
@@ -120,30 +119,188 @@ async def analyze_redline_endpoint(request: RedlineRequest, db: Session = Depend
         )
 
     except Exception as e:
-        logger.error("redline_analysis_failed", session_id=session_id, error=str(e))
+        logger.error(
+            "redline_analysis_failed",
+            session_id=session_id,
+            clauses_written=writer.written,
+            error=str(e),
+        )
 
-        # Update session status to 'failed'
+        # Update session status to 'failed'; clauses already written are kept
         try:
-            db.execute(
-                __import__("sqlalchemy").text(
-                    """
-                    UPDATE redline_sessions
-                    SET status = :status, error_message = :error, updated_at = :now
-                    WHERE id = :id
-                    """
-                ),
-                {
-                    "status": "failed",
-                    "error": str(e)[:2000],
-                    "now": datetime.utcnow(),
-                    "id": session_id,
-                },
-            )
-            db.commit()
+            await _mark_session_failed(db, session_id, str(e))
         except Exception as db_err:
             logger.error("failed_to_update_session_status", error=str(db_err))
 
+        if isinstance(e, (LLMBusy, BudgetExhausted)):
+            raise
+        if isinstance(e, StorageNotFound):
+            raise HTTPException(status_code=404, detail=str(e))
+        if isinstance(e, StorageError):
+            raise HTTPException(status_code=400, detail=str(e))
+
         raise HTTPException(
             status_code=500,
             detail=f"Redline analysis failed: {str(e)}",
         )
+
+
+async def _mark_session_processing(db: AsyncSession, session_id: str) -> None:
+    await db.execute(
+        text(
+            "UPDATE redline_sessions SET status = :status, updated_at = :now WHERE id = :id"
+        ),
+        {"status": "processing", "now": datetime.utcnow(), "id": session_id},
+    )
+    await db.commit()
+
+
+_CLAUSE_COLUMNS = (
+    "id", "session_id", "clause_number", "clause_heading", "original_text", "suggested_text",
+    "change_type", "ai_rationale", "confidence", "status", "created_at", "updated_at",
+)
+# Re-running a session overwrites the analysis fields and keeps the row ids.
+_CLAUSE_UPSERT_COLUMNS = (
+    "clause_heading", "original_text", "suggested_text", "change_type", "ai_rationale",
+    "confidence", "updated_at",
+)
+# A review decision only survives a re-run when the clause under that number still has the
+# same texts (a re-run may number clauses differently); otherwise it goes back to pending.
+_CLAUSE_REVIEW_RESET = {"status": "'pending'", "final_text": "NULL", "reviewed_by": "NULL", "reviewed_at": "NULL"}
+
+
+def _insert_clauses_sql(dialect: str) -> str:
+    """Multi-row clause upsert, keyed on the (session_id, clause_number) unique index."""
+    sql = (
+        f"INSERT INTO redline_clauses ({', '.join(_CLAUSE_COLUMNS)}) "
+        f"VALUES ({', '.join(':' + c for c in _CLAUSE_COLUMNS)})"
+    )
+    new, same = ("VALUES({})", "<=>") if dialect == "mysql" else ("excluded.{}", "IS")
+    unchanged = " AND ".join(f"{c} {same} {new.format(c)}" for c in ("original_text", "suggested_text"))
+    # The resets come first: MySQL evaluates assignments left to right, so a later one
+    # would compare against the texts already overwritten.
+    updates = ", ".join(
+        [f"{c} = CASE WHEN {unchanged} THEN {c} ELSE {value} END" for c, value in _CLAUSE_REVIEW_RESET.items()]
+        + [f"{c} = {new.format(c)}" for c in _CLAUSE_UPSERT_COLUMNS]
+    )
+    if dialect == "mysql":
+        return f"{sql} ON DUPLICATE KEY UPDATE {updates}"
+    return f"{sql} ON CONFLICT (session_id, clause_number) DO UPDATE SET {updates}"
+
+
+def _clause_numbers(clauses: list[dict]) -> list[int]:
+    """Claude's clause numbers when they are usable as keys, otherwise positions 1..n."""
+    numbers = [clause.get("clause_number") for clause in clauses]
+    if all(isinstance(n, int) and 0 < n <= 65535 for n in numbers) and len(set(numbers)) == len(numbers):
+        return numbers
+    return list(range(1, len(clauses) + 1))
+
+
+def _clause_rows(session_id: str, clauses: list[dict]) -> list[dict]:
+    now = datetime.utcnow()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "clause_number": number,
+            "clause_heading": clause.get("clause_heading"),
+            "original_text": clause.get("original_text", ""),
+            "suggested_text": clause.get("suggested_text"),
+            "change_type": clause.get("change_type", "unchanged"),
+            "ai_rationale": clause.get("ai_rationale"),
+            "confidence": clause.get("confidence"),
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now,
+        }
+        for clause, number in zip(clauses, _clause_numbers(clauses))
+    ]
+
+
+class _ClauseWriter:
+    """Upserts clauses as they stream in and keeps redline_sessions.total_clauses current."""
+
+    def __init__(self, db: AsyncSession, session_id: str):
+        self.db = db
+        self.session_id = session_id
+        self._numbers: set[int] = set()
+
+    @property
+    def written(self) -> int:
+        return len(self._numbers)
+
+    async def write(self, clauses: list[dict]) -> None:
+        rows = _clause_rows(self.session_id, clauses)
+        if not rows:
+            return
+        try:
+            with timed(redline_write_duration, phase="stream"):
+                await self.db.execute(text(_insert_clauses_sql(self.db.get_bind().dialect.name)), rows)
+                numbers = self._numbers | {row["clause_number"] for row in rows}
+                await self.db.execute(
+                    text("UPDATE redline_sessions SET total_clauses = :total, updated_at = :now WHERE id = :id"),
+                    {"total": len(numbers), "now": datetime.utcnow(), "id": self.session_id},
+                )
+                await self.db.commit()
+            self._numbers = numbers
+            report_progress(clauses_written=len(numbers))
+        except Exception as e:
+            # Progress writes are best effort; the final write stores the complete result.
+            logger.warning("redline_clause_write_failed", session_id=self.session_id, error=str(e))
+            await self.db.rollback()
+
+
+async def _store_redline_result(db: AsyncSession, session_id: str, clauses: list[dict], summary: dict) -> None:
+    """
+    Persist all clauses and complete the session in one transaction. Clauses go in as
+    a single executemany upsert (batched into multi-row INSERTs by the driver), so a
+    retry after a partial failure overwrites rows instead of duplicating them.
+    """
+    rows = _clause_rows(session_id, clauses)
+    if rows:
+        await db.execute(text(_insert_clauses_sql(db.get_bind().dialect.name)), rows)
+    # Drop clauses left over from an earlier, longer run of the same session.
+    await db.execute(
+        text("DELETE FROM redline_clauses WHERE session_id = :id AND clause_number NOT IN :numbers")
+        .bindparams(bindparam("numbers", expanding=True)),
+        {"id": session_id, "numbers": [row["clause_number"] for row in rows] or [0]},
+    )
+
+    # Update session to completed with summary
+    await db.execute(
+        text(
+            """
+            UPDATE redline_sessions
+            SET status = :status, total_clauses = :total, summary = :summary, updated_at = :now
+            WHERE id = :id
+            """
+        ),
+        {
+            "status": "completed",
+            "total": len(clauses),
+            "summary": json.dumps(summary),
+            "now": datetime.utcnow(),
+            "id": session_id,
+        },
+    )
+    await db.commit()
+
+
+async def _mark_session_failed(db: AsyncSession, session_id: str, error: str) -> None:
+    await db.rollback()
+    await db.execute(
+        text(
+            """
+            UPDATE redline_sessions
+            SET status = :status, error_message = :error, updated_at = :now
+            WHERE id = :id
+            """
+        ),
+        {
+            "status": "failed",
+            "error": error[:2000],
+            "now": datetime.utcnow(),
+            "id": session_id,
+        },
+    )
+    await db.commit()
@@ -0,0 +1,20 @@
+import structlog
+from fastapi import APIRouter, Depends
+
+from app.ai.reference_data import reference_cache
+from app.middleware.auth import verify_ai_worker_secret
+
+logger = structlog.get_logger()
+router = APIRouter(dependencies=[Depends(verify_ai_worker_secret)])
+
+
+@router.post("/reference-data/invalidate")
+async def invalidate_reference_data():
+    """
+    Called by Laravel after regions, entities, signing authority, WikiContracts,
+    counterparties, jurisdictions or governing laws change. Every worker process
+    reloads its reference data on the next tool call or discovery.
+    """
+    reference_cache.invalidate()
+    logger.info("reference_cache_invalidated")
+    return {"status": "invalidated"}
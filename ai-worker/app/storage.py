@@ -0,0 +1,99 @@
+"""
+Storage references — lets callers point the worker at a file Laravel already
+stored instead of posting its bytes. Backends mirror Laravel filesystem disks:
+
+    local     files on the shared storage volume (path relative to the disk root)
+    database  Laravel's `database` disk (app/Storage/DatabaseAdapter.php, file_storage table)
+
+Further backends (e.g. an object store) plug in via register_backend().
+"""
+
+import os
+from typing import Callable, Protocol
+
+from pydantic import BaseModel, Field
+from sqlalchemy import text
+
+from app.config import settings
+
+
+class StorageError(Exception):
+    """Base error for storage reference resolution."""
+
+
+class StorageNotFound(StorageError):
+    """Raised when the referenced file does not exist on the disk."""
+
+
+class StorageRef(BaseModel):
+    """Reference to a file on a Laravel storage disk."""
+    disk: str | None = None  # defaults to settings.storage_default_disk
+    path: str = Field(min_length=1, max_length=1024)
+    file_name: str | None = Field(default=None, max_length=500)  # defaults to basename(path)
+
+    @property
+    def name(self) -> str:
+        return self.file_name or os.path.basename(self.path)
+
+
+class StorageBackend(Protocol):
+    async def resolve(self, path: str) -> bytes | str:
+        """Return a local filesystem path for the file, or its bytes when no path exists."""
+        ...
+
+
+class LocalStorageBackend:
+    """Files on a volume shared with Laravel; only the path is handed on, nothing is read here."""
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+
+    async def resolve(self, path: str) -> str:
+        full = os.path.realpath(os.path.join(self.root, path.lstrip("/")))
+        if not full.startswith(self.root + os.sep):
+            raise StorageError("Storage path escapes the disk root")
+        if not os.path.isfile(full):
+            raise StorageNotFound(f"File not found on storage: {path}")
+        return full
+
+
+class DatabaseStorageBackend:
+    """Laravel's `database` disk: contents live in the file_storage table."""
+
+    async def resolve(self, path: str) -> bytes:
+        from app.deps import SessionLocal
+
+        async with SessionLocal() as db:
+            contents = (await db.execute(
+                text("SELECT contents FROM file_storage WHERE path = :path LIMIT 1"),
+                {"path": path},
+            )).scalar()
+        if contents is None:
+            raise StorageNotFound(f"File not found on storage: {path}")
+        return bytes(contents)
+
+
+_backends: dict[str, Callable[[], StorageBackend]] = {
+    "local": lambda: LocalStorageBackend(settings.storage_local_root),
+    "database": DatabaseStorageBackend,
+}
+_instances: dict[str, StorageBackend] = {}
+
+
+def register_backend(disk: str, factory: Callable[[], StorageBackend]) -> None:
+    _backends[disk] = factory
+    _instances.pop(disk, None)
+
+
+def get_backend(disk: str | None = None) -> StorageBackend:
+    disk = disk or settings.storage_default_disk
+    if disk not in _instances:
+        if disk not in _backends:
+            raise StorageError(f"Unknown storage disk: {disk}")
+        _instances[disk] = _backends[disk]()
+    return _instances[disk]
+
+
+async def resolve(ref: StorageRef) -> bytes | str:
+    """Resolve a storage reference to a local path or the file bytes."""
+    return await get_backend(ref.disk).resolve(ref.path)
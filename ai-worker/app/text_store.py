@@ -0,0 +1,121 @@
+"""
+Content-addressed store of extracted contract text.
+
+Laravel sends the same file once per analysis type; keying extracted text by
+the SHA-256 of the file bytes means each document is parsed once and every
+later analysis (and the /extract endpoint) reuses the result. An extraction that
+stopped at a consumer's character budget is stored too, and is replaced by a
+longer one when a later consumer needs more of the document.
+"""
+
+import asyncio
+import hashlib
+import zlib
+
+import structlog
+
+from app.cache import DiskStore, MemoryLRU
+from app.config import settings
+from app.extraction import ExtractedText, extraction_pool, file_type_for
+from app.storage import StorageRef
+from app.storage import resolve as resolve_storage
+
+logger = structlog.get_logger()
+
+
+def content_hash(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def file_content_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TextStore:
+    """In-memory LRU in front of an on-disk tier, both bounded by size."""
+
+    def __init__(self, memory_bytes: int, disk_path: str, disk_bytes: int):
+        self.memory = MemoryLRU(memory_bytes)
+        self.disk = DiskStore(disk_path, disk_bytes) if disk_bytes > 0 else None
+
+    @staticmethod
+    def _key(content_hash: str, file_type: str) -> str:
+        return f"{content_hash}.{file_type}"
+
+    async def get(self, content_hash: str, file_type: str) -> ExtractedText | None:
+        key = self._key(content_hash, file_type)
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+        if self.disk is None:
+            return None
+        blob = await asyncio.to_thread(self.disk.get, key)
+        if blob is None:
+            return None
+        extracted = ExtractedText.model_validate_json(zlib.decompress(blob))
+        self.memory.put(key, extracted, len(extracted.text))
+        return extracted
+
+    async def put(self, extracted: ExtractedText) -> None:
+        key = self._key(extracted.content_hash, extracted.file_type)
+        self.memory.put(key, extracted, len(extracted.text))
+        if self.disk is not None:
+            blob = zlib.compress(extracted.model_dump_json().encode("utf-8"))
+            await asyncio.to_thread(self.disk.put, key, blob)
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats() if self.disk else None}
+
+
+text_store = TextStore(
+    memory_bytes=settings.text_store_memory_bytes,
+    disk_path=settings.text_store_path,
+    disk_bytes=settings.text_store_disk_bytes,
+)
+
+
+async def get_contract_text(
+    source: bytes | str,
+    file_name: str,
+    digest: str | None = None,
+    max_chars: int | None = None,
+) -> tuple[ExtractedText, bool]:
+    """
+    Return (extracted text, cache_hit), extracting in the process pool only on a miss.
+    `source` is the file bytes or a local path; pass `digest` when the caller already
+    hashed the content (e.g. while streaming an upload). With max_chars the consumer
+    reads only that much text, so extraction may stop at the page that reaches it and
+    the result may be longer than max_chars; None asks for the whole document.
+    """
+    if digest is None:
+        hasher = content_hash if isinstance(source, bytes) else file_content_hash
+        digest = await asyncio.to_thread(hasher, source)
+    file_type = file_type_for(file_name)
+    cached = await text_store.get(digest, file_type)
+    if cached is not None and cached.covers(max_chars):
+        return cached, True
+
+    extracted = await extraction_pool.extract(source, file_name, max_chars)
+    extracted.content_hash = digest
+    if not extracted.complete:
+        logger.info(
+            "extraction_stopped_early",
+            content_hash=digest,
+            pages=extracted.page_count,
+            total_pages=extracted.total_pages,
+            chars=len(extracted.text),
+            max_chars=max_chars,
+        )
+    if extracted.text.strip():
+        await text_store.put(extracted)
+    return extracted, False
+
+
+async def get_stored_text(ref: StorageRef, max_chars: int | None = None) -> ExtractedText:
+    """Extracted text of a file referenced on a Laravel storage disk (see get_contract_text for max_chars)."""
+    extracted, _ = await get_contract_text(await resolve_storage(ref), ref.name, max_chars=max_chars)
+    return extracted
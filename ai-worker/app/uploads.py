@@ -0,0 +1,79 @@
+"""
+Raw request-body spooling for binary uploads. The body is hashed while it streams
+in and is kept in memory only while small; larger uploads roll over to a named
+temp file whose path is handed to the extraction pool, so no full in-memory copy
+of the document is ever made.
+"""
+
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator
+
+from app.config import settings
+
+
+class UploadTooLarge(Exception):
+    """Raised when the streamed body exceeds the configured maximum."""
+
+
+class SpooledUpload:
+    """Request body spooled to memory, rolling over to a named temp file past max_memory."""
+
+    def __init__(self, max_memory: int, max_bytes: int, directory: str | None = None):
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+        self.path: str | None = None
+
+    async def receive(self, chunks: AsyncIterator[bytes]) -> None:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+            self._digest.update(chunk)
+            if self._file is None and len(self._buffer) + len(chunk) > self.max_memory:
+                self._rollover()
+            if self._file is not None:
+                self._file.write(chunk)
+            else:
+                self._buffer.extend(chunk)
+        if self._file is not None:
+            self._file.close()
+
+    def _rollover(self) -> None:
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=self.directory, prefix="upload-")
+        self._file = os.fdopen(fd, "wb")
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+
+    @property
+    def content_hash(self) -> str:
+        return self._digest.hexdigest()
+
+    @property
+    def source(self) -> bytes | str:
+        """The spooled path for large uploads, otherwise the (small) body bytes."""
+        return self.path if self.path is not None else bytes(self._buffer)
+
+    def cleanup(self) -> None:
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def new_upload() -> SpooledUpload:
+    return SpooledUpload(
+        max_memory=settings.upload_spool_memory_bytes,
+        max_bytes=settings.upload_max_bytes,
+        directory=settings.upload_spool_path,
+    )
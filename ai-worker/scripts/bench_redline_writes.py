@@ -0,0 +1,115 @@
+"""
+Benchmark redline clause persistence: the bulk upsert used by /analyze-redline
+against the previous one-INSERT-per-clause loop.
+
+    cd ai-worker && python -m scripts.bench_redline_writes [--sizes 10 100 1000] [--repeat 3]
+
+Runs against DB_URL. On SQLite the redline tables are created when missing, so a
+scratch file (DB_URL=sqlite:////tmp/bench.db) needs no Laravel migrations. Every
+run uses a throwaway redline_sessions row that is deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.deps import SessionLocal, close_engine, engine
+from app.routers.redline import _clause_rows, _store_redline_result
+
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS redline_sessions (
+        id TEXT PRIMARY KEY, contract_id TEXT, status TEXT, total_clauses INTEGER DEFAULT 0,
+        summary TEXT, error_message TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS redline_clauses (
+        id TEXT PRIMARY KEY, session_id TEXT, clause_number INTEGER, clause_heading TEXT,
+        original_text TEXT, suggested_text TEXT, change_type TEXT, ai_rationale TEXT,
+        confidence REAL, status TEXT, final_text TEXT, reviewed_by TEXT, reviewed_at TIMESTAMP,
+        created_at TIMESTAMP, updated_at TIMESTAMP,
+        UNIQUE (session_id, clause_number)
+    )
+    """,
+]
+
+
+def _clauses(n: int) -> list[dict]:
+    return [
+        {
+            "clause_number": i,
+            "clause_heading": f"Clause {i}",
+            "original_text": "The Supplier shall deliver the Services in accordance with Schedule 1. " * 8,
+            "suggested_text": "The Supplier shall deliver the Services in accordance with Schedule 2. " * 8,
+            "change_type": "modification",
+            "ai_rationale": "Aligns the schedule reference with the template.",
+            "confidence": 0.9,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+async def _per_row(db, session_id: str, clauses: list[dict], summary: dict) -> None:
+    """The previous implementation: one INSERT round trip per clause, then the UPDATE."""
+    insert = text(
+        "INSERT INTO redline_clauses (id, session_id, clause_number, clause_heading, original_text, "
+        "suggested_text, change_type, ai_rationale, confidence, status, created_at, updated_at) "
+        "VALUES (:id, :session_id, :clause_number, :clause_heading, :original_text, :suggested_text, "
+        ":change_type, :ai_rationale, :confidence, :status, :created_at, :updated_at)"
+    )
+    for row in _clause_rows(session_id, clauses):
+        await db.execute(insert, row)
+    await db.execute(
+        text("UPDATE redline_sessions SET status = 'completed', total_clauses = :total, updated_at = :now "
+             "WHERE id = :id"),
+        {"total": len(clauses), "now": datetime.utcnow(), "id": session_id},
+    )
+    await db.commit()
+
+
+async def _time(writer, clauses: list[dict]) -> float:
+    session_id = str(uuid.uuid4())
+    async with SessionLocal() as db:
+        await db.execute(
+            text("INSERT INTO redline_sessions (id, contract_id, status, created_at, updated_at) "
+                 "VALUES (:id, :contract_id, 'processing', :now, :now)"),
+            {"id": session_id, "contract_id": str(uuid.uuid4()), "now": datetime.utcnow()},
+        )
+        await db.commit()
+        try:
+            start = time.perf_counter()
+            await writer(db, session_id, clauses, {"total": len(clauses)})
+            return time.perf_counter() - start
+        finally:
+            await db.execute(text("DELETE FROM redline_clauses WHERE session_id = :id"), {"id": session_id})
+            await db.execute(text("DELETE FROM redline_sessions WHERE id = :id"), {"id": session_id})
+            await db.commit()
+
+
+async def main(sizes: list[int], repeat: int) -> None:
+    if engine.dialect.name == "sqlite":
+        async with engine.begin() as conn:
+            for ddl in SQLITE_SCHEMA:
+                await conn.execute(text(ddl))
+
+    print(f"{'clauses':>8} {'per-row ms':>12} {'bulk ms':>10} {'speed-up':>9}")
+    for n in sizes:
+        clauses = _clauses(n)
+        per_row = statistics.median([await _time(_per_row, clauses) for _ in range(repeat)])
+        bulk = statistics.median([await _time(_store_redline_result, clauses) for _ in range(repeat)])
+        print(f"{n:>8} {per_row * 1000:>12.1f} {bulk * 1000:>10.1f} {per_row / bulk:>8.1f}x")
+    await close_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
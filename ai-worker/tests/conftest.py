@@ -0,0 +1,86 @@
+"""
+Shared test setup. Settings and the database engine are created when app modules
+are imported, so the environment is set here first: every on-disk store points
+into a scratch directory and DB_URL at a SQLite file standing in for MySQL.
+
+    cd ai-worker && pip install -r requirements-dev.txt && python -m pytest
+"""
+
+import os
+import tempfile
+
+_SCRATCH = tempfile.mkdtemp(prefix="ccrs-ai-worker-tests-")
+
+os.environ.update({
+    "ANTHROPIC_API_KEY": "test",
+    "OPENAI_API_KEY": "test",
+    "AI_WORKER_SECRET": "test-secret",
+    "DB_URL": f"sqlite:///{_SCRATCH}/ccrs.db",
+    "RESULT_CACHE_BACKEND": "mysql",
+    "RESULT_CACHE_PATH": f"{_SCRATCH}/result-cache",
+    "TEXT_STORE_PATH": f"{_SCRATCH}/text-store",
+    "UPLOAD_SPOOL_PATH": f"{_SCRATCH}/uploads",
+    "JOBS_PATH": f"{_SCRATCH}/jobs",
+    "REFERENCE_CACHE_STAMP_PATH": f"{_SCRATCH}/reference-data.stamp",
+})
+# Metrics shards go to scratch too, never into the source tree.
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(_SCRATCH, "metrics")
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
+
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+# The tables the worker reads and writes, as the Laravel migrations define them.
+SQLITE_SCHEMA = (
+    """
+    CREATE TABLE redline_sessions (
+        id TEXT PRIMARY KEY, contract_id TEXT, status TEXT DEFAULT 'pending', total_clauses INTEGER DEFAULT 0,
+        summary TEXT, error_message TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE redline_clauses (
+        id TEXT PRIMARY KEY, session_id TEXT NOT NULL, clause_number INTEGER NOT NULL, clause_heading TEXT,
+        original_text TEXT NOT NULL, suggested_text TEXT, change_type TEXT NOT NULL, ai_rationale TEXT,
+        confidence REAL, status TEXT NOT NULL DEFAULT 'pending', final_text TEXT, reviewed_by TEXT,
+        reviewed_at TIMESTAMP, created_at TIMESTAMP, updated_at TIMESTAMP,
+        UNIQUE (session_id, clause_number)
+    )
+    """,
+    """
+    CREATE TABLE ai_result_cache (
+        cache_key CHAR(64) PRIMARY KEY, payload TEXT NOT NULL, hit_count INTEGER NOT NULL DEFAULT 0,
+        expires_at TIMESTAMP NOT NULL, last_used_at TIMESTAMP NOT NULL, created_at TIMESTAMP
+    )
+    """,
+)
+
+
+@pytest.fixture
+async def db_schema():
+    """Fresh tables for one test; the engine is disposed after it, as each test has its own loop."""
+    from app.deps import engine
+
+    async with engine.begin() as conn:
+        for table in ("redline_clauses", "redline_sessions", "ai_result_cache"):
+            await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for statement in SQLITE_SCHEMA:
+            await conn.execute(text(statement))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def db(db_schema):
+    from app.deps import SessionLocal
+
+    async with SessionLocal() as session:
+        yield session
+
+
+async def create_session(db, session_id: str, contract_id: str = "contract-1") -> None:
+    await db.execute(
+        text("INSERT INTO redline_sessions (id, contract_id, status) VALUES (:id, :contract_id, 'pending')"),
+        {"id": session_id, "contract_id": contract_id},
+    )
+    await db.commit()
@@ -0,0 +1,17 @@
+"""Text extraction failures map to retryable HTTP errors."""
+
+import pytest
+from fastapi import HTTPException
+
+from app.extraction import ExtractionTimeout
+from app.routers import analysis
+
+
+async def test_extraction_timeout_is_a_gateway_timeout(monkeypatch):
+    async def stuck(*args, **kwargs):
+        raise ExtractionTimeout("Text extraction exceeded 60s")
+
+    monkeypatch.setattr(analysis, "get_contract_text", stuck)
+    with pytest.raises(HTTPException) as raised:
+        await analysis._extract(b"%PDF-", "contract.pdf")
+    assert raised.value.status_code == 504
@@ -0,0 +1,42 @@
+"""A failing chunk is reported next to the others instead of failing the whole analysis."""
+
+import pytest
+
+from app.ai.chunking import analyze_chunked
+from app.ai.schemas import AnalysisUsage
+from app.ai.scheduler import LLMBusy
+from app.config import settings
+
+TEXT = "\n\n".join(f"Clause {i}. " + "The parties agree to the terms. " * 20 for i in range(12))
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(settings, "analysis_chunk_chars", 2_000)
+    monkeypatch.setattr(settings, "analysis_chunk_overlap_chars", 0)
+
+
+async def test_failed_chunk_does_not_fail_the_rest():
+    calls = 0
+
+    async def analyze(text):
+        nonlocal calls
+        calls += 1
+        if "[Part 2 of" in text:
+            raise LLMBusy("Claude is busy", retry_after=5)
+        return {"risks": [f"risk {calls}"]}, AnalysisUsage(input_tokens=10)
+
+    result, usage = await analyze_chunked("risks", TEXT, None, analyze)
+
+    assert calls > 2
+    assert result["chunk_errors"] == [{"chunk": 2, "error": "Claude is busy"}]
+    assert len(result["risks"]) == calls - 1
+    assert usage.input_tokens == 10 * (calls - 1)
+
+
+async def test_every_chunk_failing_raises_the_error():
+    async def analyze(text):
+        raise LLMBusy("Claude is busy", retry_after=5)
+
+    with pytest.raises(LLMBusy):
+        await analyze_chunked("risks", TEXT, None, analyze)
@@ -0,0 +1,30 @@
+"""/check-compliance error mapping for contracts referenced on Laravel storage."""
+
+import httpx
+import pytest
+
+from app.main import app
+
+HEADERS = {"X-AI-Worker-Secret": "test-secret"}
+FRAMEWORK = {
+    "id": "f1",
+    "name": "Test",
+    "jurisdiction_code": "XX",
+    "requirements": [{"id": "r1", "text": "Data is deleted on exit.", "category": "data", "severity": "high"}],
+}
+
+
+@pytest.mark.parametrize(
+    ("storage", "status"),
+    [
+        ({"disk": "local", "path": "contracts/missing.pdf"}, 404),
+        ({"disk": "no-such-disk", "path": "contracts/c1.pdf"}, 400),
+    ],
+)
+async def test_storage_errors_map_to_client_errors(storage, status):
+    body = {"contract_id": "c1", "contract_file": storage, "framework": FRAMEWORK}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+        response = await client.post("/check-compliance", json=body, headers=HEADERS)
+
+    assert response.status_code == status
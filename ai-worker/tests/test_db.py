@@ -0,0 +1,108 @@
+"""Database access on the SQLite stand-in: sessions and pool stats, and redline clause persistence."""
+
+from sqlalchemy import text
+
+from app.deps import get_db, pool_stats
+from app.routers.redline import _ClauseWriter, _clause_rows, _insert_clauses_sql, _store_redline_result
+from tests.conftest import create_session
+
+
+def _clause(number: int, original: str = "Original", suggested: str | None = "Suggested") -> dict:
+    return {
+        "clause_number": number,
+        "clause_heading": f"Clause {number}",
+        "original_text": f"{original} {number}",
+        "suggested_text": f"{suggested} {number}" if suggested else None,
+        "change_type": "modification" if suggested else "unchanged",
+        "ai_rationale": "Differs from the template.",
+        "confidence": 0.9,
+    }
+
+
+async def _clauses(db, session_id: str) -> list[dict]:
+    rows = await db.execute(
+        text("SELECT * FROM redline_clauses WHERE session_id = :id ORDER BY clause_number"), {"id": session_id}
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+async def test_get_db_yields_a_working_session(db_schema):
+    before = pool_stats()["checkouts"]
+    sessions = get_db()
+    db = await anext(sessions)
+    assert (await db.execute(text("SELECT 1"))).scalar() == 1
+    await sessions.aclose()
+
+    stats = pool_stats()
+    assert stats["checkouts"] > before
+    assert stats["checked_out"] == 0
+    assert stats["checkout_timeouts"] == 0
+    assert stats["checkout_wait_max_ms"] >= stats["checkout_wait_avg_ms"] >= 0
+
+
+async def test_clause_upsert_overwrites_rows_with_the_same_number(db):
+    await create_session(db, "s1")
+    sql = text(_insert_clauses_sql(db.get_bind().dialect.name))
+    await db.execute(sql, _clause_rows("s1", [_clause(1), _clause(2)]))
+    await db.execute(sql, _clause_rows("s1", [_clause(2, original="Revised")]))
+    await db.commit()
+
+    clauses = await _clauses(db, "s1")
+    assert [(c["clause_number"], c["original_text"]) for c in clauses] == [(1, "Original 1"), (2, "Revised 2")]
+
+
+async def test_clause_writer_keeps_total_clauses_current(db):
+    await create_session(db, "s1")
+    writer = _ClauseWriter(db, "s1")
+    await writer.write([_clause(1), _clause(2)])
+    await writer.write([_clause(2), _clause(3)])
+
+    total = (await db.execute(text("SELECT total_clauses FROM redline_sessions WHERE id = 's1'"))).scalar()
+    assert writer.written == 3
+    assert total == 3
+    assert len(await _clauses(db, "s1")) == 3
+
+
+async def test_store_redline_result_completes_the_session_and_drops_stale_clauses(db):
+    await create_session(db, "s1")
+    await create_session(db, "s2")
+    await _store_redline_result(db, "s1", [_clause(1), _clause(2), _clause(3)], {"total_clauses": 3})
+    await _store_redline_result(db, "s2", [_clause(1)], {"total_clauses": 1})
+
+    # A shorter re-run of s1 replaces its clauses; s2 is untouched.
+    await _store_redline_result(db, "s1", [_clause(1, original="Rerun"), _clause(2)], {"total_clauses": 2})
+
+    clauses = await _clauses(db, "s1")
+    assert [(c["clause_number"], c["original_text"]) for c in clauses] == [(1, "Rerun 1"), (2, "Original 2")]
+    assert len(await _clauses(db, "s2")) == 1
+    session = (await db.execute(text("SELECT * FROM redline_sessions WHERE id = 's1'"))).mappings().one()
+    assert session["status"] == "completed"
+    assert session["total_clauses"] == 2
+    assert session["summary"] == '{"total_clauses": 2}'
+
+
+async def test_store_redline_result_with_no_clauses_clears_the_session(db):
+    await create_session(db, "s1")
+    await _store_redline_result(db, "s1", [_clause(1)], {})
+    await _store_redline_result(db, "s1", [], {})
+
+    assert await _clauses(db, "s1") == []
+
+
+async def test_rerun_resets_review_state_only_for_changed_clauses(db):
+    await create_session(db, "s1")
+    await _store_redline_result(db, "s1", [_clause(1), _clause(2)], {})
+    await db.execute(text(
+        "UPDATE redline_clauses SET status = 'accepted', final_text = 'Agreed', reviewed_by = 'u1', "
+        "reviewed_at = CURRENT_TIMESTAMP WHERE session_id = 's1'"
+    ))
+    await db.commit()
+
+    # Clause 1 is unchanged; the re-run puts a different clause under number 2.
+    await _store_redline_result(db, "s1", [_clause(1), _clause(2, original="Other")], {})
+
+    first, second = await _clauses(db, "s1")
+    assert (first["status"], first["final_text"], first["reviewed_by"]) == ("accepted", "Agreed", "u1")
+    assert (second["status"], second["final_text"], second["reviewed_by"], second["reviewed_at"]) == (
+        "pending", None, None, None
+    )
@@ -0,0 +1,75 @@
+"""The event loop stays free while a slow Claude call is in flight."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.main import app
+from tests.conftest import create_session
+
+HEADERS = {"X-AI-Worker-Secret": "test-secret"}
+
+
+class _SlowMessages:
+    """Stand-in for client.messages whose calls take far longer than the test allows."""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def create(self, **kwargs):
+        self.started.set()
+        await asyncio.sleep(30)
+
+    def stream(self, **kwargs):
+        messages = self
+
+        class _Manager:
+            async def __aenter__(self):
+                messages.started.set()
+                await asyncio.sleep(30)
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        return _Manager()
+
+
+class _SlowClient:
+    def __init__(self):
+        self.messages = _SlowMessages()
+
+
+@pytest.fixture
+def slow_client(monkeypatch):
+    client = _SlowClient()
+    monkeypatch.setattr("app.ai.scheduler.get_client", lambda: client)
+    return client
+
+
+async def test_health_answers_while_a_redline_is_in_flight(db, slow_client):
+    await create_session(db, "s1")
+    body = {
+        "contract_id": "c1",
+        "session_id": "s1",
+        "contract_text": "1. Supply. The Supplier supplies the goods.\n2. Term. One year.",
+        "template_text": "1. Supply. The Supplier supplies the services.\n2. Term. Two years.",
+    }
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+            # Timed from the start of the redline, so a call that blocks the loop (a sync
+            # client, CPU work on the loop) delays /health past the limit.
+            start = time.perf_counter()
+            redline = asyncio.create_task(client.post("/analyze-redline", json=body, headers=HEADERS))
+            try:
+                await asyncio.wait_for(slow_client.messages.started.wait(), timeout=5)
+                response = await asyncio.wait_for(client.get("/health"), timeout=2)
+                assert time.perf_counter() - start < 2
+                assert response.status_code == 200
+                assert response.json()["status"] == "ok"
+                assert not redline.done()
+            finally:
+                redline.cancel()
+                await asyncio.gather(redline, return_exceptions=True)
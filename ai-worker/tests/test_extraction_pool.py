@@ -0,0 +1,62 @@
+"""Extraction pool timeouts: a stuck job does not take its siblings down."""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.extraction import ExtractionPool, ExtractionTimeout
+
+
+def _sleep(seconds: float, marker: str | None = None) -> int:
+    if marker is not None:
+        with open(marker, "a") as f:
+            f.write("run\n")
+    time.sleep(seconds)
+    return os.getpid()
+
+
+@pytest.fixture
+def pool():
+    pools = []
+
+    def make(workers: int, timeout: float) -> ExtractionPool:
+        pools.append(ExtractionPool(workers=workers, queue_size=4, timeout=timeout, max_tasks_per_child=50))
+        return pools[-1]
+
+    yield make
+    for p in pools:
+        p.shutdown()
+
+
+async def test_a_timed_out_job_leaves_running_siblings_alone(pool, tmp_path):
+    extraction = pool(workers=2, timeout=2)
+    # Spawn both workers before timing anything.
+    await asyncio.gather(extraction.run(_sleep, 0.5), extraction.run(_sleep, 0.5))
+    marker = str(tmp_path / "sibling")
+
+    async def sibling():
+        await asyncio.sleep(0.5)
+        return await extraction.run(_sleep, 1, marker)
+
+    stuck = asyncio.create_task(extraction.run(_sleep, 10))
+    sibling_task = asyncio.create_task(sibling())
+    with pytest.raises(ExtractionTimeout):
+        await stuck
+    assert extraction.stats()["stuck"] == 1
+
+    await sibling_task
+    with open(marker) as f:
+        assert f.read().count("run") == 1  # finished on its first run, not a retry after a restart
+
+
+async def test_the_pool_restarts_once_every_worker_is_stuck(pool):
+    extraction = pool(workers=1, timeout=0.5)
+    await extraction.run(_sleep, 0)
+
+    with pytest.raises(ExtractionTimeout):
+        await extraction.run(_sleep, 30)
+
+    assert extraction.stats()["stuck"] == 0
+    assert await asyncio.wait_for(extraction.run(_sleep, 0), timeout=10)
@@ -0,0 +1,71 @@
+"""Job progress reporting is throttled but never loses the latest fields; retries find their job."""
+
+import asyncio
+
+import pytest
+
+from app.jobs import JobPool, JobQueueFull, JobStore, report_progress
+
+
+async def test_progress_writes_are_throttled_and_flushed_on_finish(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path), ttl_seconds=60)
+    pool = JobPool(store, workers=1, queue_size=1, timeout=30)
+    monkeypatch.setattr("app.jobs.job_store", store)
+    saves = 0
+    save = store.save
+
+    def counting_save(job):
+        nonlocal saves
+        saves += 1
+        save(job)
+
+    monkeypatch.setattr(store, "save", counting_save)
+    release = asyncio.Event()
+    observed = {}
+
+    async def run():
+        report_progress(stage="analyzing")
+        for i in range(1, 201):
+            report_progress(clauses_written=i)
+        observed["saves"] = saves
+        observed["progress"] = store.get(job["id"])["progress"]
+        await release.wait()
+        return {"ok": True}
+
+    job, _ = pool.submit("test", run)
+    while "saves" not in observed:
+        await asyncio.sleep(0.01)
+    release.set()
+    while store.get(job["id"])["status"] != "completed":
+        await asyncio.sleep(0.01)
+
+    # queued, running and the stage change; the counts within the interval are held back.
+    assert observed["saves"] == 3
+    assert "clauses_written" not in observed["progress"]
+    assert store.get(job["id"])["progress"] == {"stage": "analyzing", "clauses_written": 200}
+
+
+async def test_idempotent_retry_gets_its_job_while_the_queue_is_full(tmp_path):
+    store = JobStore(str(tmp_path), ttl_seconds=60)
+    pool = JobPool(store, workers=1, queue_size=0, timeout=30)
+    release = asyncio.Event()
+
+    async def run():
+        await release.wait()
+        return {"ok": True}
+
+    job, created = pool.submit("test", run, idempotency_key="abc")
+    assert created
+    retried, created = pool.submit("test", run, idempotency_key="abc")
+    assert (retried["id"], created) == (job["id"], False)
+
+    with pytest.raises(JobQueueFull):
+        pool.submit("test", run, idempotency_key="other")
+    release.set()
+    while store.get(job["id"])["status"] != "completed":
+        await asyncio.sleep(0.01)
+
+    # The rejected submission did not keep its key: a retry once there is room runs.
+    fresh, created = pool.submit("test", run, idempotency_key="other")
+    assert created and fresh["id"] != job["id"]
+    await pool.shutdown()
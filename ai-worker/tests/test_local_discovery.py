@@ -0,0 +1,60 @@
+"""The local discovery pass: party detection and which types it resolves without Claude."""
+
+from app.ai.local_discovery import discover_locally, merge_discoveries
+from app.ai.reference_data import ReferenceData
+
+MIN_CONFIDENCE = 0.85
+
+
+def _data(counterparties: list[dict]) -> ReferenceData:
+    return ReferenceData([], [], [], [], [], counterparties=counterparties)
+
+
+def _counterparties(discoveries: list[dict]) -> dict[str, dict]:
+    return {d["data"]["legal_name"]: d for d in discoveries if d["type"] == "counterparty"}
+
+
+PREAMBLE = (
+    "This Agreement is made between Acme Ltd and Beta Holdings Inc, "
+    "a Delaware corporation (company number 99887766)."
+)
+
+
+def test_an_unknown_party_keeps_counterparty_unresolved():
+    local = discover_locally(PREAMBLE, _data([{"legal_name": "Acme Ltd"}]), MIN_CONFIDENCE)
+
+    found = _counterparties(local.discoveries)
+    assert found["Acme Ltd"]["confidence"] >= MIN_CONFIDENCE
+    assert found["Beta Holdings Inc"]["confidence"] < MIN_CONFIDENCE
+    assert "counterparty" not in local.resolved
+
+
+def test_counterparty_resolves_when_every_party_is_known():
+    data = _data([{"legal_name": "Acme Ltd"}, {"legal_name": "Beta Holdings Inc"}])
+    local = discover_locally(PREAMBLE, data, MIN_CONFIDENCE)
+
+    assert "counterparty" in local.resolved
+    assert set(_counterparties(local.discoveries)) == {"Acme Ltd", "Beta Holdings Inc"}
+
+
+def test_place_descriptors_are_not_parties():
+    text = PREAMBLE + " Gamma GmbH, an English company, joins as guarantor."
+    local = discover_locally(text, _data([]), MIN_CONFIDENCE)
+
+    found = _counterparties(local.discoveries)
+    assert set(found) == {"Acme Ltd", "Beta Holdings Inc", "Gamma GmbH"}
+    assert found["Beta Holdings Inc"]["data"]["registration_number"] == "99887766"
+    assert "registration_number" not in found["Acme Ltd"]["data"]
+
+
+def test_merge_keeps_claudes_record_for_an_unknown_party():
+    local = discover_locally(PREAMBLE, _data([{"legal_name": "Acme Ltd"}]), MIN_CONFIDENCE)
+    claude = [{
+        "type": "counterparty",
+        "confidence": 0.9,
+        "data": {"legal_name": "Beta Holdings Inc", "jurisdiction": "Delaware", "registration_number": "99887766"},
+    }]
+
+    merged = _counterparties(merge_discoveries(local, claude))
+    assert set(merged) == {"Acme Ltd", "Beta Holdings Inc"}
+    assert merged["Beta Holdings Inc"]["data"]["jurisdiction"] == "Delaware"
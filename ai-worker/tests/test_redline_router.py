@@ -0,0 +1,29 @@
+"""/analyze-redline error mapping for contracts referenced on Laravel storage."""
+
+import httpx
+import pytest
+from sqlalchemy import text
+
+from app.main import app
+from tests.conftest import create_session
+
+HEADERS = {"X-AI-Worker-Secret": "test-secret"}
+
+
+@pytest.mark.parametrize(
+    ("storage", "status"),
+    [
+        ({"disk": "local", "path": "contracts/missing.pdf"}, 404),
+        ({"disk": "no-such-disk", "path": "contracts/c1.pdf"}, 400),
+    ],
+)
+async def test_storage_errors_map_to_client_errors(db, storage, status):
+    await create_session(db, "s1")
+    body = {"contract_id": "c1", "session_id": "s1", "contract_file": storage, "template_text": "1. Term."}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+        response = await client.post("/analyze-redline", json=body, headers=HEADERS)
+
+    assert response.status_code == status
+    session_status = (await db.execute(text("SELECT status FROM redline_sessions WHERE id = 's1'"))).scalar()
+    assert session_status == "failed"
@@ -0,0 +1,67 @@
+"""Durable result-cache tiers: the ai_result_cache table (on SQLite) and the disk store."""
+
+import os
+import time
+
+from sqlalchemy import text
+
+from app.ai.result_cache import MySQLResultStore, ResultCache
+from app.ai.schemas import AnalysisUsage
+from app.cache import DiskStore
+
+
+async def test_table_store_upserts_and_reads_back(db):
+    store = MySQLResultStore(ttl_seconds=3600, max_entries=100)
+    await store.put("k1", b'{"v": 1}')
+    await store.put("k1", b'{"v": 2}')
+
+    assert await store.get("k1") == b'{"v": 2}'
+    assert await store.get("missing") is None
+    row = (await db.execute(text("SELECT COUNT(*), MAX(hit_count) FROM ai_result_cache"))).one()
+    assert tuple(row) == (1, 1)
+
+
+async def test_table_store_trims_least_recently_used_rows(db):
+    store = MySQLResultStore(ttl_seconds=3600, max_entries=3)
+    for i in range(49):
+        await store.put(f"k{i}", b"{}")
+    await store.get("k0")
+    await store.put("k49", b"{}")  # every 50th write trims
+
+    keys = {row[0] for row in await db.execute(text("SELECT cache_key FROM ai_result_cache"))}
+    assert keys == {"k0", "k48", "k49"}
+
+
+async def test_result_cache_survives_a_cold_memory_tier(db_schema):
+    writer = ResultCache("mysql", ttl_seconds=3600, memory_bytes=1_000_000)
+    await writer.put("key", {"summary": "ok"}, AnalysisUsage(model_used="m"))
+
+    reader = ResultCache("mysql", ttl_seconds=3600, memory_bytes=1_000_000)
+    result, usage = await reader.get("key")
+    assert result == {"summary": "ok"}
+    assert usage.cache_hit
+
+
+def test_disk_store_with_ttl_evicts_least_recently_used(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=250, ttl_seconds=3600)
+    for i, key in enumerate(("a", "b")):
+        store.put(key, b"x" * 100)
+        past = time.time() - 100 + i
+        os.utime(tmp_path / key, (past, past))
+    mtime = os.path.getmtime(tmp_path / "a")
+
+    assert store.get("a") == b"x" * 100
+    store.put("c", b"x" * 100)  # over the bound: the least recently used ("b") goes
+
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert os.path.getmtime(tmp_path / "a") == mtime  # the TTL still runs from the write
+
+
+def test_disk_store_expires_by_write_time(tmp_path):
+    store = DiskStore(str(tmp_path), max_bytes=1000, ttl_seconds=10)
+    store.put("a", b"x")
+    old = time.time() - 60
+    os.utime(tmp_path / "a", (time.time(), old))
+
+    assert store.get("a") is None
+    assert not (tmp_path / "a").exists()
@@ -0,0 +1,64 @@
+"""Claude calls are held to the request deadline even when it runs out in the queue."""
+
+import asyncio
+
+import pytest
+
+from app.ai import scheduler as scheduler_module
+from app.ai.budget import BudgetExhausted, start_budget
+from app.ai.scheduler import create_message, stream_message
+
+REQUEST = {"model": "claude-sonnet-4-6", "max_tokens": 16, "messages": [{"role": "user", "content": "hi"}]}
+
+
+class _RecordingMessages:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append("create")
+
+    def stream(self, **kwargs):
+        messages = self
+
+        class _Manager:
+            async def __aenter__(self):
+                messages.calls.append("stream")
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        return _Manager()
+
+
+@pytest.fixture
+def messages(monkeypatch):
+    messages = _RecordingMessages()
+    client = type("Client", (), {"messages": messages})()
+    monkeypatch.setattr(scheduler_module, "get_client", lambda: client)
+
+    async def acquire_until_past_the_deadline(tokens, priority):
+        await asyncio.sleep(0.2)
+
+    monkeypatch.setattr(scheduler_module.scheduler, "acquire", acquire_until_past_the_deadline)
+    monkeypatch.setattr(scheduler_module.scheduler, "release", lambda reserved, used: None)
+    return messages
+
+
+async def test_create_message_is_not_sent_once_the_deadline_passed_in_the_queue(messages):
+    start_budget(0.1)
+    with pytest.raises(BudgetExhausted) as raised:
+        await create_message(**REQUEST)
+
+    assert raised.value.kind == "deadline"
+    assert messages.calls == []
+
+
+async def test_stream_message_is_not_opened_once_the_deadline_passed_in_the_queue(messages):
+    start_budget(0.1)
+    with pytest.raises(BudgetExhausted) as raised:
+        async with stream_message(**REQUEST):
+            pass
+
+    assert raised.value.kind == "deadline"
+    assert messages.calls == []
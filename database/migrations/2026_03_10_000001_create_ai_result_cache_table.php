@@ -0,0 +1,29 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    /**
+     * Durable tier of the AI worker's analysis result cache (ai-worker/app/ai/result_cache.py).
+     * Written and evicted by the worker only.
+     */
+    public function up(): void
+    {
+        Schema::create('ai_result_cache', function (Blueprint $table) {
+            $table->char('cache_key', 64)->primary();
+            $table->longText('payload');
+            $table->unsignedInteger('hit_count')->default(0);
+            $table->timestamp('expires_at')->index();
+            $table->timestamp('last_used_at')->index();
+            $table->timestamp('created_at')->nullable();
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::dropIfExists('ai_result_cache');
+    }
+};
@@ -0,0 +1,34 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\DB;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration {
+    public function up(): void
+    {
+        // The AI worker upserts clauses on (session_id, clause_number) so a retried
+        // redline does not duplicate rows. Drop duplicates left by earlier retries first.
+        if (DB::getDriverName() === 'mysql') {
+            DB::statement("
+                DELETE c1 FROM redline_clauses c1
+                JOIN redline_clauses c2
+                    ON c1.session_id = c2.session_id
+                    AND c1.clause_number = c2.clause_number
+                    AND c1.id > c2.id
+            ");
+        }
+
+        Schema::table('redline_clauses', function (Blueprint $table) {
+            $table->unique(['session_id', 'clause_number']);
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('redline_clauses', function (Blueprint $table) {
+            $table->dropUnique(['session_id', 'clause_number']);
+        });
+    }
+};